@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Measure sender throughput offline against mock_provider_server.py
+Generates a synthetic guest list, sends it through the same ChannelRouter and
+transports used by send_cards_twilio.py, and reports messages/second,
+p50/p99 provider latency and retry counts.
+
+Usage:
+  python3 benchmark_senders.py --guests 500 --channel sms --sms-rate 50 --sms-concurrency 8
+  python3 benchmark_senders.py --guests 500 --latency-ms 200 --error-rate 0.05 --throttle-rps 40
+"""
+import json
+import math
+import random
+import time
+
+from mock_provider_server import ProviderBehaviour, start_server
+from retry_scheduler import RetryScheduler
+from transports import (ChannelRouter, WhatsAppTransport, SmsTransport, WHATSAPP, SMS, TWILIO_AVAILABLE,
+                        DEFAULT_MAX_CONCURRENCY)
+
+def synthetic_guests(count, seed=None):
+    """Fake guests with unique codes and Tanzanian mobile numbers"""
+    rng = random.Random(seed)
+    codes = rng.sample(range(100000), count)
+    return [{
+        'name': f"Guest {i + 1}",
+        'type': rng.choice(['Single', 'Double']),
+        'phone': f"+2557{rng.randrange(10**8):08d}",
+        'code': f"{code:05d}"
+    } for i, code in enumerate(codes)]
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+def run_benchmark(guests, base_url, channel=WHATSAPP, fallback=SMS, whatsapp_rate=0, whatsapp_concurrency=4,
+                  sms_rate=0, sms_concurrency=4, max_attempts=4, base_delay=2.0, senders=1,
+                  adaptive=False, max_concurrency=DEFAULT_MAX_CONCURRENCY, sms_batch_size=1,
+                  sms_text="Benchmark invitation {code}"):
+    """Send guests through the router against base_url; returns a results dict"""
+    transports = {}
+    if channel == WHATSAPP:
+        from_numbers = [f"whatsapp:+1000000{i:04d}" for i in range(senders)]
+        transports[WHATSAPP] = WhatsAppTransport('ACbenchmark', 'benchmark', from_numbers,
+                                                 api_base_url=base_url, rate=whatsapp_rate,
+                                                 concurrency=whatsapp_concurrency * senders,
+                                                 adaptive=adaptive, max_concurrency=max_concurrency * senders)
+    if channel == SMS or fallback == SMS:
+        transports[SMS] = SmsTransport('benchmark', 'benchmark', sms_text,
+                                       api_url=f"{base_url}/api.php", rate=sms_rate, concurrency=sms_concurrency,
+                                       adaptive=adaptive, max_concurrency=max_concurrency, batch_size=sms_batch_size)
+
+    events = {}
+
+    def on_event(event, guest, channel, attempt, result):
+        events[event] = events.get(event, 0) + 1
+
+    router = ChannelRouter(transports, primary=channel, fallback=fallback,
+                           scheduler=RetryScheduler(max_attempts=max_attempts, base_delay=base_delay),
+                           on_event=on_event)
+    start = time.monotonic()
+    delivered, failures = router.run(guests)
+    elapsed = time.monotonic() - start
+
+    channels = {}
+    for name, transport in transports.items():
+        latencies = transport.latencies
+        channels[name] = {
+            'requests': transport.requests,
+            'delivered': sum(1 for d in delivered if d['channel'] == name),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        }
+        if transport.controller:
+            channels[name]['concurrency'] = transport.controller.stats()
+        if getattr(transport, 'batcher', None):
+            # Several guests per HTTP request
+            channels[name]['requests'] = transport.batcher.requests
+
+    return {
+        'guests': len(guests),
+        'delivered': len(delivered),
+        'failed': len(failures),
+        'retries': router.scheduler.retries,
+        'fallbacks': events.get('fallback', 0),
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(len(delivered) / elapsed, 2) if elapsed else 0.0,
+        'channels': channels,
+    }
+
+def print_results(results):
+    print("\n" + "="*60)
+    print("BENCHMARK RESULTS")
+    print("="*60)
+    print(f"Guests:          {results['guests']}")
+    print(f"Delivered:       {results['delivered']}")
+    print(f"Failed:          {results['failed']}")
+    print(f"Retries:         {results['retries']}")
+    print(f"Fallbacks:       {results['fallbacks']}")
+    print(f"Wall clock:      {results['seconds']:.2f}s")
+    print(f"Throughput:      {results['messages_per_second']:.2f} msg/s")
+    for name, stats in results['channels'].items():
+        print(f"\n  {name}: {stats['requests']} requests, {stats['delivered']} delivered")
+        print(f"    latency p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+        if 'concurrency' in stats:
+            window = stats['concurrency']
+            print(f"    window {window['window']} (peak {window['peak']}), "
+                  f"{window['increases']} increases, {window['decreases']} decreases")
+    print("="*60)
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the senders against a local mock provider')
+    parser.add_argument('--guests', type=int, default=200, help='Synthetic guests to send to (default: 200)')
+    parser.add_argument('--channel', choices=[WHATSAPP, SMS], default=WHATSAPP, help='Primary channel')
+    parser.add_argument('--no-fallback', action='store_true', help='Disable WhatsApp to SMS fallback')
+    parser.add_argument('--senders', type=int, default=1, help='WhatsApp sender numbers in the pool (default: 1)')
+    parser.add_argument('--whatsapp-rate', type=float, default=0,
+                        help='WhatsApp msg/s limit per sender number (default: unlimited)')
+    parser.add_argument('--whatsapp-concurrency', type=int, default=4, help='WhatsApp requests in flight per sender number')
+    parser.add_argument('--sms-rate', type=float, default=0, help='SMS msg/s limit (default: unlimited)')
+    parser.add_argument('--sms-concurrency', type=int, default=4, help='SMS requests in flight')
+    parser.add_argument('--sms-batch-size', type=int, default=1, help='Recipients per SMS request (default: 1)')
+    parser.add_argument('--sms-text', default="Benchmark invitation {code}",
+                        help='SMS text; leave out {code} to send everyone the same text (for batching)')
+    parser.add_argument('--adaptive', action='store_true', help='Adjust requests in flight from latency and 429s')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f'Adaptive window ceiling (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--max-attempts', type=int, default=4, help='Attempts per guest per channel')
+    parser.add_argument('--base-delay', type=float, default=2.0, help='First retry backoff in seconds')
+    parser.add_argument('--url', help='Use an already running mock server instead of starting one')
+    parser.add_argument('--latency-ms', type=float, default=100.0, help='Mock mean latency')
+    parser.add_argument('--latency-jitter-ms', type=float, default=30.0, help='Mock latency std deviation')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Mock transient error rate')
+    parser.add_argument('--permanent-error-rate', type=float, default=0.0, help='Mock permanent error rate')
+    parser.add_argument('--throttle-rps', type=float, default=0.0, help='Mock 429 threshold (requests/second)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    if args.channel == WHATSAPP and not TWILIO_AVAILABLE:
+        print("Error: the WhatsApp channel needs the Twilio library (pip install twilio).")
+        print("Use --channel sms to benchmark the SMS sender only.")
+        return
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        behaviour = ProviderBehaviour(args.latency_ms, args.latency_jitter_ms, args.error_rate,
+                                      args.permanent_error_rate, args.throttle_rps, seed=args.seed)
+        server, base_url = start_server(behaviour)
+        print(f"Started mock provider on {base_url}")
+
+    guests = synthetic_guests(args.guests, seed=args.seed)
+    print(f"Sending to {len(guests)} synthetic guests via {args.channel}...")
+    try:
+        results = run_benchmark(guests, base_url, channel=args.channel,
+                                fallback=None if args.no_fallback else SMS,
+                                whatsapp_rate=args.whatsapp_rate, whatsapp_concurrency=args.whatsapp_concurrency,
+                                sms_rate=args.sms_rate, sms_concurrency=args.sms_concurrency,
+                                max_attempts=args.max_attempts, base_delay=args.base_delay, senders=args.senders,
+                                adaptive=args.adaptive, max_concurrency=args.max_concurrency,
+                                sms_batch_size=args.sms_batch_size, sms_text=args.sms_text)
+    finally:
+        if server:
+            server.shutdown()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Campaign scheduling for send_cards_twilio.py
+Restricts sending to a daily window in the guests' time zone, paces messages
+evenly across the window or at a target rate, sends VIPs first, and records
+every delivered code so a restarted campaign carries on where it stopped.
+"""
+import json
+import os
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+from guest_normalize import normalize_code
+from retry_scheduler import UNKNOWN
+from outbox import IN_DOUBT
+
+# Guests are in Tanzania
+CAMPAIGN_TIMEZONE = "Africa/Dar_es_Salaam"
+
+# Delivered codes of a named campaign
+PROGRESS_FILE = "campaign_{name}_progress.jsonl"
+
+class SendWindow:
+    """Daily local time window in which messages may go out, e.g. 09:00-20:00"""
+
+    def __init__(self, start, end, timezone=CAMPAIGN_TIMEZONE):
+        self.start = start
+        self.end = end
+        self.tz = ZoneInfo(timezone)
+        if start == end:
+            raise ValueError("Send window start and end must differ")
+
+    @classmethod
+    def parse(cls, value, timezone=CAMPAIGN_TIMEZONE):
+        """Parse 'HH:MM-HH:MM' (a window may run past midnight, e.g. 22:00-02:00)"""
+        try:
+            start, end = value.split('-')
+            return cls(dtime.fromisoformat(start.strip()), dtime.fromisoformat(end.strip()), timezone)
+        except ValueError:
+            raise ValueError(f"Invalid send window '{value}', expected HH:MM-HH:MM")
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    def is_open(self, when):
+        t = when.astimezone(self.tz).time()
+        if self.start < self.end:
+            return self.start <= t < self.end
+        return t >= self.start or t < self.end
+
+    def next_open(self, when):
+        """`when` if the window is open then, otherwise the next opening"""
+        when = when.astimezone(self.tz)
+        if self.is_open(when):
+            return when
+        opening = datetime.combine(when.date(), self.start, tzinfo=self.tz)
+        if opening <= when:
+            opening += timedelta(days=1)
+        return opening
+
+    def closes_at(self, when):
+        """End of the window that is open at `when`"""
+        when = when.astimezone(self.tz)
+        closing = datetime.combine(when.date(), self.end, tzinfo=self.tz)
+        if closing <= when:
+            closing += timedelta(days=1)
+        return closing
+
+    def seconds_until_open(self, when=None):
+        """0 while open, otherwise seconds until the next opening"""
+        when = when or self.now()
+        return max(0.0, (self.next_open(when) - when).total_seconds())
+
+    def __str__(self):
+        return f"{self.start:%H:%M}-{self.end:%H:%M} {self.tz.key}"
+
+def load_vip_codes(path):
+    """Codes (or names) of VIP guests, one per line; # starts a comment"""
+    vips = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                code, valid = normalize_code(line)
+                vips.add(code if valid else line.lower())
+    return vips
+
+def order_by_priority(guests, vips):
+    """VIP guests first, everyone else after, each group in spreadsheet order"""
+    def is_vip(guest):
+        return guest['code'] in vips or guest['name'].strip().lower() in vips
+    return sorted(guests, key=lambda guest: 0 if is_vip(guest) else 1)
+
+def plan_send_times(count, window=None, rate=None, spread=False, now=None):
+    """Wall-clock time for each of `count` messages
+
+    With `spread` the messages are spaced evenly over what is left of the
+    current (or next) window; `rate` (messages per second) caps the pace.
+    Messages that do not fit in a window continue in the next one.
+    """
+    now = now or (window.now() if window else datetime.now().astimezone())
+    interval = 1.0 / rate if rate else 0.0
+    if spread and window and count:
+        start = window.next_open(now)
+        interval = max(interval, (window.closes_at(start) - start).total_seconds() / count)
+
+    times = []
+    t = window.next_open(now) if window else now
+    for _ in range(count):
+        times.append(t)
+        t += timedelta(seconds=interval)
+        if window:
+            t = window.next_open(t)
+    return times
+
+def plan_delays(guests, window=None, rate=None, spread=False, now=None):
+    """Seconds to hold back each guest, by code, for ChannelRouter.run"""
+    now = now or (window.now() if window else datetime.now().astimezone())
+    times = plan_send_times(len(guests), window, rate, spread, now)
+    return {guest['code']: max(0.0, (t - now).total_seconds()) for guest, t in zip(guests, times)}
+
+class CampaignProgress:
+    """Append-only record of delivered codes, so a restarted campaign skips them
+
+    Guests whose send had an unknown outcome (retry_scheduler.UNKNOWN) are
+    recorded as in doubt and skipped as well, rather than messaged twice.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.delivered = {}
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line.decode('utf-8'))
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        # A line cut short by a crash, possibly inside a character
+                        continue
+                    self.delivered[entry['code']] = entry
+        self._file = None
+
+    def __contains__(self, code):
+        return code in self.delivered
+
+    def __len__(self):
+        return len(self.delivered)
+
+    def sending(self, code, channel):
+        """Called before each send; returning False cancels it"""
+        return True
+
+    def failed(self, code, channel, error, classification=None):
+        """Called when a guest could not be reached (failures are not recorded, a restart retries them)"""
+        if classification == UNKNOWN:
+            self._append({'code': code, 'channel': channel, 'status': IN_DOUBT, 'error': error,
+                          'timestamp': datetime.now().isoformat()})
+
+    def in_doubt(self):
+        """Codes whose message may or may not have gone out"""
+        return [code for code, entry in self.delivered.items() if entry.get('status') == IN_DOUBT]
+
+    def record(self, code, channel, message_id=None):
+        self._append({
+            'code': code,
+            'channel': channel,
+            'message_id': message_id,
+            'timestamp': datetime.now().isoformat(),
+        })
+
+    def _append(self, entry):
+        self.delivered[entry['code']] = entry
+        if self._file is None:
+            # Binary, so the last byte can be checked (text-mode offsets are opaque and
+            # one byte back may fall inside a multibyte character)
+            self._file = open(self.path, 'ab+')
+            # Start on a fresh line if the last run died mid-write
+            if self._file.seek(0, os.SEEK_END):
+                self._file.seek(-1, os.SEEK_END)
+                if self._file.read(1) != b'\n':
+                    self._file.write(b'\n')
+        # One line per delivery, flushed at once so a crash loses nothing
+        self._file.write((json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'))
+        self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Content-addressed store of the rendered cards
+A card is stored once under its sha256, in directories sharded by the first
+hash characters (cards/objects/3e/3ed7bb85....png), and each guest code has a
+stable alias pointing at its current card (cards/png/02/02224.png, sharded by
+the first digits of the code). nginx serves /png/{code}.png from the aliases,
+renaming a guest leaves nothing behind, identical cards share one file, and
+objects no alias points to are removed by garbage collection.
+
+Usage:
+  python3 card_store.py                # Show the store's size
+  python3 card_store.py --import       # Move cards/<name>_<code>/<code>.png folders into the store
+  python3 card_store.py --gc           # Delete cards no code points to any more
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from guest_snapshot import file_hash
+
+STORE_DIR = 'cards'
+OBJECTS_DIR = 'objects'
+ALIASES_DIR = 'png'
+# Characters of the hash (objects) or code (aliases) naming the shard directory
+SHARD_CHARS = 2
+CARD_EXT = '.png'
+# Files younger than this may belong to a render that is still running
+GC_GRACE_SECONDS = 3600
+
+def object_path(digest, store_dir=STORE_DIR):
+    """cards/objects/{digest[:2]}/{digest}.png"""
+    return os.path.join(store_dir, OBJECTS_DIR, digest[:SHARD_CHARS], digest + CARD_EXT)
+
+def alias_path(code, store_dir=STORE_DIR):
+    """cards/png/{code[:2]}/{code}.png"""
+    return os.path.join(store_dir, ALIASES_DIR, code[:SHARD_CHARS], code + CARD_EXT)
+
+def object_digest(path):
+    """The sha256 a store object is named after, or None for a file outside the store"""
+    digest, ext = os.path.splitext(os.path.basename(path))
+    parent = os.path.dirname(path)
+    if (ext == CARD_EXT and len(digest) == 64 and os.path.basename(parent) == digest[:SHARD_CHARS]
+            and os.path.basename(os.path.dirname(parent)) == OBJECTS_DIR):
+        return digest
+    return None
+
+def new_object_file(store_dir=STORE_DIR):
+    """A temporary path inside the store to render a card to before put_object()"""
+    tmp_dir = os.path.join(store_dir, OBJECTS_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=CARD_EXT, prefix='.tmp-', dir=tmp_dir)
+    os.close(fd)
+    return path
+
+def put_object(src_path, store_dir=STORE_DIR):
+    """Move a file into the store under its hash; returns the object path
+
+    A card that is already stored is not written again.
+    """
+    path = object_path(file_hash(src_path), store_dir)
+    if os.path.exists(path):
+        os.remove(src_path)
+        # Freshly used again: keep it from a garbage collection running before its alias is linked
+        os.utime(path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src_path, path)
+    return path
+
+def link_alias(code, path, store_dir=STORE_DIR):
+    """Point a code's alias at a store object, replacing the previous one atomically"""
+    alias = alias_path(code, store_dir)
+    os.makedirs(os.path.dirname(alias), exist_ok=True)
+    tmp_alias = alias + '.tmp'
+    if os.path.lexists(tmp_alias):
+        os.remove(tmp_alias)
+    try:
+        # Relative, so the store can be copied or synced as a whole
+        os.symlink(os.path.relpath(path, os.path.dirname(alias)), tmp_alias)
+    except OSError:
+        # No symlinks (e.g. Windows without developer mode)
+        os.link(path, tmp_alias)
+    os.replace(tmp_alias, alias)
+    return alias
+
+def resolve(code, store_dir=STORE_DIR):
+    """Store object of a code's card, or None"""
+    alias = alias_path(code, store_dir)
+    if not os.path.exists(alias):
+        return None
+    if os.path.islink(alias):
+        return os.path.normpath(os.path.join(os.path.dirname(alias), os.readlink(alias)))
+    return alias
+
+def remove_alias(code, store_dir=STORE_DIR):
+    """Drop a code's alias; its card goes at the next garbage collection"""
+    alias = alias_path(code, store_dir)
+    if os.path.lexists(alias):
+        os.remove(alias)
+
+def iter_aliases(store_dir=STORE_DIR):
+    """{code: alias path} of every card in the store"""
+    aliases = {}
+    root = os.path.join(store_dir, ALIASES_DIR)
+    if not os.path.isdir(root):
+        return aliases
+    for shard in os.listdir(root):
+        shard_dir = os.path.join(root, shard)
+        if not os.path.isdir(shard_dir):
+            continue
+        for filename in os.listdir(shard_dir):
+            code, ext = os.path.splitext(filename)
+            if ext == CARD_EXT:
+                aliases[code] = os.path.join(shard_dir, filename)
+    return aliases
+
+def _iter_objects(store_dir=STORE_DIR, include_tmp=False):
+    root = os.path.join(store_dir, OBJECTS_DIR)
+    if not os.path.isdir(root):
+        return
+    for entry in os.scandir(root):
+        if entry.is_dir():
+            for obj in os.scandir(entry.path):
+                yield obj.path
+        elif include_tmp and entry.name.startswith('.tmp-'):
+            yield entry.path
+
+def collect_garbage(store_dir=STORE_DIR, older_than=None):
+    """Delete objects no alias points to (and leftover temporary files); returns (files, bytes) removed
+
+    Only files last modified before `older_than` (a timestamp, by default
+    GC_GRACE_SECONDS ago) are deleted, so cards another run is still
+    rendering or about to link survive.
+    """
+    if older_than is None:
+        older_than = time.time() - GC_GRACE_SECONDS
+    # Compared by inode, which covers symlinked and hard-linked aliases alike
+    referenced = set()
+    for alias in iter_aliases(store_dir).values():
+        try:
+            stat = os.stat(alias)
+        except OSError:
+            continue
+        referenced.add((stat.st_dev, stat.st_ino))
+    removed = freed = 0
+    for path in _iter_objects(store_dir, include_tmp=True):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            # Moved into place or removed by another run meanwhile
+            continue
+        if (stat.st_dev, stat.st_ino) not in referenced and stat.st_mtime < older_than:
+            os.remove(path)
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+def import_folders(store_dir=STORE_DIR, current=None):
+    """Move cards from the old cards/<name>_<code>/<code>.png folders into the store; returns the codes
+
+    A code with several folders (left behind by renames) keeps the one named
+    current[code], or else the newest card; the other folders are deleted.
+    """
+    current = current or {}
+    folders = {}
+    for folder in sorted(os.listdir(store_dir)):
+        code = folder.rsplit('_', 1)[-1]
+        card = os.path.join(store_dir, folder, code + CARD_EXT)
+        if folder not in (OBJECTS_DIR, ALIASES_DIR) and os.path.isfile(card):
+            folders.setdefault(code, []).append(folder)
+
+    for code, names in folders.items():
+        keep = max(names, key=lambda folder: (folder == current.get(code),
+                                              os.path.getmtime(os.path.join(store_dir, folder, code + CARD_EXT))))
+        link_alias(code, put_object(os.path.join(store_dir, keep, code + CARD_EXT), store_dir), store_dir)
+        for folder in names:
+            folder_path = os.path.join(store_dir, folder)
+            if folder == keep and os.listdir(folder_path):
+                continue
+            shutil.rmtree(folder_path)
+    return sorted(folders)
+
+def main():
+    """Main function"""
+    import argparse
+    import zipfile
+    import xml.etree.ElementTree as ET
+    from ods_reader import GUEST_SHEET
+    from guest_snapshot import load_guest_rows
+    from guest_normalize import normalize_guests, sanitize_folder_name
+
+    parser = argparse.ArgumentParser(description='Content-addressed store of the rendered cards')
+    parser.add_argument('--store', default=STORE_DIR, help=f'Store directory (default: {STORE_DIR})')
+    parser.add_argument('--import', dest='import_folders', action='store_true',
+                        help='Move the cards of the old per-guest folders into the store')
+    parser.add_argument('--gc', action='store_true', help='Delete cards no code points to any more')
+    args = parser.parse_args()
+
+    if args.import_folders:
+        # The folders were named {sanitized name}_{code}
+        try:
+            guests, _ = normalize_guests(load_guest_rows(GUEST_SHEET))
+            current = {guest['code']: f"{sanitize_folder_name(guest['name'])}_{guest['code']}" for guest in guests}
+        except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+            print(f"⚠️  Could not read {GUEST_SHEET} ({e}), keeping the newest card of each code")
+            current = None
+        codes = import_folders(args.store, current)
+        print(f"✓ Imported {len(codes)} cards")
+    if args.gc:
+        removed, freed = collect_garbage(args.store)
+        print(f"✓ Removed {removed} unused cards ({freed / 1024 / 1024:.1f} MB)")
+
+    aliases = iter_aliases(args.store)
+    objects = list(_iter_objects(args.store))
+    size = sum(os.path.getsize(path) for path in objects)
+    print(f"{len(aliases)} codes, {len(objects)} cards ({size / 1024 / 1024:.1f} MB) in {args.store}/")
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,8 @@ Generate all wedding invitation cards from the spreadsheet
 """
 import sys
 import os
+import zipfile
+import xml.etree.ElementTree as ET
 
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -21,6 +23,11 @@ except ImportError:
     print("Warning: qrcode not available. Will create placeholder QR codes.")
     print("Install with: pip install qrcode[pil]")
 
+from ods_reader import GUEST_SHEET
+from guest_snapshot import load_guest_rows
+from guest_normalize import normalize_guests
+from card_store import new_object_file, put_object, link_alias
+
 # Function to generate a single card
 def generate_card(name, single_double, code, output_path):
     """Generate a single invitation card"""
@@ -156,50 +163,11 @@ def generate_card(name, single_double, code, output_path):
 
 # Read ODS file
 try:
-    import pandas as pd
-    df = pd.read_excel('wedding_invites.ods', engine='odf')
-    print(f"Loaded {len(df)} rows from spreadsheet")
-except ImportError:
-    # Try to parse ODS XML directly
-    try:
-        import xml.etree.ElementTree as ET
-        import zipfile
-        
-        with zipfile.ZipFile('wedding_invites.ods', 'r') as z:
-            content = z.read('content.xml')
-        root = ET.fromstring(content)
-        ns = {'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
-              'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'}
-        
-        rows = root.findall('.//table:table-row', ns)
-        data = []
-        for row in rows:
-            cells = row.findall('.//table:table-cell', ns)
-            if len(cells) >= 4:
-                name_elem = cells[0].find('.//text:p', ns)
-                type_elem = cells[1].find('.//text:p', ns)
-                code_elem = cells[3].find('.//text:p', ns)
-                if name_elem is not None and name_elem.text and code_elem is not None and code_elem.text:
-                    name = name_elem.text.replace('&amp;', '&')
-                    single_double = type_elem.text if type_elem is not None and type_elem.text else "Single"
-                    code = code_elem.text if code_elem is not None and code_elem.text else None
-                    if code:
-                        data.append({'name': name, 'type': single_double, 'code': code})
-        
-        # Create a simple dataframe-like structure
-        class SimpleDF:
-            def __init__(self, data):
-                self.data = data
-            def __iter__(self):
-                return iter(self.data)
-            def __len__(self):
-                return len(self.data)
-        
-        df = SimpleDF(data)
-        print(f"Loaded {len(df)} rows from spreadsheet")
-    except Exception as e:
-        print(f"Could not read spreadsheet: {e}")
-        sys.exit(1)
+    rows = load_guest_rows(GUEST_SHEET)
+    print(f"Loaded {len(rows)} rows from spreadsheet")
+except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+    print(f"Could not read spreadsheet: {e}")
+    sys.exit(1)
 
 # Create cards directory
 os.makedirs('cards', exist_ok=True)
@@ -208,25 +176,24 @@ os.makedirs('cards', exist_ok=True)
 success_count = 0
 error_count = 0
 
-for row in df:
-    if hasattr(row, 'iloc'):
-        # pandas DataFrame row
-        name = str(row.iloc[0]) if pd.notna(row.iloc[0]) else None
-        single_double = str(row.iloc[1]) if pd.notna(row.iloc[1]) else "Single"
-        code = str(row.iloc[3]) if pd.notna(row.iloc[3]) else None
-    else:
-        # Simple dict-like structure
-        name = row.get('name')
-        single_double = row.get('type', 'Single')
-        code = row.get('code')
-    
-    if not name or not code or name == 'nan' or code == 'nan':
+# Codes padded to 5 digits (leading zeros are lost when stored as a number)
+guests, _ = normalize_guests(rows)
+
+for guest in guests:
+    name = guest['name']
+    single_double = guest['type']
+    code = guest['code']
+    if code is None:
+        error_count += 1
+        print(f"Error: {name} has no code")
         continue
     
-    output_path = f'cards/{code}.png'
+    # Render into the card store, then point the code's alias (cards/png/) at the card
+    output_path = new_object_file()
     
     try:
         if generate_card(name, single_double, code, output_path):
+            link_alias(code, put_object(output_path))
             success_count += 1
             if success_count % 10 == 0:
                 print(f"Generated {success_count} cards...")
@@ -236,6 +203,9 @@ for row in df:
     except Exception as e:
         error_count += 1
         print(f"Error generating card for {name} (code: {code}): {e}")
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
 
 print(f"\nDone! Generated {success_count} cards successfully.")
 if error_count > 0:
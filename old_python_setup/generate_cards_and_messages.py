@@ -1,11 +1,15 @@
 #!/usr/bin/env python3
 """
 Generate wedding invitation cards and messages from the spreadsheet
-Creates subfolders for each invitee with their card and message
+Stores each invitee's card in the content-addressed card store (cards/png/{code}
+aliases, see card_store.py), and writes every invitee's messages to the message
+manifest (cards/manifest.jsonl)
 """
 import sys
 import os
-import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
 
 try:
     from PIL import Image, ImageDraw, ImageFont
@@ -23,77 +27,89 @@ except ImportError:
     print("Warning: qrcode not available. Will create placeholder QR codes.")
     print("Install with: pip install qrcode[pil]")
 
-# Read message templates from files
-def load_message_templates():
-    """Load message templates from files"""
-    templates = {}
-    try:
-        with open('message_whatsapp.txt', 'r', encoding='utf-8') as f:
-            templates['whatsapp'] = f.read().strip()
-    except FileNotFoundError:
-        print("Warning: message_whatsapp.txt not found, using default")
-        templates['whatsapp'] = "Mwaliko wa harusi ya George Laurent Sechu & Violet Titus Macha. Namba ya mwaliko *{code}*"
-    
-    try:
-        with open('message_sms.txt', 'r', encoding='utf-8') as f:
-            templates['sms'] = f.read().strip()
-    except FileNotFoundError:
-        print("Warning: message_sms.txt not found, using default")
-        templates['sms'] = "Mwaliko wa harusi ya George Laurent Sechu & Violet Titus Macha. Namba ya mwaliko {code}"
-    
-    return templates
-
-def sanitize_folder_name(name):
-    """Sanitize name for use in folder name"""
-    # Remove special characters, keep only alphanumeric, spaces, and common punctuation
-    name = re.sub(r'[^\w\s\-&.]', '', name)
-    # Replace spaces and special chars with underscores
-    name = re.sub(r'[\s&.]+', '_', name)
-    # Remove multiple underscores
-    name = re.sub(r'_+', '_', name)
-    # Remove leading/trailing underscores
-    name = name.strip('_')
-    return name
+from media_variants import make_whatsapp_variant, variant_path, VARIANTS_DIR
+from ods_reader import GUEST_SHEET
+from guest_snapshot import load_guest_rows
+from guest_normalize import normalize_guests, normalize_code
+from card_store import new_object_file, put_object, link_alias, resolve, remove_alias, iter_aliases, collect_garbage
+from watch import file_state, watch_files
+from guest_tool import diff_guests, duplicate_codes, ADDED, REMOVED, RENAMED, TYPE_CHANGED
+from message_manifest import (load_message_templates, compile_templates, manifest_entries, load_manifest,
+                              update_manifest, card_is_current, TEMPLATE_FILES, MANIFEST_NAME)
+
+BLANK_CARD = 'blank_invite.png'
+MESSAGE_TEMPLATE_FILES = tuple(TEMPLATE_FILES.values())
+NAME_FONT_PATHS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSerif-Bold.ttf',
+    '/System/Library/Fonts/Supplemental/Times New Roman Bold.ttf',
+]
+LABEL_FONT_PATHS = [
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+    '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf',
+]
+NAME_FONT_SIZE = 50
+LABEL_FONT_SIZE = 38
+# Space kept free at the card's edges (the QR code sits this far from the corner)
+CARD_MARGIN = 40
+
+# PNG compression: Pillow's default, and a faster one for --watch (about half
+# the encoding time for ~10% larger cards) so an edit shows within a second
+PNG_COMPRESS_LEVEL = 6
+WATCH_PNG_COMPRESS_LEVEL = 3
+
+# Blank card and fonts, kept between cards until one of their files changes
+_card_assets = {}
+
+def _load_font(paths, size):
+    for path in paths:
+        if os.path.exists(path):
+            try:
+                return ImageFont.truetype(path, size)
+            except Exception:
+                continue
+    return ImageFont.load_default()
+
+def load_card_assets():
+    """{'blank', 'name_font', 'label_font'}, loaded once and again only when the files change"""
+    key = tuple(file_state(path) for path in [BLANK_CARD] + NAME_FONT_PATHS + LABEL_FONT_PATHS)
+    if _card_assets.get('key') != key:
+        # Load the blank invitation
+        with Image.open(BLANK_CARD) as img:
+            # Convert to RGB if needed
+            blank = img.convert('RGB') if img.mode != 'RGB' else img.copy()
+        _card_assets.update(key=key, blank=blank, name_font=_load_font(NAME_FONT_PATHS, NAME_FONT_SIZE),
+                            label_font=_load_font(LABEL_FONT_PATHS, LABEL_FONT_SIZE))
+    return _card_assets
+
+def name_measure(card_path=BLANK_CARD):
+    """(function giving a name's width in pixels as generate_card draws it, widest name that fits the card)"""
+    font = _load_font(NAME_FONT_PATHS, NAME_FONT_SIZE)
+    with Image.open(card_path) as card:
+        width = card.size[0]
+    draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+
+    def measure(name):
+        bbox = draw.textbbox((0, 0), name, font=font)
+        return bbox[2] - bbox[0]
+
+    return measure, width - 2 * CARD_MARGIN
 
 # Function to generate a single card
-def generate_card(name, single_double, code, output_path):
+def generate_card(name, single_double, code, output_path, compress_level=PNG_COMPRESS_LEVEL):
     """Generate a single invitation card"""
-    # Load the blank invitation
     try:
-        img = Image.open('blank_invite.png')
+        assets = load_card_assets()
     except Exception as e:
-        print(f"Error loading blank_invite.png: {e}")
+        print(f"Error loading {BLANK_CARD}: {e}")
         return False
 
-    # Convert to RGB if needed
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-
     # Create a copy to work with
-    invite = img.copy()
+    invite = assets['blank'].copy()
     draw = ImageDraw.Draw(invite)
     width, height = invite.size
-
-    # Load name font
-    try:
-        font_paths = [
-            '/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf',
-            '/usr/share/fonts/truetype/liberation/LiberationSerif-Bold.ttf',
-            '/System/Library/Fonts/Supplemental/Times New Roman Bold.ttf',
-        ]
-        name_font = None
-        for path in font_paths:
-            if os.path.exists(path):
-                try:
-                    name_font = ImageFont.truetype(path, 50)
-                    break
-                except:
-                    continue
-        
-        if name_font is None:
-            name_font = ImageFont.load_default()
-    except Exception as e:
-        name_font = ImageFont.load_default()
+    name_font = assets['name_font']
+    label_font = assets['label_font']
 
     # Position and draw the name
     name_x = width // 2
@@ -108,15 +124,6 @@ def generate_card(name, single_double, code, output_path):
     
     draw.text((text_x, name_y), name, fill=text_color, font=name_font)
 
-    # Load label font
-    try:
-        label_font = ImageFont.truetype('/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf', 38)
-    except:
-        try:
-            label_font = ImageFont.truetype('/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf', 38)
-        except:
-            label_font = ImageFont.load_default()
-
     # Generate QR code
     qr_url = f"http://46.62.209.58/c/{code}"
     qr_size = 300
@@ -154,9 +161,8 @@ def generate_card(name, single_double, code, output_path):
     # Position QR code at bottom right
     label_text = single_double.upper()
     code_text = str(code)
-    margin = 40
-    qr_x = width - qr_size - margin
-    qr_y = height - qr_size - margin
+    qr_x = width - qr_size - CARD_MARGIN
+    qr_y = height - qr_size - CARD_MARGIN
 
     # Calculate dimensions for both type and code text
     type_bbox = draw.textbbox((0, 0), label_text, font=label_font)
@@ -185,129 +191,226 @@ def generate_card(name, single_double, code, output_path):
     draw.text((code_x, code_y), code_text, fill=text_color, font=label_font)
 
     # Save the card
-    invite.save(output_path)
+    invite.save(output_path, compress_level=compress_level)
     return True
 
-# Read ODS file
-try:
-    import pandas as pd
-    df = pd.read_excel('wedding_invites.ods', engine='odf')
-    print(f"Loaded {len(df)} rows from spreadsheet")
-except ImportError:
-    # Try to parse ODS XML directly
+def generate_guest_files(name, single_double, code, cards_dir='cards', compress_level=PNG_COMPRESS_LEVEL):
+    """Generate a guest's card and WhatsApp variant; returns the card's store object or None
+
+    The messages go to the manifest in one batch (see message_manifest.py).
+    """
+    # Render into the store, then point the code's alias at the card
+    tmp_path = new_object_file(cards_dir)
     try:
-        import xml.etree.ElementTree as ET
-        import zipfile
-        
-        with zipfile.ZipFile('wedding_invites.ods', 'r') as z:
-            content = z.read('content.xml')
-        root = ET.fromstring(content)
-        ns = {'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
-              'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'}
-        
-        rows = root.findall('.//table:table-row', ns)
-        data = []
-        for row in rows:
-            cells = row.findall('.//table:table-cell', ns)
-            if len(cells) >= 4:
-                name_elem = cells[0].find('.//text:p', ns)
-                type_elem = cells[1].find('.//text:p', ns)
-                code_elem = cells[3].find('.//text:p', ns)
-                if name_elem is not None and name_elem.text and code_elem is not None and code_elem.text:
-                    name = name_elem.text.replace('&amp;', '&')
-                    single_double = type_elem.text if type_elem is not None and type_elem.text else "Single"
-                    code = code_elem.text if code_elem is not None and code_elem.text else None
-                    if code:
-                        data.append({'name': name, 'type': single_double, 'code': code})
-        
-        # Create a simple dataframe-like structure
-        class SimpleDF:
-            def __init__(self, data):
-                self.data = data
-            def __iter__(self):
-                return iter(self.data)
-            def __len__(self):
-                return len(self.data)
-        
-        df = SimpleDF(data)
-        print(f"Loaded {len(df)} rows from spreadsheet")
-    except Exception as e:
+        if not generate_card(name, single_double, code, tmp_path, compress_level):
+            return None
+        card_path = put_object(tmp_path, cards_dir)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    link_alias(code, card_path, cards_dir)
+
+    # Small JPEG for Twilio to fetch, served from /wa/
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    make_whatsapp_variant(card_path, variant_path(code))
+    return card_path
+
+def current_card(guest, entry, cards_dir='cards'):
+    """The guest's card if its manifest entry shows it was rendered from the guest's current row, else None"""
+    card_path = resolve(guest['code'], cards_dir)
+    if card_path and card_path == (entry or {}).get('card') and card_is_current(guest, entry):
+        return card_path
+    return None
+
+def remove_guest_files(code, cards_dir='cards'):
+    """Delete the alias and WhatsApp variant of a removed guest; the card goes at the next collect_garbage()"""
+    remove_alias(code, cards_dir)
+    if os.path.exists(variant_path(code)):
+        os.remove(variant_path(code))
+
+def watch_and_regenerate(rows, message_templates, codes=None, cards_dir='cards'):
+    """Regenerate what an edit affects until Ctrl+C
+
+    A spreadsheet edit re-renders only the added, renamed and retyped guests,
+    a new blank card or font re-renders every card, and a message template
+    edit rewrites the manifest's messages without rendering.
+    """
+    def selected(guests):
+        return [guest for guest in guests if codes is None or guest['code'] in codes]
+
+    state = {'rows': rows, 'templates': message_templates}
+    manifest_path = os.path.join(cards_dir, MANIFEST_NAME)
+
+    def on_change(changed):
+        start = time.monotonic()
+        to_render = []
+        removed = []
+        if GUEST_SHEET in changed:
+            try:
+                new_rows = load_guest_rows(GUEST_SHEET)
+            except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+                print(f"✗ Could not read spreadsheet: {e}")
+                return
+            try:
+                changes = diff_guests(state['rows'], new_rows)
+            except ValueError as e:
+                print(f"✗ {e}")
+                new_guests = [guest for guest in normalize_guests(new_rows)[0] if guest['code'] is not None]
+                if duplicate_codes(new_guests):
+                    # Nothing is regenerated until the sheet has one row per code again
+                    return
+                # Only the version before could not be matched: render the whole list again
+                new_codes = {guest['code'] for guest in new_guests}
+                changes = {ADDED: new_guests, 'modified': [], 'unchanged': 0,
+                           REMOVED: [guest for guest in normalize_guests(state['rows'])[0]
+                                     if guest['code'] is not None and guest['code'] not in new_codes]}
+            state['rows'] = new_rows
+            print(f"📄 {GUEST_SHEET}: {len(changes[ADDED])} added, {len(changes[REMOVED])} removed, "
+                  f"{len(changes['modified'])} modified")
+            for guest in selected(changes[REMOVED]):
+                remove_guest_files(guest['code'], cards_dir)
+                removed.append(guest['code'])
+            to_render = selected(changes[ADDED] + [entry['new'] for entry in changes['modified']
+                                                   if {RENAMED, TYPE_CHANGED} & set(entry['changes'])])
+
+        guests = selected(normalize_guests(state['rows'])[0])
+        to_update = []
+        if any(path in MESSAGE_TEMPLATE_FILES for path in changed):
+            templates = load_message_templates()
+            try:
+                compile_templates(templates)
+            except ValueError as e:
+                print(f"✗ {e}")
+                return
+            state['templates'] = templates
+            to_update = guests
+            print(f"✉️  Rewriting the messages of {len(guests)} guests")
+
+        layout_files = [path for path in changed if path != GUEST_SHEET and path not in MESSAGE_TEMPLATE_FILES]
+        if layout_files:
+            # A new blank card or font changes every card
+            print(f"🖼️  {', '.join(layout_files)} changed, re-rendering every card")
+            to_render = guests
+
+        card_paths = {}
+        for guest in to_render:
+            card_path = generate_guest_files(guest['name'], guest['type'], guest['code'], cards_dir,
+                                             WATCH_PNG_COMPRESS_LEVEL)
+            if card_path:
+                card_paths[guest['code']] = card_path
+            else:
+                print(f"✗ Error generating card for {guest['name']} (code: {guest['code']})")
+        to_update = to_update or to_render
+        if to_update or removed:
+            update_manifest(manifest_entries(to_update, state['templates'], card_paths), removed, manifest_path)
+        print(f"✓ {len(to_render)} cards regenerated in {time.monotonic() - start:.2f}s")
+
+    # Keep the renderer warm for the first change
+    load_card_assets()
+    fonts = [path for path in NAME_FONT_PATHS + LABEL_FONT_PATHS if os.path.exists(path)]
+    watch_files([GUEST_SHEET, BLANK_CARD, *MESSAGE_TEMPLATE_FILES, *fonts], on_change)
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate invitation cards and messages from the spreadsheet')
+    parser.add_argument('--codes-file',
+                        help='Only generate these codes, one per line (e.g. from guest_tool.py diff --codes)')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and regenerate what changes in the sheet, card, fonts or templates')
+    args = parser.parse_args()
+    started = time.time()
+
+    # Read ODS file
+    try:
+        rows = load_guest_rows(GUEST_SHEET)
+        print(f"Loaded {len(rows)} rows from spreadsheet")
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
         print(f"Could not read spreadsheet: {e}")
         sys.exit(1)
 
-# Load message templates
-print("Loading message templates...")
-message_templates = load_message_templates()
-print(f"Loaded WhatsApp template: {message_templates['whatsapp'][:50]}...")
-print(f"Loaded SMS template: {message_templates['sms'][:50]}...")
-
-# Create cards directory
-os.makedirs('cards', exist_ok=True)
-
-# Generate cards for all guests
-success_count = 0
-error_count = 0
-
-for row in df:
-    if hasattr(row, 'iloc'):
-        # pandas DataFrame row
-        name = str(row.iloc[0]) if pd.notna(row.iloc[0]) else None
-        single_double = str(row.iloc[1]) if pd.notna(row.iloc[1]) else "Single"
-        code_raw = row.iloc[3]
-        
-        # Handle code (preserve leading zeros)
-        if pd.notna(code_raw):
-            if isinstance(code_raw, (int, float)):
-                code = str(int(code_raw)).zfill(5)
-            else:
-                code = str(code_raw).rstrip('.0').zfill(5)
-        else:
-            code = None
-    else:
-        # Simple dict-like structure
-        name = row.get('name')
-        single_double = row.get('type', 'Single')
-        code = row.get('code')
-        if code and str(code).isdigit():
-            code = str(code).zfill(5)
-    
-    if not name or not code or name == 'nan' or code == 'nan':
-        continue
-    
-    # Create folder name: {sanitized_name}_{code}
-    sanitized_name = sanitize_folder_name(name)
-    folder_name = f"{sanitized_name}_{code}"
-    folder_path = os.path.join('cards', folder_name)
-    os.makedirs(folder_path, exist_ok=True)
-    
-    # Generate card
-    card_path = os.path.join(folder_path, f"{code}.png")
-    
+    all_rows = rows
+    only = None
+    if args.codes_file:
+        with open(args.codes_file, 'r', encoding='utf-8') as f:
+            only = {normalize_code(line)[0] for line in f if line.strip()}
+        rows = [row for row in rows if normalize_code(row['code'])[0] in only]
+        print(f"Only the {len(rows)} guests listed in {args.codes_file}")
+
+    # Load message templates
+    print("Loading message templates...")
+    message_templates = load_message_templates()
+    print(f"Loaded WhatsApp template: {message_templates['whatsapp'][:50]}...")
+    print(f"Loaded SMS template: {message_templates['sms'][:50]}...")
     try:
-        if generate_card(name, single_double, code, card_path):
-            # Create WhatsApp message file
-            whatsapp_message = message_templates['whatsapp'].format(code=code)
-            whatsapp_path = os.path.join(folder_path, 'message_whatsapp.txt')
-            with open(whatsapp_path, 'w', encoding='utf-8') as f:
-                f.write(whatsapp_message)
-            
-            # Create SMS message file
-            sms_message = message_templates['sms'].format(code=code)
-            sms_path = os.path.join(folder_path, 'message_sms.txt')
-            with open(sms_path, 'w', encoding='utf-8') as f:
-                f.write(sms_message)
-            
-            success_count += 1
-            if success_count % 10 == 0:
-                print(f"Generated {success_count} cards with messages...")
-        else:
+        compile_templates(message_templates)
+    except ValueError as e:
+        print(f"Error in message template: {e}")
+        sys.exit(1)
+
+    # Create cards directory
+    os.makedirs('cards', exist_ok=True)
+
+    # Generate cards for all guests
+    manifest = load_manifest() if args.watch else {}
+    success_count = 0
+    error_count = 0
+    guests = []
+    card_paths = {}
+
+    # Codes padded to 5 digits (leading zeros are lost when stored as a number)
+    for guest in normalize_guests(rows)[0]:
+        name = guest['name']
+        single_double = guest['type']
+        code = guest['code']
+        if code is None:
             error_count += 1
-            print(f"Error generating card for {name} (code: {code})")
-    except Exception as e:
-        error_count += 1
-        print(f"Error generating card for {name} (code: {code}): {e}")
+            print(f"Error: {name} has no code")
+            continue
+        guests.append(guest)
+        # Watching keeps the cards rendered from the current rows; edits made
+        # while no watcher ran are caught up here, changes from now on by the watcher
+        existing = current_card(guest, manifest.get(code)) if args.watch else None
+        if existing:
+            card_paths[code] = existing
+            continue
+
+        try:
+            card_path = generate_guest_files(name, single_double, code)
+            if card_path:
+                card_paths[code] = card_path
+                success_count += 1
+                if success_count % 10 == 0:
+                    print(f"Generated {success_count} cards with messages...")
+            else:
+                error_count += 1
+                print(f"Error generating card for {name} (code: {code})")
+        except Exception as e:
+            error_count += 1
+            print(f"Error generating card for {name} (code: {code}): {e}")
+
+    # All the messages in one batch; a full run also drops the guests no longer in the sheet
+    removed = ()
+    if only is None:
+        removed = (set(load_manifest()) | set(iter_aliases())) - {guest['code'] for guest in guests}
+        for code in removed:
+            remove_guest_files(code)
+    update_manifest(manifest_entries(guests, message_templates, card_paths), removed)
+
+    print(f"\nDone! Generated {success_count} cards with messages successfully.")
+    if error_count > 0:
+        print(f"Errors: {error_count}")
+    if only is None:
+        # Cards of removed guests and previous versions of re-rendered ones
+        # Anything older than this run that no code points to any more
+        unused, freed = collect_garbage(older_than=started)
+        if unused:
+            print(f"Removed {len(removed)} guests no longer in the sheet, {unused} unused cards "
+                  f"({freed / 1024 / 1024:.1f} MB)")
 
-print(f"\nDone! Generated {success_count} cards with messages successfully.")
-if error_count > 0:
-    print(f"Errors: {error_count}")
+    if args.watch:
+        watch_and_regenerate(all_rows, message_templates, only)
 
+if __name__ == '__main__':
+    main()
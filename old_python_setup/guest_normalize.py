@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Normalization of the guest list's codes, phone numbers and names
+Codes lose their leading zeros (and sometimes gain a .0) when the sheet stores
+them as numbers; phones are typed as 0712..., 255712..., +255 712 412 132 and
+so on. Both columns are cleaned in one pass with precompiled patterns, and
+values that still don't look right come back in a mask instead of being
+printed row by row.
+
+Usage:
+  python3 guest_normalize.py            # Show the invalid codes and phones of wedding_invites.ods
+"""
+import re
+
+CODE_LENGTH = 5
+COUNTRY_CODE = "255"
+
+# A number stored as a float: 123.0
+FLOAT_CODE = r'^(\d+)\.0+$'
+# Anything but digits and +
+PHONE_JUNK = r'[^\d+]'
+# The international dialling prefix typed instead of +: 00255..., 001...
+INTERNATIONAL_PREFIX = r'^00(?=[1-9])'
+# A leading 0, a bare 255 or no prefix at all all become +255
+PHONE_PREFIX = r'^(?:0|255|(?=\d))'
+# E.164 (+ and 8 to 15 digits), with exactly 9 digits after +255 for Tanzanian numbers
+VALID_PHONE = r'\+(?!255)\d{8,15}|\+255\d{9}'
+
+_FLOAT_CODE_RE = re.compile(FLOAT_CODE)
+_PHONE_JUNK_RE = re.compile(PHONE_JUNK)
+_INTERNATIONAL_PREFIX_RE = re.compile(INTERNATIONAL_PREFIX)
+_PHONE_PREFIX_RE = re.compile(PHONE_PREFIX)
+_VALID_PHONE_RE = re.compile(VALID_PHONE)
+
+def normalize_code(code):
+    """(5-digit code, valid) for one value; non-numeric codes are kept as typed but flagged"""
+    if code is None:
+        return None, False
+    code = str(code).strip()
+    if not code.isdigit():
+        code = _FLOAT_CODE_RE.sub(r'\1', code)
+        if not code.isdigit():
+            return code, False
+    return code.zfill(CODE_LENGTH), len(code) <= CODE_LENGTH
+
+def normalize_phone(phone):
+    """(+255... number, valid) for one value; a missing number is (None, True)"""
+    if phone is None:
+        return None, True
+    # Also turns 'nan' and 'N/A' into nothing
+    phone = _PHONE_JUNK_RE.sub('', str(phone))
+    if not phone.strip('+'):
+        return None, True
+    phone = _INTERNATIONAL_PREFIX_RE.sub('+', phone, count=1)
+    phone = _PHONE_PREFIX_RE.sub('+' + COUNTRY_CODE, phone, count=1)
+    return phone, bool(_VALID_PHONE_RE.fullmatch(phone))
+
+def normalize_code_column(codes):
+    """(codes, invalid mask) for a whole column, as lists"""
+    results = [normalize_code(code) for code in codes]
+    return [code for code, _ in results], [not valid for _, valid in results]
+
+def normalize_phone_column(phones):
+    """(+255... numbers or None, invalid mask) for a whole column, as lists"""
+    results = [normalize_phone(phone) for phone in phones]
+    return [phone for phone, _ in results], [not valid for _, valid in results]
+
+def sanitize_folder_name(name):
+    """Sanitize name for use in folder name"""
+    # Remove special characters, keep only alphanumeric, spaces, and common punctuation
+    name = re.sub(r'[^\w\s\-&.]', '', name)
+    # Replace spaces and special chars with underscores
+    name = re.sub(r'[\s&.]+', '_', name)
+    # Remove multiple underscores
+    name = re.sub(r'_+', '_', name)
+    # Remove leading/trailing underscores
+    name = name.strip('_')
+    return name
+
+def normalize_guests(rows):
+    """Guests with normalized codes and phones, and {'code': mask, 'phone': mask} of invalid values
+
+    Rows are {'name', 'type', 'phone', 'code'} as read from the sheet; the
+    masks line up with the returned guests.
+    """
+    codes, invalid_codes = normalize_code_column([row['code'] for row in rows])
+    phones, invalid_phones = normalize_phone_column([row['phone'] for row in rows])
+    guests = [{'name': row['name'], 'type': row['type'], 'phone': phone, 'code': code}
+              for row, phone, code in zip(rows, phones, codes)]
+    return guests, {'code': invalid_codes, 'phone': invalid_phones}
+
+def main():
+    """Main function"""
+    import time
+    from ods_reader import GUEST_SHEET
+    from guest_snapshot import load_guest_rows
+
+    start = time.monotonic()
+    rows = load_guest_rows(GUEST_SHEET)
+    guests, invalid = normalize_guests(rows)
+    elapsed = (time.monotonic() - start) * 1000
+
+    for guest, bad_code, bad_phone, row in zip(guests, invalid['code'], invalid['phone'], rows):
+        if bad_code:
+            print(f"✗ Invalid code  {row['code']!r:<20} {guest['name']}")
+        if bad_phone:
+            print(f"✗ Invalid phone {row['phone']!r:<20} {guest['name']}")
+    print(f"{len(guests)} guests, {sum(invalid['code'])} invalid codes, {sum(invalid['phone'])} invalid phones "
+          f"({elapsed:.1f} ms)")
+
+if __name__ == '__main__':
+    main()
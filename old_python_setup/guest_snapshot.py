@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Compiled snapshot of the guest spreadsheet
+The guest rows of wedding_invites.ods are parsed once and stored in a small
+SQLite file next to it, keyed by the sheet's SHA-256. Later runs read the
+snapshot in a few milliseconds and only parse the sheet again when its content
+changes (an unchanged size and modification time skip even the hashing).
+When the sheet does change, the replaced snapshot is kept as
+wedding_invites.snapshot.previous.sqlite, so `guest_tool.py diff` can show what
+the new version changed.
+
+Usage:
+  python3 guest_snapshot.py            # Build or refresh the snapshot and show its state
+  python3 guest_snapshot.py --rebuild
+"""
+import hashlib
+import os
+import sqlite3
+import sys
+
+from ods_reader import iter_guest_rows, GUEST_SHEET
+
+# Bump when the stored rows change shape, so old snapshots are rebuilt
+SNAPSHOT_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE guests (position INTEGER PRIMARY KEY, name TEXT, type TEXT, phone TEXT, code TEXT);
+"""
+
+def snapshot_path(sheet_path):
+    """wedding_invites.ods -> wedding_invites.snapshot.sqlite"""
+    return os.path.splitext(sheet_path)[0] + '.snapshot.sqlite'
+
+def previous_snapshot_path(sheet_path=None, snapshot=None):
+    """wedding_invites.ods -> wedding_invites.snapshot.previous.sqlite"""
+    return os.path.splitext(snapshot or snapshot_path(sheet_path))[0] + '.previous.sqlite'
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_meta(path):
+    try:
+        with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as db:
+            return dict(db.execute("SELECT key, value FROM meta").fetchall())
+    except sqlite3.Error:
+        return None
+
+def read_snapshot_rows(path):
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        rows = db.execute("SELECT name, type, phone, code FROM guests ORDER BY position").fetchall()
+    finally:
+        db.close()
+    return [{'name': name, 'type': type_, 'phone': phone, 'code': code} for name, type_, phone, code in rows]
+
+def _write_snapshot(path, rows, meta):
+    # Written to a temporary file and renamed, so readers never see half a snapshot
+    tmp = f"{path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    db = sqlite3.connect(tmp)
+    try:
+        db.executescript(SCHEMA)
+        db.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+        db.executemany("INSERT INTO guests (name, type, phone, code) VALUES (?, ?, ?, ?)",
+                       [(r['name'], r['type'], r['phone'], r['code']) for r in rows])
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp, path)
+
+def snapshot_state(sheet_path=GUEST_SHEET, snapshot=None):
+    """(meta of the snapshot or None, whether it matches the sheet's current content)"""
+    snapshot = snapshot or snapshot_path(sheet_path)
+    meta = _read_meta(snapshot) if os.path.exists(snapshot) else None
+    if not meta or meta.get('version') != str(SNAPSHOT_VERSION):
+        return meta, False
+    stat = os.stat(sheet_path)
+    if meta.get('size') == str(stat.st_size) and meta.get('mtime_ns') == str(stat.st_mtime_ns):
+        return meta, True
+    # Touched or copied (e.g. by rsync) but possibly unchanged
+    return meta, meta.get('sha256') == file_hash(sheet_path)
+
+def load_guest_rows(sheet_path=GUEST_SHEET, snapshot=None, rebuild=False):
+    """Guest rows as ods_reader.iter_guest_rows gives them, from the snapshot when it is current"""
+    snapshot = snapshot or snapshot_path(sheet_path)
+    if not rebuild:
+        meta, current = snapshot_state(sheet_path, snapshot)
+        if current:
+            stat = os.stat(sheet_path)
+            if meta.get('mtime_ns') != str(stat.st_mtime_ns):
+                # Same content, new timestamp: record it so the next run skips hashing
+                meta.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                try:
+                    _write_snapshot(snapshot, read_snapshot_rows(snapshot), meta)
+                except (OSError, sqlite3.Error):
+                    pass
+            return read_snapshot_rows(snapshot)
+
+    stat = os.stat(sheet_path)
+    sha256 = file_hash(sheet_path)
+    rows = list(iter_guest_rows(sheet_path))
+    meta = {'version': SNAPSHOT_VERSION, 'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'rows': len(rows)}
+    try:
+        old_meta = _read_meta(snapshot) if os.path.exists(snapshot) else None
+        if old_meta and old_meta.get('sha256') != sha256:
+            os.replace(snapshot, previous_snapshot_path(snapshot=snapshot))
+        _write_snapshot(snapshot, rows, meta)
+    except (OSError, sqlite3.Error) as e:
+        # A read-only directory (e.g. on the server) only costs the speed-up
+        print(f"Warning: could not write guest snapshot {snapshot}: {e}", file=sys.stderr)
+    return rows
+
+def main():
+    """Main function"""
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Build the guest list snapshot')
+    parser.add_argument('sheet', nargs='?', default=GUEST_SHEET, help=f'ODS file (default: {GUEST_SHEET})')
+    parser.add_argument('--rebuild', action='store_true', help='Parse the sheet even if the snapshot is current')
+    args = parser.parse_args()
+
+    meta, current = snapshot_state(args.sheet)
+    start = time.monotonic()
+    rows = load_guest_rows(args.sheet, rebuild=args.rebuild)
+    elapsed = (time.monotonic() - start) * 1000
+    action = "Read" if current and not args.rebuild else "Built"
+    print(f"{action} {snapshot_path(args.sheet)}: {len(rows)} guests in {elapsed:.1f} ms")
+    meta, _ = snapshot_state(args.sheet)
+    if meta:
+        print(f"Sheet SHA-256: {meta['sha256']}")
+
+if __name__ == '__main__':
+    main()
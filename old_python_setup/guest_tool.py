@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+"""
+Checks for the guest spreadsheet
+`lint` reads wedding_invites.ods once and reports, before anything is rendered
+or sent: rows without a name or code, invalid or colliding codes (123 and
+00123 are the same guest to the server), invalid or shared phone numbers,
+unknown Single/Double types and names too wide for the card.
+`dupes` lists guests that are probably the same household under two spellings
+("Dr Mrs Geoffrey Tarimo" and "Mrs G. Tarimo"). Names are only compared within
+blocks of guests sharing a phone, or a first initial and a surname (or a
+trigram signature of it, for misspellings), so large lists take near-linear time.
+`diff` compares two versions of the guest list by normalized code and lists
+added and removed guests, renames, type changes and phone changes, so that only
+those guests need to be rendered, published or sent again.
+
+Usage:
+  python3 guest_tool.py lint                 # Exit status 1 when there are errors
+  python3 guest_tool.py lint --strict        # Warnings fail too
+  python3 guest_tool.py lint --json
+  python3 guest_tool.py dupes                # Writes guest_duplicates_report.csv
+  python3 guest_tool.py dupes --threshold 0.6
+  python3 guest_tool.py diff                 # Latest sheet against the version before it
+  python3 guest_tool.py diff old.ods         # old.ods against wedding_invites.ods
+  python3 guest_tool.py diff old.ods new.ods --codes --only renamed type_changed
+"""
+import contextlib
+import csv
+import functools
+import json
+import os
+import sys
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from difflib import SequenceMatcher
+
+from ods_reader import iter_rows, iter_guest_rows, GUEST_SHEET, GUEST_COLUMNS
+from guest_normalize import normalize_guests, sanitize_folder_name
+from guest_snapshot import load_guest_rows, read_snapshot_rows, previous_snapshot_path
+
+# Try to import PIL (only needed to measure names)
+try:
+    import PIL
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+LINT_REPORT_FILE = "guest_lint_report.json"
+
+BLANK_CARD = "blank_invite.png"
+
+GUEST_TYPES = ('Single', 'Double')
+
+ERROR = "error"
+WARNING = "warning"
+
+DUPLICATES_REPORT_FILE = "guest_duplicates_report.csv"
+DEFAULT_DUPLICATE_THRESHOLD = 0.75
+
+CHANGES_FILE = "guest_changes.json"
+
+# Kinds of change between two versions of the guest list
+ADDED = "added"
+REMOVED = "removed"
+RENAMED = "renamed"
+TYPE_CHANGED = "type_changed"
+PHONE_CHANGED = "phone_changed"
+CHANGE_KINDS = (ADDED, REMOVED, RENAMED, TYPE_CHANGED, PHONE_CHANGED)
+
+# Titles and joining words that say nothing about who the guest is
+NAME_STOPWORDS = {
+    'mr', 'mrs', 'ms', 'miss', 'dr', 'prof', 'rev', 'eng', 'hon', 'sr', 'jr', 'mwl', 'mch', 'bw', 'bi',
+    'mama', 'baba', 'aunt', 'uncle', 'and', 'na', 'family', 'fam', 'the', 'of',
+}
+# Surname signatures: a guest gets one trigram block per band, keyed by several min-hashes
+SIGNATURE_BANDS = 4
+HASHES_PER_BAND = 3
+# (a * crc32 + b) mod a prime gives the independent hash functions
+SIGNATURE_PRIME = 4294967311
+SIGNATURE_HASHES = [(2654435761 * (i + 1) % SIGNATURE_PRIME, 40503 * (i + 7)) for i in range(SIGNATURE_BANDS * HASHES_PER_BAND)]
+# Blocks bigger than this are only compared against guests without a given name
+MAX_BLOCK = 500
+
+def read_sheet_rows(path=GUEST_SHEET):
+    """{'row', 'name', 'type', 'phone', 'code'} for every non-empty row below the header"""
+    rows = []
+    for row_number, values in iter_rows(path, max_columns=len(GUEST_COLUMNS)):
+        if row_number == 1:
+            continue
+        name, single_double, phone, code = values + [''] * (len(GUEST_COLUMNS) - len(values))
+        rows.append({'row': row_number, 'name': name, 'type': single_double or 'Single',
+                     'phone': phone or None, 'code': code.strip() or None})
+    return rows
+
+def load_name_measure(card_path=BLANK_CARD):
+    """(function giving a name's width in pixels, widest name that fits) or None without PIL or the card
+
+    Measured by the card generator itself, with its font and margins.
+    """
+    if not PIL_AVAILABLE or not os.path.exists(card_path):
+        return None
+    # Imported here since the generator imports this module; its warning about
+    # a missing qrcode must not end up in lint --json output
+    with contextlib.redirect_stdout(sys.stderr):
+        from generate_cards_and_messages import name_measure
+    return name_measure(card_path)
+
+def lint_rows(rows, measure=None):
+    """Issues of the sheet's rows, as {'row', 'code', 'name', 'check', 'severity', 'message'}
+
+    Codes in the issues are normalized (00123 for a cell holding 123).
+    """
+    issues = []
+
+    def add(row, code, check, severity, message):
+        issues.append({'row': row['row'], 'code': code, 'name': row['name'], 'check': check,
+                       'severity': severity, 'message': message})
+
+    guests, invalid = normalize_guests(rows)
+    # Normalized code and phone -> (row, code), filled in the same pass
+    by_code = {}
+    by_phone = {}
+    for row, guest, bad_code, bad_phone in zip(rows, guests, invalid['code'], invalid['phone']):
+        code = guest['code']
+        has_name = bool(row['name'].strip())
+        if not has_name and code is None:
+            add(row, code, 'incomplete_row', ERROR, "Row has neither a name nor a code")
+            continue
+        if not has_name:
+            add(row, code, 'empty_name', ERROR, "Row has a code but no name")
+        if code is None:
+            add(row, code, 'missing_code', ERROR, "Row has a name but no code")
+            continue
+        if bad_code:
+            add(row, code, 'invalid_code', ERROR, f"Code {row['code']!r} is not a number of at most 5 digits")
+        by_code.setdefault(code, []).append(row)
+
+        if bad_phone:
+            add(row, code, 'invalid_phone', ERROR, f"Phone {row['phone']!r} is not a valid number ({guest['phone']})")
+        elif guest['phone']:
+            by_phone.setdefault(guest['phone'], []).append((row, code))
+
+        if row['type'] not in GUEST_TYPES:
+            add(row, code, 'unknown_type', WARNING, f"Type {row['type']!r} is neither Single nor Double")
+        if measure and row['name'].strip():
+            name_width, max_width = measure[0](row['name']), measure[1]
+            if name_width > max_width:
+                add(row, code, 'name_too_wide', WARNING,
+                    f"Name is {name_width}px wide, the card has room for {max_width}px")
+
+    for code, same in by_code.items():
+        if len(same) > 1:
+            rows_text = ', '.join(f"row {row['row']} ({row['code']})" for row in same)
+            for row in same:
+                add(row, code, 'duplicate_code', ERROR, f"Code {code} is used by {rows_text}")
+    for phone, same in by_phone.items():
+        if len(same) > 1:
+            rows_text = ', '.join(f"row {row['row']}" for row, _ in same)
+            for row, code in same:
+                add(row, code, 'duplicate_phone', WARNING, f"Phone {phone} is shared by {rows_text}")
+
+    issues.sort(key=lambda issue: (issue['row'], issue['check']))
+    return issues
+
+def name_parts(name):
+    """(given names, surname) of a name, lowercase and without titles"""
+    tokens = [token for token in sanitize_folder_name(name).lower().replace('-', '_').split('_')
+              if token and token not in NAME_STOPWORDS]
+    if not tokens:
+        return [], ''
+    return tokens[:-1], tokens[-1]
+
+def trigrams(text):
+    text = f" {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+@functools.lru_cache(maxsize=None)
+def surname_signature(surname):
+    """One key per band; similar surnames likely share one, unrelated ones almost never
+
+    Each key is the smallest trigram hash under a few hash functions, which two
+    surnames share with a probability equal to their trigram overlap.
+    """
+    grams = [zlib.crc32(gram.encode()) for gram in trigrams(surname)]
+    hashes = [min((a * gram + b) % SIGNATURE_PRIME for gram in grams) for a, b in SIGNATURE_HASHES]
+    return [tuple(hashes[band * HASHES_PER_BAND:(band + 1) * HASHES_PER_BAND]) for band in range(SIGNATURE_BANDS)]
+
+def similarity(a, b):
+    if a == b:
+        return 1.0
+    matcher = SequenceMatcher(None, a, b)
+    # The cheap upper bound rules out most unrelated names
+    return matcher.ratio() if matcher.real_quick_ratio() >= 0.5 and matcher.quick_ratio() >= 0.5 else 0.0
+
+def given_similarity(given_a, given_b):
+    """How alike two sets of given names are; an initial matches a name it starts"""
+    if not given_a or not given_b:
+        # "Mr & Mrs Tarimo" could be the household of either Tarimo
+        return 0.7
+    best = 0.0
+    for a in given_a:
+        for b in given_b:
+            if len(a) == 1 or len(b) == 1:
+                score = 0.9 if a[0] == b[0] else 0.0
+            else:
+                score = similarity(a, b)
+            best = max(best, score)
+    return best
+
+def duplicate_score(a, b, threshold=0.0):
+    """(score between 0 and 1, reasons) for two guests being the same household
+
+    Pairs that cannot reach `threshold` on their surnames alone score 0.
+    """
+    reasons = []
+    same_phone = a['phone'] and a['phone'] == b['phone']
+    surname = similarity(a['surname'], b['surname'])
+    if surname + (0.4 if same_phone else 0.0) < threshold:
+        return 0.0, []
+    if surname == 1.0:
+        reasons.append("same surname")
+    elif surname >= 0.8:
+        reasons.append("similar surname")
+    given = given_similarity(a['given'], b['given'])
+    if given >= 0.9 and a['given'] and b['given']:
+        reasons.append("same given name" if given == 1.0 else "matching given name or initial")
+    score = surname * given
+    if same_phone:
+        reasons.append("same phone")
+        score = min(1.0, score + 0.4)
+    elif a['phone'] and b['phone']:
+        # Two different numbers are more likely two people
+        score *= 0.85
+    return round(score, 2), reasons
+
+def find_duplicates(rows, threshold=DEFAULT_DUPLICATE_THRESHOLD):
+    """Likely duplicate pairs, best first, as (score, reasons, guest, guest)
+
+    Rows are {'row', 'name', 'phone', 'code', ...}; phones and codes are
+    normalized before comparing.
+    """
+    guests, _ = normalize_guests(rows)
+    people = []
+    blocks = {}
+    for row, guest in zip(rows, guests):
+        given, surname = name_parts(row['name'])
+        if not surname:
+            continue
+        person = {'row': row['row'], 'name': row['name'], 'code': guest['code'], 'phone': guest['phone'],
+                  'given': given, 'surname': surname}
+        index = len(people)
+        people.append(person)
+        initial = given[0][0] if given else ''
+        keys = [('surname', surname, initial)]
+        keys += [('signature', band, value, initial) for band, value in enumerate(surname_signature(surname))]
+        if guest['phone']:
+            keys.append(('phone', guest['phone']))
+        for key in keys:
+            blocks.setdefault(key, []).append(index)
+        # Guests without a given name are compared with everyone of their surname
+        blocks.setdefault(('household', surname), []).append(index)
+
+    pairs = set()
+    for key, members in blocks.items():
+        if len(members) < 2:
+            continue
+        if key[0] == 'household' or len(members) > MAX_BLOCK:
+            lone = [i for i in members if not people[i]['given']]
+            pairs.update((min(i, j), max(i, j)) for i in lone for j in members if i != j)
+            continue
+        pairs.update((members[i], members[j]) for i in range(len(members)) for j in range(i + 1, len(members)))
+
+    duplicates = []
+    for i, j in pairs:
+        score, reasons = duplicate_score(people[i], people[j], threshold)
+        if score >= threshold:
+            duplicates.append((score, reasons, people[i], people[j]))
+    duplicates.sort(key=lambda found: (-found[0], found[2]['row'], found[3]['row']))
+    return duplicates
+
+def write_duplicates_report(duplicates, path=DUPLICATES_REPORT_FILE):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['score', 'reasons', 'row_a', 'code_a', 'name_a', 'phone_a',
+                         'row_b', 'code_b', 'name_b', 'phone_b'])
+        for score, reasons, a, b in duplicates:
+            writer.writerow([score, '; '.join(reasons), a['row'], a['code'], a['name'], a['phone'] or '',
+                             b['row'], b['code'], b['name'], b['phone'] or ''])
+
+def cmd_dupes(args):
+    try:
+        rows = read_sheet_rows(args.sheet)
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        print(f"Error reading spreadsheet: {e}")
+        sys.exit(2)
+
+    duplicates = find_duplicates(rows, args.threshold)
+    write_duplicates_report(duplicates, args.report)
+    for score, reasons, a, b in duplicates:
+        print(f"{score:.2f}  row {a['row']:<5} {a['name'][:30]:<30} row {b['row']:<5} {b['name'][:30]:<30} "
+              f"({', '.join(reasons)})")
+    print(f"{len(rows)} rows: {len(duplicates)} likely duplicates (report: {args.report})")
+
+def read_guest_list(path):
+    """Guest rows of an ODS file or of a snapshot (.sqlite)"""
+    if path.endswith('.sqlite'):
+        return read_snapshot_rows(path)
+    return list(iter_guest_rows(path))
+
+def duplicate_codes(guests):
+    """Normalized codes shared by several guests"""
+    seen = set()
+    duplicates = set()
+    for guest in guests:
+        if guest['code'] is not None:
+            (duplicates if guest['code'] in seen else seen).add(guest['code'])
+    return sorted(duplicates)
+
+def diff_guests(old_rows, new_rows):
+    """Change set between two versions of the guest list, matched by normalized code
+
+    {'added': [guest], 'removed': [guest], 'modified': [{'code', 'changes',
+    'old', 'new'}], 'unchanged': count}; 'changes' lists renamed, type_changed
+    and phone_changed. Names differing only in spacing are the same name.
+    Rows without a code are left out. A code used by several rows of either
+    list cannot be matched and raises ValueError.
+    """
+    old_list = normalize_guests(old_rows)[0]
+    new_list = normalize_guests(new_rows)[0]
+    for version, guests in (('old', old_list), ('new', new_list)):
+        duplicates = duplicate_codes(guests)
+        if duplicates:
+            raise ValueError(f"Codes used by several guests in the {version} list: {', '.join(duplicates)} "
+                             f"(see guest_tool.py lint)")
+    old_guests = {guest['code']: guest for guest in old_list if guest['code'] is not None}
+    new_guests = {guest['code']: guest for guest in new_list if guest['code'] is not None}
+
+    changes = {ADDED: [], REMOVED: [], 'modified': [], 'unchanged': 0}
+    for code, new in new_guests.items():
+        old = old_guests.get(code)
+        if old is None:
+            changes[ADDED].append(new)
+            continue
+        kinds = []
+        if ' '.join(old['name'].split()) != ' '.join(new['name'].split()):
+            kinds.append(RENAMED)
+        if old['type'] != new['type']:
+            kinds.append(TYPE_CHANGED)
+        if old['phone'] != new['phone']:
+            kinds.append(PHONE_CHANGED)
+        if kinds:
+            changes['modified'].append({'code': code, 'changes': kinds, 'old': old, 'new': new})
+        else:
+            changes['unchanged'] += 1
+    changes[REMOVED] = [old for code, old in old_guests.items() if code not in new_guests]
+    return changes
+
+def changed_codes(changes, kinds=CHANGE_KINDS):
+    """Codes with at least one of the given kinds of change: added, removed, then modified"""
+    codes = [guest['code'] for kind in (ADDED, REMOVED) if kind in kinds for guest in changes[kind]]
+    codes += [entry['code'] for entry in changes['modified'] if set(entry['changes']) & set(kinds)]
+    return codes
+
+def cmd_diff(args):
+    try:
+        if args.new:
+            new_rows = read_guest_list(args.new)
+        else:
+            # Refreshes the snapshot, keeping the one it replaces as the previous version
+            new_rows = load_guest_rows(args.sheet)
+        old_path = args.old or previous_snapshot_path(args.sheet)
+        if not os.path.exists(old_path):
+            print(f"No previous version of the guest list ({old_path}); give the old sheet to compare with")
+            sys.exit(2)
+        old_rows = read_guest_list(old_path)
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        print(f"Error reading guest list: {e}")
+        sys.exit(2)
+
+    try:
+        changes = diff_guests(old_rows, new_rows)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(2)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(changes, f, ensure_ascii=False, indent=2)
+
+    if args.codes:
+        for code in changed_codes(changes, args.only):
+            print(code)
+        return
+
+    for guest in changes[ADDED]:
+        print(f"+ {guest['code']:<8} {guest['name']}")
+    for guest in changes[REMOVED]:
+        print(f"- {guest['code']:<8} {guest['name']}")
+    for entry in changes['modified']:
+        old, new = entry['old'], entry['new']
+        details = []
+        if RENAMED in entry['changes']:
+            details.append(f"name {old['name']!r} -> {new['name']!r}")
+        if TYPE_CHANGED in entry['changes']:
+            details.append(f"type {old['type']} -> {new['type']}")
+        if PHONE_CHANGED in entry['changes']:
+            details.append(f"phone {old['phone'] or 'none'} -> {new['phone'] or 'none'}")
+        print(f"~ {entry['code']:<8} {new['name']}: {', '.join(details)}")
+    print(f"{len(changes[ADDED])} added, {len(changes[REMOVED])} removed, {len(changes['modified'])} modified, "
+          f"{changes['unchanged']} unchanged (report: {args.report})")
+
+def cmd_lint(args):
+    try:
+        rows = read_sheet_rows(args.sheet)
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        print(f"Error reading spreadsheet: {e}")
+        sys.exit(2)
+
+    measure = load_name_measure(args.card)
+    issues = lint_rows(rows, measure)
+    errors = sum(1 for issue in issues if issue['severity'] == ERROR)
+    warnings = len(issues) - errors
+    report = {
+        'sheet': args.sheet,
+        'rows': len(rows),
+        'errors': errors,
+        'warnings': warnings,
+        'checked_name_width': measure is not None,
+        'issues': issues,
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        for issue in issues:
+            mark = "✗" if issue['severity'] == ERROR else "⚠️ "
+            print(f"{mark} row {issue['row']:<5} {issue['code'] or '-':<8} {issue['name'][:30]:<30} {issue['message']}")
+        if measure is None:
+            print("⚠️  Name widths not checked (needs Pillow and blank_invite.png)")
+        print(f"{len(rows)} rows: {errors} errors, {warnings} warnings (report: {args.report})")
+
+    if errors or (args.strict and warnings):
+        sys.exit(1)
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Checks for the guest spreadsheet')
+    parser.add_argument('--sheet', default=GUEST_SHEET, help=f'ODS file (default: {GUEST_SHEET})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    lint_parser = subparsers.add_parser('lint', help='Validate codes, phones, names and layout')
+    lint_parser.add_argument('--report', default=LINT_REPORT_FILE, help=f'Report file (default: {LINT_REPORT_FILE})')
+    lint_parser.add_argument('--card', default=BLANK_CARD, help=f'Blank card to measure names on (default: {BLANK_CARD})')
+    lint_parser.add_argument('--strict', action='store_true', help='Exit non-zero on warnings too')
+    lint_parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    dupes_parser = subparsers.add_parser('dupes', help='List guests that are probably listed twice')
+    dupes_parser.add_argument('--report', default=DUPLICATES_REPORT_FILE,
+                              help=f'Report file (default: {DUPLICATES_REPORT_FILE})')
+    dupes_parser.add_argument('--threshold', type=float, default=DEFAULT_DUPLICATE_THRESHOLD,
+                              help=f'Lowest score listed, 0 to 1 (default: {DEFAULT_DUPLICATE_THRESHOLD})')
+
+    diff_parser = subparsers.add_parser('diff', help='Show what changed between two versions of the guest list')
+    diff_parser.add_argument('old', nargs='?',
+                             help='Old version, .ods or snapshot (default: the version before the current sheet)')
+    diff_parser.add_argument('new', nargs='?', help='New version, .ods or snapshot (default: --sheet)')
+    diff_parser.add_argument('--report', default=CHANGES_FILE, help=f'Change set file (default: {CHANGES_FILE})')
+    diff_parser.add_argument('--codes', action='store_true', help='Print only the changed codes, one per line')
+    diff_parser.add_argument('--only', nargs='+', choices=CHANGE_KINDS, default=CHANGE_KINDS,
+                             help='Kinds of change to include with --codes (default: all)')
+
+    args = parser.parse_args()
+    {'lint': cmd_lint, 'dupes': cmd_dupes, 'diff': cmd_diff}[args.command](args)
+
+if __name__ == '__main__':
+    main()
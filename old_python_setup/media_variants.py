@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+WhatsApp delivery variants of the invitation cards
+The print-quality cards are ~2.3 MB PNGs. Twilio downloads the media for every
+message, so each card also gets a resized, recompressed JPEG capped in size,
+written flat to cards_whatsapp/{code}.jpg and served from /wa/{code}.jpg.
+
+Usage:
+  python3 media_variants.py                 # Build missing/outdated variants
+  python3 media_variants.py --warm          # Build, then warm the server cache
+  python3 media_variants.py --warm-only     # Only warm the server cache
+"""
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Pillow is only needed to build variants, not to warm the cache
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+from preflight import ConnectionPool
+from card_store import iter_aliases
+
+VARIANTS_DIR = "cards_whatsapp"
+MEDIA_BASE_URL = "http://46.62.209.58/wa"
+
+# Keep WhatsApp media small: fast for Twilio to fetch, still sharp on a phone
+MAX_SIDE = 1280
+MAX_BYTES = 300 * 1024
+START_QUALITY = 85
+MIN_QUALITY = 55
+
+def variant_path(code, variants_dir=VARIANTS_DIR):
+    """Local path of a card's delivery variant"""
+    return os.path.join(variants_dir, f"{code}.jpg")
+
+def make_whatsapp_variant(src_path, dst_path, max_side=MAX_SIDE, max_bytes=MAX_BYTES):
+    """Resize and recompress a card to a size-capped JPEG; returns the variant size in bytes"""
+    with Image.open(src_path) as img:
+        img = img.convert('RGB')
+        img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        # Lower the quality step by step until the variant fits the size cap
+        quality = START_QUALITY
+        while True:
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+            if buffer.tell() <= max_bytes or quality <= MIN_QUALITY:
+                break
+            quality -= 5
+
+    tmp_path = dst_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, dst_path)
+    return buffer.tell()
+
+def find_cards(cards_dir='cards'):
+    """Map code -> card PNG from the card store's per-code aliases"""
+    return {code: path for code, path in iter_aliases(cards_dir).items() if code.isdigit()}
+
+def _build_one(job):
+    code, src_path, dst_path = job
+    try:
+        return code, make_whatsapp_variant(src_path, dst_path), None
+    except Exception as e:
+        return code, None, str(e)
+
+def build_variants(cards, variants_dir=VARIANTS_DIR, force=False, workers=None):
+    """Build variants for cards whose variant is missing or older than the card"""
+    os.makedirs(variants_dir, exist_ok=True)
+    jobs = []
+    for code, src_path in sorted(cards.items()):
+        dst_path = variant_path(code, variants_dir)
+        if force or not os.path.exists(dst_path) or os.path.getmtime(dst_path) < os.path.getmtime(src_path):
+            jobs.append((code, src_path, dst_path))
+
+    built = 0
+    errors = 0
+    if jobs:
+        # Image encoding is CPU bound, so use processes
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for code, size, error in executor.map(_build_one, jobs, chunksize=4):
+                if error:
+                    errors += 1
+                    print(f"Error building variant for {code}: {error}")
+                else:
+                    built += 1
+    return built, len(cards) - len(jobs), errors
+
+def warm_cache(codes, base_url=MEDIA_BASE_URL, workers=16):
+    """Fetch every variant once so the server has it hot before the campaign"""
+    pool = ConnectionPool()
+
+    def fetch(code):
+        try:
+            return pool.request('GET', f"{base_url}/{code}.jpg").status
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warm") as executor:
+        statuses = list(executor.map(fetch, codes))
+    return sum(1 for status in statuses if status == 200), len(statuses)
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build WhatsApp delivery variants of the cards')
+    parser.add_argument('--cards-dir', default='cards', help='Generated cards (default: cards)')
+    parser.add_argument('--output-dir', default=VARIANTS_DIR, help=f'Variants directory (default: {VARIANTS_DIR})')
+    parser.add_argument('--force', action='store_true', help='Rebuild all variants')
+    parser.add_argument('--warm', action='store_true', help='Warm the server cache after building')
+    parser.add_argument('--warm-only', action='store_true', help='Only warm the server cache')
+    parser.add_argument('--base-url', default=MEDIA_BASE_URL, help=f'Variant base URL (default: {MEDIA_BASE_URL})')
+
+    args = parser.parse_args()
+
+    if not args.warm_only:
+        if not PIL_AVAILABLE:
+            print("Error: Pillow not installed. Install with: pip install Pillow")
+            sys.exit(1)
+        cards = find_cards(args.cards_dir)
+        start = time.monotonic()
+        built, unchanged, errors = build_variants(cards, args.output_dir, force=args.force)
+        print(f"Built {built} variants, {unchanged} up to date, {errors} errors ({time.monotonic() - start:.1f}s)")
+
+    if args.warm or args.warm_only:
+        codes = sorted(os.path.splitext(f)[0] for f in os.listdir(args.output_dir) if f.endswith('.jpg'))
+        start = time.monotonic()
+        ok, total = warm_cache(codes, args.base_url)
+        print(f"Warmed {ok}/{total} variants in {time.monotonic() - start:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Message manifest of the generated cards
+Every guest's WhatsApp and SMS text, card path and card hash are kept in one
+JSONL file (cards/manifest.jsonl, one line per code) instead of two small text
+files in each guest's folder. The message templates are compiled once and
+rendered for all guests in a batch; the senders and sms_encoding.py read the
+manifest. The card columns make it the code -> card index of card_store.py.
+
+Usage:
+  python3 message_manifest.py                  # Rebuild the messages of every guest in the sheet
+  python3 message_manifest.py --cards          # List "<code> <card path>"
+"""
+import json
+import os
+import string
+import sys
+
+from guest_snapshot import file_hash
+from card_store import object_digest, resolve
+
+MANIFEST_NAME = 'manifest.jsonl'
+MANIFEST_FILE = os.path.join('cards', MANIFEST_NAME)
+CHANNELS = ('whatsapp', 'sms')
+TEMPLATE_FILES = {'whatsapp': 'message_whatsapp.txt', 'sms': 'message_sms.txt'}
+DEFAULT_TEMPLATES = {
+    'whatsapp': "Mwaliko wa harusi ya George Laurent Sechu & Violet Titus Macha. Namba ya mwaliko *{code}*",
+    'sms': "Mwaliko wa harusi ya George Laurent Sechu & Violet Titus Macha. Namba ya mwaliko {code}",
+}
+# Guest fields a template may use
+TEMPLATE_FIELDS = ('code', 'name', 'type')
+
+def load_message_templates():
+    """Load message templates from files"""
+    templates = {}
+    for channel in CHANNELS:
+        try:
+            with open(TEMPLATE_FILES[channel], 'r', encoding='utf-8') as f:
+                templates[channel] = f.read().strip()
+        except FileNotFoundError:
+            print(f"Warning: {TEMPLATE_FILES[channel]} not found, using default")
+            templates[channel] = DEFAULT_TEMPLATES[channel]
+    return templates
+
+def compile_template(template):
+    """A render(guest) function for a str.format template, parsed once
+
+    Unknown fields raise ValueError here rather than a KeyError per guest.
+    """
+    parts = []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        if literal:
+            parts.append(literal)
+        if field is None:
+            continue
+        if field not in TEMPLATE_FIELDS:
+            raise ValueError(f"Unknown template field {{{field}}} (use {', '.join(TEMPLATE_FIELDS)})")
+        if spec or conversion:
+            # Rare enough to leave to str.format
+            parts.append((field, '{0' + (f'!{conversion}' if conversion else '') + (f':{spec}' if spec else '') + '}'))
+        else:
+            parts.append((field, None))
+
+    if all(isinstance(part, str) for part in parts):
+        text = ''.join(parts)
+        return lambda guest: text
+
+    def render(guest):
+        return ''.join(part if isinstance(part, str)
+                       else str(guest[part[0]]) if part[1] is None else part[1].format(guest[part[0]])
+                       for part in parts)
+    return render
+
+def compile_templates(templates):
+    """{channel: render(guest)} for {channel: template}"""
+    return {channel: compile_template(template) for channel, template in templates.items()}
+
+def manifest_entries(guests, templates, card_paths=None):
+    """Manifest lines for guests, rendering every channel's message
+
+    card_paths maps codes to the card each guest was rendered to; the card's
+    sha256 is taken from its name in the card store, or hashed for other files.
+    """
+    renderers = compile_templates(templates)
+    card_paths = card_paths or {}
+    entries = []
+    for guest in guests:
+        card = card_paths.get(guest['code'])
+        digest = card and (object_digest(card) or (file_hash(card) if os.path.exists(card) else None))
+        entry = {'code': guest['code'], 'name': guest['name'], 'type': guest['type'],
+                 'card': card, 'hash': digest or None}
+        for channel, render in renderers.items():
+            entry[channel] = render(guest)
+        entries.append(entry)
+    return entries
+
+def card_is_current(guest, entry):
+    """Whether a guest's card in the manifest exists and was rendered from its current name and type"""
+    rendered = entry and entry.get('rendered')
+    return bool(rendered and entry['card'] and os.path.exists(entry['card'])
+                and ' '.join(rendered['name'].split()) == ' '.join(guest['name'].split())
+                and rendered['type'] == guest['type'])
+
+def load_manifest(path=MANIFEST_FILE):
+    """{code: entry} from the manifest; empty when there is none yet"""
+    entries = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry['code']] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+def write_manifest(entries, path=MANIFEST_FILE):
+    """Replace the manifest with {code: entry}, sorted by code"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for code in sorted(entries):
+            f.write(json.dumps(entries[code], ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+
+def update_manifest(entries, removed=(), path=MANIFEST_FILE):
+    """Add or replace entries and drop the codes in removed; returns the whole manifest"""
+    manifest = load_manifest(path)
+    for code in removed:
+        manifest.pop(code, None)
+    for entry in entries:
+        previous = manifest.get(entry['code'])
+        if entry['card'] is None and previous:
+            # Messages rebuilt without rendering keep the existing card
+            entry = dict(entry, card=previous['card'], hash=previous['hash'])
+        if previous and previous.get('rendered') and entry['card'] == previous['card']:
+            # Same card, even if the name or type changed since it was rendered
+            entry = dict(entry, rendered=previous['rendered'])
+        elif entry['card']:
+            entry = dict(entry, rendered={'name': entry['name'], 'type': entry['type']})
+        manifest[entry['code']] = entry
+    write_manifest(manifest, path)
+    return manifest
+
+def main():
+    """Main function"""
+    import argparse
+    from ods_reader import GUEST_SHEET
+    from guest_snapshot import load_guest_rows
+    from guest_normalize import normalize_guests
+
+    parser = argparse.ArgumentParser(description='Rebuild or list the message manifest of the generated cards')
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help=f'Manifest file (default: {MANIFEST_FILE})')
+    parser.add_argument('--cards', action='store_true', help='List "<code> <card path>" for every card and exit')
+    args = parser.parse_args()
+
+    if args.cards:
+        for code, entry in sorted(load_manifest(args.manifest).items()):
+            if entry['card']:
+                print(f"{code} {entry['card']}")
+        return
+
+    guests, _ = normalize_guests(load_guest_rows(GUEST_SHEET))
+    # Cards already in the card store
+    card_paths = {guest['code']: resolve(guest['code']) for guest in guests}
+    try:
+        entries = manifest_entries(guests, load_message_templates(), card_paths)
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+    previous = load_manifest(args.manifest)
+    removed = set(previous) - {guest['code'] for guest in guests}
+    manifest = update_manifest(entries, removed, args.manifest)
+    print(f"✓ Wrote the messages of {len(entries)} guests to {args.manifest} "
+          f"({sum(1 for entry in manifest.values() if entry['card'])} with cards, {len(removed)} removed)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Twilio Messages API and the sms.co.tz api.php endpoint
+Used to load-test the senders without sending real messages or spending credit.
+
+Usage:
+  python3 mock_provider_server.py --port 8765 --latency-ms 150 --error-rate 0.02 --throttle-rps 50
+
+Point the senders at it:
+  WhatsApp: http://127.0.0.1:8765 as the Twilio API base URL
+  SMS:      http://127.0.0.1:8765/api.php
+"""
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TWILIO_MESSAGES_PATH = re.compile(r'^/2010-04-01/Accounts/([^/]+)/Messages\.json$')
+
+class ProviderBehaviour:
+    """Latency, failure and throttling settings shared by all request handlers"""
+
+    def __init__(self, latency_ms=100.0, latency_jitter_ms=50.0, error_rate=0.0,
+                 permanent_error_rate=0.0, throttle_rps=0.0, balance=100000, seed=None):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.throttle_rps = throttle_rps
+        self.balance = balance
+        self.random = random.Random(seed)
+
+        self.counts = {'requests': 0, 'accepted': 0, 'throttled': 0, 'errors': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def delay(self):
+        """Simulate provider processing time"""
+        with self._lock:
+            latency = self.random.gauss(self.latency_ms, self.latency_jitter_ms)
+        time.sleep(max(0.0, latency) / 1000.0)
+
+    def outcome(self):
+        """Decide what happens to a request: accepted, throttled, error (transient) or rejected (permanent)"""
+        with self._lock:
+            self.counts['requests'] += 1
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+
+            if self.throttle_rps and self._window_count > self.throttle_rps:
+                result = 'throttled'
+            else:
+                roll = self.random.random()
+                if roll < self.permanent_error_rate:
+                    result = 'rejected'
+                elif roll < self.permanent_error_rate + self.error_rate:
+                    result = 'errors'
+                else:
+                    result = 'accepted'
+            self.counts[result] += 1
+            return result
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this Nagle stalls kept-alive connections
+    disable_nagle_algorithm = True
+    behaviour = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        match = TWILIO_MESSAGES_PATH.match(urllib.parse.urlparse(self.path).path)
+        length = int(self.headers.get('Content-Length') or 0)
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+        if not match:
+            return self._send(404, json.dumps({'code': 20404, 'message': 'Not found', 'status': 404}))
+
+        behaviour = self.behaviour
+        behaviour.delay()
+        outcome = behaviour.outcome()
+        if outcome == 'throttled':
+            return self._send(429, json.dumps({'code': 20429, 'message': 'Too Many Requests', 'status': 429}),
+                              headers={'Retry-After': '1'})
+        if outcome == 'errors':
+            return self._send(503, json.dumps({'code': 20503, 'message': 'Service unavailable', 'status': 503}))
+        if outcome == 'rejected':
+            return self._send(400, json.dumps({
+                'code': 63003,
+                'message': 'Channel could not find To address',
+                'status': 400
+            }))
+
+        sid = 'SM' + uuid.uuid4().hex
+        self._send(201, json.dumps({
+            'sid': sid,
+            'account_sid': match.group(1),
+            'status': 'queued',
+            'to': form.get('To', [None])[0],
+            'from': form.get('From', [None])[0],
+            'body': form.get('Body', [''])[0],
+            'num_segments': '1',
+            'direction': 'outbound-api',
+            'date_created': time.strftime('%a, %d %b %Y %H:%M:%S +0000', time.gmtime()),
+            'uri': f"/2010-04-01/Accounts/{match.group(1)}/Messages/{sid}.json"
+        }))
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/api.php':
+            return self._send(404, 'Not found', 'text/plain')
+
+        params = urllib.parse.parse_qs(url.query)
+        action = params.get('do', [''])[0]
+        behaviour = self.behaviour
+        behaviour.delay()
+
+        if action == 'balance':
+            return self._send(200, f"OK: {behaviour.balance}", 'text/plain')
+        if action == 'senderids':
+            return self._send(200, "OK: SMS.co.tz", 'text/plain')
+        if action != 'sms':
+            return self._send(200, "ERR: Unknown action", 'text/plain')
+
+        outcome = behaviour.outcome()
+        if outcome == 'throttled':
+            return self._send(429, "ERR: Too many requests", 'text/plain', headers={'Retry-After': '1'})
+        if outcome == 'errors':
+            return self._send(503, "ERR: Service busy, try again", 'text/plain')
+        if outcome == 'rejected':
+            return self._send(200, "ERR: Invalid destination", 'text/plain')
+
+        recipients = params.get('dest', [''])[0].split(',')
+        behaviour.balance -= len(recipients)
+        self._send(200, f"OK: {uuid.uuid4().int % 10**9}", 'text/plain')
+
+def start_server(behaviour, host='127.0.0.1', port=0):
+    """Start the mock server in a background thread; returns (server, base_url)"""
+    handler = type('BoundProviderHandler', (ProviderHandler,), {'behaviour': behaviour})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Mock Twilio and sms.co.tz API server for load testing')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port (default: 8765)')
+    parser.add_argument('--latency-ms', type=float, default=100.0, help='Mean response latency (default: 100)')
+    parser.add_argument('--latency-jitter-ms', type=float, default=50.0, help='Latency std deviation (default: 50)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of transient 503 errors')
+    parser.add_argument('--permanent-error-rate', type=float, default=0.0,
+                        help='Fraction of permanent errors (not on WhatsApp / invalid destination)')
+    parser.add_argument('--throttle-rps', type=float, default=0.0,
+                        help='Requests per second before answering 429 (0 = never)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+
+    args = parser.parse_args()
+
+    behaviour = ProviderBehaviour(args.latency_ms, args.latency_jitter_ms, args.error_rate,
+                                  args.permanent_error_rate, args.throttle_rps, seed=args.seed)
+    server, base_url = start_server(behaviour, args.host, args.port)
+    print(f"Mock provider listening on {base_url}")
+    print(f"  Twilio: {base_url}/2010-04-01/Accounts/<sid>/Messages.json")
+    print(f"  SMS:    {base_url}/api.php")
+    print("Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"\nRequests: {json.dumps(behaviour.counts)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Streaming reader for the guest spreadsheet (wedding_invites.ods)
+Parses content.xml straight from the zip with iterparse, one row at a time,
+and clears every row once read, so memory stays flat however long the sheet.
+Repeated cells (table:number-columns-repeated) keep later columns in place,
+and runs of empty rows or columns (often repeated a million times at the end
+of a sheet) are skipped without being expanded.
+
+Usage:
+  python3 ods_reader.py [wedding_invites.ods] [--raw]
+"""
+import zipfile
+import xml.etree.ElementTree as ET
+
+GUEST_SHEET = "wedding_invites.ods"
+
+TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+OFFICE_NS = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+
+TABLE = f"{{{TABLE_NS}}}table"
+ROW = f"{{{TABLE_NS}}}table-row"
+CELL = f"{{{TABLE_NS}}}table-cell"
+COVERED_CELL = f"{{{TABLE_NS}}}covered-table-cell"
+PARAGRAPH = f"{{{TEXT_NS}}}p"
+SPACES = f"{{{TEXT_NS}}}s"
+TAB = f"{{{TEXT_NS}}}tab"
+LINE_BREAK = f"{{{TEXT_NS}}}line-break"
+ROWS_REPEATED = f"{{{TABLE_NS}}}number-rows-repeated"
+COLUMNS_REPEATED = f"{{{TABLE_NS}}}number-columns-repeated"
+VALUE_TYPE = f"{{{OFFICE_NS}}}value-type"
+VALUE = f"{{{OFFICE_NS}}}value"
+
+# Columns of the guest sheet: A name, B Single/Double, C phone, D code
+GUEST_COLUMNS = ('name', 'type', 'phone', 'code')
+
+def _paragraph_text(element):
+    """Text of a text:p, with text:s runs of spaces, tabs and line breaks"""
+    parts = [element.text or '']
+    for child in element:
+        if child.tag == SPACES:
+            parts.append(' ' * int(child.get(f"{{{TEXT_NS}}}c", 1)))
+        elif child.tag == TAB:
+            parts.append('\t')
+        elif child.tag == LINE_BREAK:
+            parts.append('\n')
+        else:
+            # Spans, links and other inline markup
+            parts.append(_paragraph_text(child))
+        parts.append(child.tail or '')
+    return ''.join(parts)
+
+def cell_value(cell):
+    """A cell's value as a string ('' when empty)"""
+    if cell.get(VALUE_TYPE) in ('float', 'percentage', 'currency'):
+        # The stored number, not its display format: 8982 rather than 8,982.00
+        value = cell.get(VALUE)
+        if value is not None:
+            number = float(value)
+            return str(int(number)) if number.is_integer() else value
+    # Direct paragraphs only: comments (office:annotation) have their own
+    return '\n'.join(_paragraph_text(p) for p in cell.findall(PARAGRAPH))
+
+def _row_values(row, max_columns):
+    values = []
+    # Empty cells are only written out when a filled one follows them
+    pending_blanks = 0
+    for cell in row:
+        if cell.tag not in (CELL, COVERED_CELL):
+            continue
+        repeat = int(cell.get(COLUMNS_REPEATED, 1))
+        value = cell_value(cell)
+        if not value:
+            pending_blanks += repeat
+        else:
+            values.extend([''] * pending_blanks)
+            values.extend([value] * repeat)
+            pending_blanks = 0
+        if max_columns and len(values) + pending_blanks >= max_columns:
+            break
+    return values[:max_columns] if max_columns else values
+
+def iter_rows(path=GUEST_SHEET, sheet=0, max_columns=None):
+    """Yield (row_number, values) for every non-empty row of a sheet (by index or name)
+
+    Row numbers are 1-based as shown in LibreOffice, counting repeated rows.
+    Trailing empty cells are dropped, so rows can be shorter than the sheet.
+    """
+    with zipfile.ZipFile(path, 'r') as z, z.open('content.xml') as content:
+        tables = -1
+        in_sheet = False
+        row_number = 0
+        # Open elements, so finished rows can be removed from their parent
+        stack = []
+        for event, element in ET.iterparse(content, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element)
+                if element.tag == TABLE:
+                    tables += 1
+                    in_sheet = sheet == tables or sheet == element.get(f"{{{TABLE_NS}}}name")
+                continue
+
+            stack.pop()
+            if element.tag == TABLE and in_sheet:
+                return
+            if element.tag != ROW:
+                continue
+            if in_sheet:
+                repeat = int(element.get(ROWS_REPEATED, 1))
+                values = _row_values(element, max_columns)
+                if values:
+                    for _ in range(repeat):
+                        row_number += 1
+                        yield row_number, values
+                else:
+                    row_number += repeat
+            element.clear()
+            if stack:
+                stack[-1].remove(element)
+
+def iter_guest_rows(path=GUEST_SHEET, header=True):
+    """Yield {'name', 'type', 'phone', 'code'} for each row that has a name and a code
+
+    Values are the raw cell text; the first row is the header unless `header`
+    is False. Type defaults to Single and a missing phone is None.
+    """
+    for row_number, values in iter_rows(path, max_columns=len(GUEST_COLUMNS)):
+        if header and row_number == 1:
+            continue
+        name, single_double, phone, code = values + [''] * (len(GUEST_COLUMNS) - len(values))
+        if name.strip() and code.strip():
+            yield {'name': name, 'type': single_double or 'Single', 'phone': phone or None, 'code': code.strip()}
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Print the rows of the guest spreadsheet')
+    parser.add_argument('path', nargs='?', default=GUEST_SHEET, help=f'ODS file (default: {GUEST_SHEET})')
+    parser.add_argument('--raw', action='store_true', help='Print every non-empty row instead of the guests')
+    args = parser.parse_args()
+
+    if args.raw:
+        for row_number, values in iter_rows(args.path):
+            print(f"{row_number:>6}: {values}")
+        return
+
+    count = 0
+    for guest in iter_guest_rows(args.path):
+        count += 1
+        print(f"{guest['name']:<40} {guest['type']:<8} {guest['phone'] or 'N/A':<15} {guest['code']}")
+    print(f"\n{count} guests")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Shared campaign outbox for sending from several processes on one machine
+Guests are queued once in a SQLite outbox. Each worker claims a batch under a
+time-limited lease, heartbeats while it sends, and marks every guest sent or
+failed. A guest is marked 'sending' right before its message goes out, so when
+a worker dies its untouched guests are requeued for others, while guests it
+may already have messaged become 'in_doubt' instead of being sent twice.
+SQLite's WAL mode relies on shared memory, so the outbox file must stay on a
+local disk and every worker must run on the machine that created it.
+
+Usage:
+  python3 outbox.py enqueue                  # Queue every guest with a phone number
+  python3 outbox.py work [--batch-size 50]   # Run a worker (start as many as you like)
+  python3 outbox.py status
+  python3 outbox.py report                   # Failure report of all workers
+  python3 outbox.py requeue --in-doubt       # After checking the log, retry in-doubt guests
+"""
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from retry_scheduler import UNKNOWN
+
+OUTBOX_FILE = "campaign_outbox.sqlite"
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_LEASE_SECONDS = 60
+
+QUEUED = "queued"
+LEASED = "leased"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+IN_DOUBT = "in_doubt"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    code TEXT PRIMARY KEY,
+    name TEXT,
+    type TEXT,
+    phone TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    lease_id TEXT,
+    worker TEXT,
+    lease_expires REAL,
+    channel TEXT,
+    message_id TEXT,
+    error TEXT,
+    error_class TEXT,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS outbox_status ON outbox (status);
+CREATE INDEX IF NOT EXISTS outbox_lease ON outbox (lease_id);
+CREATE TABLE IF NOT EXISTS outbox_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+def connect(path=OUTBOX_FILE):
+    """Open the outbox; WAL lets workers read while another one writes (on one machine only)"""
+    db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA busy_timeout=30000")
+    db.executescript(SCHEMA)
+    columns = {row[1] for row in db.execute("PRAGMA table_info(outbox)")}
+    if 'error_class' not in columns:
+        # Outboxes created before failures kept their classification
+        db.execute("ALTER TABLE outbox ADD COLUMN error_class TEXT")
+    return db
+
+class Outbox:
+    """Queue of guests shared by all workers of a campaign"""
+
+    def __init__(self, path=OUTBOX_FILE, clock=time.time, host=None):
+        self.path = path
+        self.clock = clock
+        self.db = connect(path)
+        self.host = host or socket.gethostname()
+        try:
+            self._check_host()
+        except BaseException:
+            self.db.close()
+            raise
+
+    def _check_host(self):
+        # WAL's shared memory does not work across machines (NFS, SMB): two hosts could claim the same lease
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO outbox_meta (key, value) VALUES ('host', ?)", (self.host,))
+        owner, = self.db.execute("SELECT value FROM outbox_meta WHERE key = 'host'").fetchone()
+        if owner != self.host:
+            raise RuntimeError(f"{self.path} belongs to workers on {owner}; SQLite cannot be shared between "
+                               f"machines, run every worker on {owner}")
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, guests):
+        """Queue guests that are not in the outbox yet; returns how many were added"""
+        now = self.clock()
+        before = self.db.total_changes
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO outbox (code, name, type, phone, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(g['code'], g['name'], g['type'], g['phone'], QUEUED, now) for g in guests if g['phone']]
+            )
+        return self.db.total_changes - before
+
+    def reclaim_expired(self):
+        """Requeue guests of dead workers; guests that were mid-send become in doubt"""
+        now = self.clock()
+        requeued = self.db.execute(
+            "UPDATE outbox SET status = ?, lease_id = NULL, worker = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_expires < ?", (QUEUED, now, LEASED, now)).rowcount
+        in_doubt = self.db.execute(
+            "UPDATE outbox SET status = ?, lease_id = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_expires < ?", (IN_DOUBT, now, SENDING, now)).rowcount
+        return requeued, in_doubt
+
+    def claim(self, worker, batch_size=DEFAULT_BATCH_SIZE, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Lease up to batch_size queued guests; returns (lease_id, guests)"""
+        lease_id = uuid.uuid4().hex
+        # IMMEDIATE takes the write lock up front, so two workers never claim the same rows
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.reclaim_expired()
+            now = self.clock()
+            rows = self.db.execute(
+                "SELECT code FROM outbox WHERE status = ? ORDER BY rowid LIMIT ?", (QUEUED, batch_size)).fetchall()
+            codes = [code for code, in rows]
+            self.db.executemany(
+                "UPDATE outbox SET status = ?, lease_id = ?, worker = ?, lease_expires = ?, updated_at = ? "
+                "WHERE code = ?", [(LEASED, lease_id, worker, now + lease_seconds, now, code) for code in codes])
+            self.db.execute("COMMIT")
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        return lease_id, self.guests(lease_id)
+
+    def guests(self, lease_id=None):
+        """Guests of a lease, or every guest in the outbox"""
+        if lease_id is None:
+            rows = self.db.execute("SELECT name, type, phone, code FROM outbox ORDER BY rowid").fetchall()
+        else:
+            rows = self.db.execute(
+                "SELECT name, type, phone, code FROM outbox WHERE lease_id = ? ORDER BY rowid", (lease_id,)).fetchall()
+        return [{'name': name, 'type': type_, 'phone': phone, 'code': code} for name, type_, phone, code in rows]
+
+    def heartbeat(self, lease_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        """Extend a lease; returns how many guests it still holds (0 = lost)"""
+        now = self.clock()
+        with self.db:
+            return self.db.execute(
+                "UPDATE outbox SET lease_expires = ? WHERE lease_id = ? AND status IN (?, ?) AND lease_expires >= ?",
+                (now + lease_seconds, lease_id, LEASED, SENDING, now)).rowcount
+
+    def mark_sending(self, lease_id, code, channel):
+        """Claim the right to message a guest now; False if the lease no longer covers it"""
+        now = self.clock()
+        with self.db:
+            return self.db.execute(
+                "UPDATE outbox SET status = ?, channel = ?, updated_at = ? "
+                "WHERE code = ? AND lease_id = ? AND status IN (?, ?) AND lease_expires >= ?",
+                (SENDING, channel, now, code, lease_id, LEASED, SENDING, now)).rowcount == 1
+
+    def complete(self, lease_id, code, status, channel=None, message_id=None, error=None, error_class=None):
+        """Record the outcome for a guest of this lease"""
+        with self.db:
+            self.db.execute(
+                "UPDATE outbox SET status = ?, channel = ?, message_id = ?, error = ?, error_class = ?, "
+                "lease_id = NULL, lease_expires = NULL, updated_at = ? WHERE code = ? AND lease_id = ?",
+                (status, channel, message_id, error, error_class, self.clock(), code, lease_id))
+
+    def release(self, lease_id):
+        """Give back guests of a lease that were not sent to yet"""
+        with self.db:
+            return self.db.execute(
+                "UPDATE outbox SET status = ?, lease_id = NULL, worker = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE lease_id = ? AND status = ?", (QUEUED, self.clock(), lease_id, LEASED)).rowcount
+
+    def requeue(self, statuses):
+        """Put guests with the given statuses back in the queue"""
+        marks = ', '.join('?' for _ in statuses)
+        with self.db:
+            return self.db.execute(
+                f"UPDATE outbox SET status = ?, lease_id = NULL, worker = NULL, lease_expires = NULL, error = NULL, "
+                f"error_class = NULL, updated_at = ? WHERE status IN ({marks})", (QUEUED, self.clock(), *statuses)).rowcount
+
+    def failures(self):
+        """Failed and in-doubt guests of every worker, as rows for write_failure_report"""
+        rows = self.db.execute(
+            "SELECT name, phone, code, channel, status, error_class, error FROM outbox WHERE status IN (?, ?) "
+            "ORDER BY rowid", (FAILED, IN_DOUBT)).fetchall()
+        # Guests left mid-send by a dead worker have no classification of their own
+        return [{'name': name, 'phone': phone, 'code': code, 'channel': channel,
+                 'classification': error_class or (UNKNOWN if status == IN_DOUBT else None),
+                 'reason': status, 'error': error}
+                for name, phone, code, channel, status, error_class, error in rows]
+
+    def pending(self):
+        """Guests not sent to or failed yet"""
+        rows = self.db.execute(
+            "SELECT name, type, phone, code FROM outbox WHERE status IN (?, ?, ?) ORDER BY rowid",
+            (QUEUED, LEASED, SENDING)).fetchall()
+        return [{'name': name, 'type': type_, 'phone': phone, 'code': code} for name, type_, phone, code in rows]
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+
+    def active_leases(self):
+        """Workers currently holding guests, as {worker: (guests, seconds left)}"""
+        rows = self.db.execute(
+            "SELECT worker, COUNT(*), MIN(lease_expires) FROM outbox WHERE status IN (?, ?) GROUP BY worker",
+            (LEASED, SENDING)).fetchall()
+        return {worker: (count, expires - self.clock()) for worker, count, expires in rows}
+
+class Lease:
+    """One claimed batch: heartbeats in the background and tracks progress for send_messages"""
+
+    def __init__(self, outbox_path, lease_id, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.outbox_path = outbox_path
+        self.lease_id = lease_id
+        self.lease_seconds = lease_seconds
+        self.outbox = Outbox(outbox_path)
+        self.size = len(self.outbox.guests(lease_id))
+        # Codes with an outcome: complete() drops them from the lease, so they no longer count as held
+        self.finished = set()
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._heartbeat, name="lease-heartbeat", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.outbox.release(self.lease_id)
+        self.outbox.close()
+
+    def _heartbeat(self):
+        # The heartbeat thread needs its own connection
+        outbox = Outbox(self.outbox_path)
+        try:
+            while not self._stop.wait(self.lease_seconds / 3):
+                if not outbox.heartbeat(self.lease_id, self.lease_seconds):
+                    if self.done():
+                        # Every guest of the batch has an outcome: nothing left to hold
+                        return
+                    self.lost = True
+                    print("⚠️  Lease lost, no further guests of this batch will be sent")
+                    return
+        finally:
+            outbox.close()
+
+    def done(self):
+        """Whether every guest of the batch is sent or failed"""
+        return len(self.finished) >= self.size
+
+    def _finish(self, code):
+        self.finished.add(code)
+        if self.done():
+            self._stop.set()
+
+    # Progress interface used by send_messages
+
+    def __contains__(self, code):
+        return False
+
+    def sending(self, code, channel):
+        return not self.lost and self.outbox.mark_sending(self.lease_id, code, channel)
+
+    def record(self, code, channel, message_id=None):
+        self.outbox.complete(self.lease_id, code, SENT, channel, message_id)
+        self._finish(code)
+
+    def failed(self, code, channel, error, classification=None):
+        # The message may have gone out: check the log before requeueing
+        status = IN_DOUBT if classification == UNKNOWN else FAILED
+        self.outbox.complete(self.lease_id, code, status, channel, error=error, error_class=classification)
+        self._finish(code)
+
+def refresh_sms_balance(transport):
+    """Update the SMS credit guard from the provider between batches; other workers spend from it too"""
+    from sms_client import SmsApiError, parse_balance
+
+    try:
+        transport.credit_guard.update(parse_balance(transport.client.balance()))
+    except (SmsApiError, OSError, ValueError) as e:
+        print(f"⚠️  Could not refresh the SMS balance ({e}), keeping the running count")
+
+def run_worker(outbox_path, transports, send_options, worker=None, batch_size=DEFAULT_BATCH_SIZE,
+               lease_seconds=DEFAULT_LEASE_SECONDS, sms_min_balance=0):
+    """Claim and send batches until the outbox has nothing left for this worker
+
+    Failures are recorded in the outbox rather than a report per batch; write
+    the report of all workers with Outbox.failures(). As in send_cards_twilio.py,
+    the SMS balance is checked before the first claim and guarded while sending.
+    """
+    from send_cards_twilio import send_messages, check_sms_account
+    from transports import WHATSAPP, SMS
+
+    worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+    outbox = Outbox(outbox_path)
+    batches = 0
+    sms = None if send_options.get('dry_run') else transports.get(SMS)
+    try:
+        if sms is not None and not check_sms_account(sms, outbox.pending(), send_options.get('primary', WHATSAPP),
+                                                     sms_min_balance):
+            return batches
+        while True:
+            lease_id, guests = outbox.claim(worker, batch_size, lease_seconds)
+            if not guests:
+                # Others may still hold leases that could expire and come back
+                leases = outbox.active_leases()
+                if not leases:
+                    break
+                wait = max(1.0, min(seconds for _, seconds in leases.values()))
+                print(f"Nothing queued, {sum(n for n, _ in leases.values())} guests leased by other workers; "
+                      f"checking again in {wait:.0f}s")
+                time.sleep(min(wait, lease_seconds))
+                continue
+
+            batches += 1
+            print(f"\n[{worker}] Batch {batches}: {len(guests)} guests (lease {lease_id[:8]})")
+            if sms is not None and sms.credit_guard is not None and batches > 1:
+                refresh_sms_balance(sms)
+            with Lease(outbox_path, lease_id, lease_seconds) as lease:
+                send_messages(guests, transports, progress=lease, report_file=None, **send_options)
+    finally:
+        outbox.close()
+    return batches
+
+def print_status(outbox):
+    counts = outbox.counts()
+    total = sum(counts.values())
+    print("\n" + "="*80)
+    print(f"OUTBOX ({outbox.path})")
+    print("="*80)
+    for status in (QUEUED, LEASED, SENDING, SENT, FAILED, IN_DOUBT):
+        print(f"{status:<10} {counts.get(status, 0):>6}")
+    print(f"{'total':<10} {total:>6}")
+    leases = outbox.active_leases()
+    if leases:
+        print("\nActive workers:")
+        for worker, (count, seconds) in leases.items():
+            print(f"  {worker}: {count} guests, lease expires in {seconds:.0f}s")
+    if counts.get(IN_DOUBT):
+        print(f"\n⚠️  {counts[IN_DOUBT]} guests may or may not have been messaged by a worker that died.")
+        print("   Check twilio_send_log.jsonl, then: python3 outbox.py requeue --in-doubt")
+    print("="*80)
+
+def main():
+    """Main function"""
+    import argparse
+    from send_cards_twilio import read_spreadsheet, build_transports, MEDIA_WHATSAPP, MEDIA_ORIGINAL
+    from send_cards_twilio import TWILIO_MEDIA_TEMPLATE_ID, SMS_DEFAULT_SENDER_ID, FAILURE_REPORT_FILE
+    from retry_scheduler import write_failure_report
+    from transports import WHATSAPP, SMS
+
+    parser = argparse.ArgumentParser(description='Shared outbox for sending a campaign from several workers')
+    parser.add_argument('--outbox', default=OUTBOX_FILE, help=f'Outbox database (default: {OUTBOX_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('enqueue', help='Queue every guest with a phone number')
+    subparsers.add_parser('status', help='Show outbox counts and active workers')
+
+    report_parser = subparsers.add_parser('report', help='Write the failed and in-doubt guests of all workers')
+    report_parser.add_argument('--report-file', default=FAILURE_REPORT_FILE,
+                               help=f'Failure report (default: {FAILURE_REPORT_FILE})')
+
+    requeue_parser = subparsers.add_parser('requeue', help='Queue failed or in-doubt guests again')
+    requeue_parser.add_argument('--in-doubt', action='store_true', help='Requeue in-doubt guests')
+    requeue_parser.add_argument('--failed', action='store_true', help='Requeue failed guests')
+
+    work_parser = subparsers.add_parser('work', help='Claim batches and send them')
+    work_parser.add_argument('--worker-id', help='Name of this worker (default: host-pid)')
+    work_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                             help=f'Guests per lease (default: {DEFAULT_BATCH_SIZE})')
+    work_parser.add_argument('--lease-seconds', type=float, default=DEFAULT_LEASE_SECONDS,
+                             help=f'Lease length, renewed every third of it (default: {DEFAULT_LEASE_SECONDS})')
+    work_parser.add_argument('--channel', choices=[WHATSAPP, SMS], default=WHATSAPP, help='Primary channel')
+    work_parser.add_argument('--no-fallback', action='store_true', help='Do not fall back to SMS')
+    work_parser.add_argument('--media', choices=[MEDIA_WHATSAPP, MEDIA_ORIGINAL],
+                             default=MEDIA_WHATSAPP if TWILIO_MEDIA_TEMPLATE_ID else MEDIA_ORIGINAL,
+                             help='Card sent on WhatsApp (see send_cards_twilio.py --media)')
+    work_parser.add_argument('--sms-min-balance', type=float, default=0,
+                             help='SMS credits to keep in the account; sending stops before going below (default: 0)')
+    work_parser.add_argument('--report-file', default=FAILURE_REPORT_FILE,
+                             help=f'Failure report of all workers, written when this one finishes '
+                                  f'(default: {FAILURE_REPORT_FILE})')
+
+    args = parser.parse_args()
+    try:
+        outbox = Outbox(args.outbox)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    if args.command == 'enqueue':
+        guests = read_spreadsheet()
+        added = outbox.enqueue(guests)
+        print(f"Queued {added} new guests ({sum(1 for g in guests if not g['phone'])} without phone skipped)")
+        print_status(outbox)
+    elif args.command == 'status':
+        print_status(outbox)
+    elif args.command == 'report':
+        failures = outbox.failures()
+        write_failure_report(failures, args.report_file)
+        print(f"Wrote {len(failures)} failed or in-doubt guests to {args.report_file}")
+    elif args.command == 'requeue':
+        statuses = ([IN_DOUBT] if args.in_doubt else []) + ([FAILED] if args.failed else [])
+        if not statuses:
+            print("Nothing to requeue: pass --in-doubt and/or --failed")
+            sys.exit(1)
+        print(f"Requeued {outbox.requeue(statuses)} guests")
+    elif args.command == 'work':
+        twilio_account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+        twilio_auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+        from_number = os.environ.get('TWILIO_FROM_NUMBER')
+        sms_username = os.environ.get('SMS_USERNAME')
+        sms_password = os.environ.get('SMS_PASSWORD')
+        if args.channel == WHATSAPP and not (twilio_account_sid and twilio_auth_token and from_number):
+            print("Error: set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN and TWILIO_FROM_NUMBER")
+            sys.exit(1)
+        if args.channel == SMS and not (sms_username and sms_password):
+            print("Error: set SMS_USERNAME and SMS_PASSWORD")
+            sys.exit(1)
+
+        sms_sender_id = os.environ.get('SMS_SENDER_ID') or SMS_DEFAULT_SENDER_ID
+        transports = build_transports(outbox.guests(), twilio_account_sid, twilio_auth_token, from_number,
+                                      primary=args.channel, sms_username=sms_username, sms_password=sms_password,
+                                      sms_sender_id=sms_sender_id, media=args.media)
+        send_options = dict(primary=args.channel, fallback=None if args.no_fallback else SMS, media=args.media)
+        batches = run_worker(args.outbox, transports, send_options, args.worker_id, args.batch_size,
+                             args.lease_seconds, args.sms_min_balance)
+        print(f"\nWorker finished after {batches} batches")
+        print_status(outbox)
+        failures = outbox.failures()
+        if failures:
+            # Everything the outbox knows so far, so the last worker to finish writes the complete report
+            write_failure_report(failures, args.report_file)
+            print(f"Failure report: {args.report_file}")
+    outbox.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Render, publish and send invitation cards in one pipelined run
+Instead of generating every card, then syncing, then sending, each guest moves
+through the stages on its own: cards are rendered in a process pool, uploaded
+to the card server in small rsync batches, checked over HTTP, and handed to the
+sender as soon as they are served. The first messages go out within seconds.
+
+Usage:
+  python3 pipeline.py --dry-run                # Render only, simulate the rest
+  python3 pipeline.py --campaign invites       # Render, publish and send
+"""
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from generate_cards_and_messages import generate_guest_files, current_card
+from card_store import alias_path
+from message_manifest import load_message_templates, manifest_entries, update_manifest, load_manifest
+from media_variants import variant_path, MAX_BYTES as MEDIA_MAX_BYTES
+from preflight import ConnectionPool, check_url, MAX_MEDIA_BYTES
+from send_cards_twilio import (read_spreadsheet, build_transports, send_messages, check_sms_account, card_url,
+                               media_url, TWILIO_MEDIA_TEMPLATE_ID, MEDIA_WHATSAPP, MEDIA_ORIGINAL,
+                               FAILURE_REPORT_FILE)
+from campaign import CampaignProgress, PROGRESS_FILE
+from transports import WHATSAPP, SMS
+
+# Card server (same layout as server/sync_cards.sh)
+SERVER = "root@46.62.209.58"
+REMOTE_DIR = "/opt/wedding/cards"
+REMOTE_WA_DIR = "/opt/wedding/cards_wa"
+
+DEFAULT_PUBLISH_BATCH = 20
+DEFAULT_PUBLISH_INTERVAL = 2.0  # seconds a partial batch may wait
+
+def render_guest(guest, cards_dir='cards', force=False, entry=None):
+    """Render one guest's files; returns (guest, card_path, error)
+
+    The card is kept when its manifest entry shows it was rendered from the
+    guest's current name and type (and the WhatsApp variant exists), unless forced.
+    """
+    card_path = current_card(guest, entry, cards_dir)
+    if not force and card_path and os.path.exists(variant_path(guest['code'])):
+        return guest, card_path, None
+    try:
+        card_path = generate_guest_files(guest['name'], guest['type'], guest['code'], cards_dir)
+    except Exception as e:
+        return guest, None, str(e)
+    return guest, card_path, None if card_path else "Card generation failed"
+
+def rsync_store(paths, destination, store_dir='cards'):
+    """Upload card store files (objects and their aliases) into the same layout on the server"""
+    result = subprocess.run(
+        ['rsync', '-az', '--files-from=-', '--chown=www-data:www-data', '--chmod=D755,F644',
+         f"{store_dir}/", destination],
+        input=''.join(os.path.relpath(path, store_dir) + '\n' for path in paths), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"rsync exited with {result.returncode}")
+
+def rsync_flat(files, destination):
+    """Upload {remote_name: local_path} into one flat remote directory"""
+    staging = tempfile.mkdtemp()
+    try:
+        for remote_name, local_path in files.items():
+            target = os.path.join(staging, remote_name)
+            try:
+                os.link(local_path, target)
+            except OSError:
+                shutil.copy2(local_path, target)
+        result = subprocess.run(
+            ['rsync', '-az', '--chown=www-data:www-data', '--chmod=D755,F644', f"{staging}/", destination],
+            capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or f"rsync exited with {result.returncode}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+class Publisher:
+    """Upload rendered cards in small batches and release guests once their card is served"""
+
+    def __init__(self, server=SERVER, remote_dir=REMOTE_DIR, remote_wa_dir=REMOTE_WA_DIR, media=MEDIA_ORIGINAL,
+                 verify=True, dry_run=False):
+        self.server = server
+        self.remote_dir = remote_dir
+        self.remote_wa_dir = remote_wa_dir
+        self.media = media
+        self.verify = verify
+        self.dry_run = dry_run
+        self.pool = ConnectionPool()
+        self.published = 0
+        self.failed = []
+
+    def publish(self, batch):
+        """Publish a batch of (guest, card_path); returns the guests whose card is now served"""
+        if self.dry_run:
+            self.published += len(batch)
+            return [guest for guest, _ in batch]
+
+        try:
+            rsync_store([file for g, path in batch for file in (path, alias_path(g['code']))],
+                        f"{self.server}:{self.remote_dir}/")
+            rsync_flat({f"{g['code']}.jpg": variant_path(g['code']) for g, _ in batch},
+                       f"{self.server}:{self.remote_wa_dir}/")
+        except (OSError, RuntimeError) as e:
+            self.failed.extend((guest, f"Publish failed: {e}") for guest, _ in batch)
+            print(f"✗ Publish failed for {len(batch)} cards: {e}")
+            return []
+
+        ready = []
+        for guest, _ in batch:
+            if self.verify:
+                if self.media == MEDIA_WHATSAPP:
+                    result = check_url(self.pool, media_url(guest['code']), MEDIA_MAX_BYTES)
+                else:
+                    result = check_url(self.pool, card_url(guest['code']), MAX_MEDIA_BYTES)
+                if not result['ok']:
+                    self.failed.append((guest, f"Not served after publish: {result['error']}"))
+                    continue
+            ready.append(guest)
+        self.published += len(ready)
+        return ready
+
+def run_pipeline(guests, transports, primary=WHATSAPP, fallback=SMS, media=MEDIA_ORIGINAL, dry_run=False,
+                 render_workers=None, force_render=False, publisher=None, publish_batch=DEFAULT_PUBLISH_BATCH,
+                 publish_interval=DEFAULT_PUBLISH_INTERVAL, progress=None, report_file=FAILURE_REPORT_FILE):
+    """Render -> publish -> send, connected by queues; returns the publisher for its counts"""
+    message_templates = load_message_templates()
+    publisher = publisher or Publisher(media=media, dry_run=dry_run)
+    rendered = queue.Queue()
+    to_send = queue.Queue()
+    start = time.monotonic()
+    first_ready = []
+    render_errors = []
+
+    def render_stage():
+        card_paths = {}
+        try:
+            # Cards rendered from an older version of the sheet are rendered again
+            manifest = load_manifest()
+            with ProcessPoolExecutor(max_workers=render_workers) as executor:
+                futures = [executor.submit(render_guest, guest, 'cards', force_render, manifest.get(guest['code']))
+                           for guest in guests]
+                for future in as_completed(futures):
+                    guest, card_path, error = future.result()
+                    if error:
+                        render_errors.append((guest, error))
+                        print(f"✗ Render failed for {guest['name']} ({guest['code']}): {error}")
+                    else:
+                        card_paths[guest['code']] = card_path
+                        rendered.put((guest, card_path))
+            # The workers only render; the messages are written here in one batch
+            update_manifest(manifest_entries(guests, message_templates, card_paths))
+        finally:
+            # Always close the queue so the later stages finish
+            rendered.put(None)
+
+    def publish_stage():
+        try:
+            publish_batches()
+        finally:
+            to_send.put(None)
+
+    def publish_batches():
+        batch = []
+        deadline = None
+        done = False
+        while not done:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = rendered.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                done = True
+            elif item:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + publish_interval
+            if batch and (done or len(batch) >= publish_batch or time.monotonic() >= deadline):
+                for guest in publisher.publish(batch):
+                    if not first_ready:
+                        first_ready.append(time.monotonic() - start)
+                    if guest['phone']:
+                        to_send.put(guest)
+                batch = []
+                deadline = None
+
+    stages = [threading.Thread(target=render_stage, name="render"),
+              threading.Thread(target=publish_stage, name="publish")]
+    for stage in stages:
+        stage.start()
+    try:
+        send_messages([], transports, primary=primary, fallback=fallback, dry_run=dry_run, media=media,
+                      progress=progress, feed=to_send, report_file=report_file)
+    finally:
+        for stage in stages:
+            stage.join()
+
+    elapsed = time.monotonic() - start
+    print("\n" + "="*80)
+    print("PIPELINE")
+    print("="*80)
+    print(f"Guests: {len(guests)}")
+    print(f"Rendered: {len(guests) - len(render_errors)} ({len(render_errors)} errors)")
+    print(f"Published: {publisher.published}" + (" (dry run, not uploaded)" if dry_run else ""))
+    for guest, error in publisher.failed:
+        print(f"  ✗ {guest['code']} {guest['name']}: {error}")
+    if first_ready:
+        print(f"First card ready to send after {first_ready[0]:.1f}s")
+    print(f"Total time: {elapsed:.1f}s")
+    print("="*80)
+    return publisher
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Render, publish and send cards in one pipelined run')
+    parser.add_argument('--dry-run', action='store_true', help='Render cards, but do not upload or send')
+    parser.add_argument('--account-sid', help='Twilio Account SID (or set TWILIO_ACCOUNT_SID env var)')
+    parser.add_argument('--auth-token', help='Twilio Auth Token (or set TWILIO_AUTH_TOKEN env var)')
+    parser.add_argument('--from-number', help='Twilio WhatsApp number(s) (or set TWILIO_FROM_NUMBER env var)')
+    parser.add_argument('--channel', choices=[WHATSAPP, SMS], default=WHATSAPP, help='Primary channel (default: whatsapp)')
+    parser.add_argument('--no-fallback', action='store_true', help='Do not fall back to SMS')
+    parser.add_argument('--media', choices=[MEDIA_WHATSAPP, MEDIA_ORIGINAL],
+                        default=MEDIA_WHATSAPP if TWILIO_MEDIA_TEMPLATE_ID else MEDIA_ORIGINAL,
+                        help='Card sent on WhatsApp (see send_cards_twilio.py --media)')
+    parser.add_argument('--campaign', help='Campaign name: delivered codes are recorded and skipped on restart')
+    parser.add_argument('--render-workers', type=int, help='Processes rendering cards (default: CPU count)')
+    parser.add_argument('--force-render', action='store_true', help='Re-render cards that already exist')
+    parser.add_argument('--publish-batch', type=int, default=DEFAULT_PUBLISH_BATCH,
+                        help=f'Cards per upload (default: {DEFAULT_PUBLISH_BATCH})')
+    parser.add_argument('--publish-interval', type=float, default=DEFAULT_PUBLISH_INTERVAL,
+                        help=f'Seconds a partial batch waits for more cards (default: {DEFAULT_PUBLISH_INTERVAL})')
+    parser.add_argument('--server', default=SERVER, help=f'Card server (default: {SERVER})')
+    parser.add_argument('--skip-verify', action='store_true', help='Do not check each card URL after uploading')
+
+    args = parser.parse_args()
+
+    twilio_account_sid = args.account_sid or os.environ.get('TWILIO_ACCOUNT_SID')
+    twilio_auth_token = args.auth_token or os.environ.get('TWILIO_AUTH_TOKEN')
+    from_number = args.from_number or os.environ.get('TWILIO_FROM_NUMBER')
+    sms_username = os.environ.get('SMS_USERNAME')
+    sms_password = os.environ.get('SMS_PASSWORD')
+
+    if args.media == MEDIA_WHATSAPP and not TWILIO_MEDIA_TEMPLATE_ID:
+        print("Error: --media whatsapp needs TWILIO_MEDIA_TEMPLATE_ID")
+        sys.exit(1)
+    if not args.dry_run and args.channel == WHATSAPP and not (twilio_account_sid and twilio_auth_token and from_number):
+        print("Error: Twilio credentials not provided (TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER)")
+        sys.exit(1)
+    if not args.dry_run and args.channel == SMS and not (sms_username and sms_password):
+        print("Error: SMS credentials not provided (SMS_USERNAME, SMS_PASSWORD)")
+        sys.exit(1)
+
+    print("Reading spreadsheet...")
+    guests = read_spreadsheet()
+    progress = CampaignProgress(PROGRESS_FILE.format(name=args.campaign)) if args.campaign else None
+    if progress is not None:
+        guests = [guest for guest in guests if guest['code'] not in progress]
+        print(f"Campaign '{args.campaign}': {len(progress)} guests already delivered")
+    print(f"{len(guests)} guests to process, {sum(1 for g in guests if g['phone'])} with phone numbers")
+
+    if not args.dry_run:
+        print("\n⚠️  This will render, upload and send cards to every guest with a phone number.")
+        if input("Type 'SEND' to confirm: ") != 'SEND':
+            print("Cancelled. Use --dry-run to render only.")
+            return
+
+    transports = build_transports(guests, twilio_account_sid or "dry_run", twilio_auth_token or "dry_run",
+                                  from_number or "dry_run", primary=args.channel, sms_username=sms_username,
+                                  sms_password=sms_password, media=args.media, dry_run=args.dry_run)
+    if not args.dry_run and SMS in transports and not check_sms_account(transports[SMS], guests, args.channel):
+        return
+    publisher = Publisher(server=args.server, media=args.media, verify=not args.skip_verify, dry_run=args.dry_run)
+    try:
+        run_pipeline(guests, transports, primary=args.channel, fallback=None if args.no_fallback else SMS,
+                     media=args.media, dry_run=args.dry_run, render_workers=args.render_workers,
+                     force_render=args.force_render, publisher=publisher, publish_batch=args.publish_batch,
+                     publish_interval=args.publish_interval, progress=progress)
+    finally:
+        if progress is not None:
+            progress.close()
+
+if __name__ == '__main__':
+    main()
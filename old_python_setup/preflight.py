@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Preflight check of card media URLs before a campaign starts
+Every guest's card URL is checked concurrently over a bounded pool of
+keep-alive connections (HEAD, falling back to a one-byte ranged GET) for
+status, content type and size, so a missing card blocks the campaign instead
+of surfacing later as a failed delivery.
+
+Usage:
+  python3 preflight.py [--workers 16] [--report card_preflight_report.csv]
+"""
+import csv
+import http.client
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+# Twilio accepts images up to 5 MB for WhatsApp
+MAX_MEDIA_BYTES = 5 * 1024 * 1024
+ALLOWED_CONTENT_TYPES = ('image/png', 'image/jpeg')
+
+DEFAULT_WORKERS = 16
+DEFAULT_TIMEOUT = 10
+# Seconds a kept-alive connection may sit unused before it is replaced
+MAX_IDLE = 4.0
+
+PREFLIGHT_REPORT_FILE = "card_preflight_report.csv"
+
+class ConnectionPool:
+    """One keep-alive connection per worker thread and host"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, url, headers=None, idempotent=True):
+        """Make a request, reconnecting once if the kept-alive connection was closed
+
+        A request that is not idempotent is only sent again when writing it
+        failed; once it went out, a lost response is raised to the caller.
+        """
+        parsed = urllib.parse.urlsplit(url)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        for attempt in range(2):
+            conn = self._connection(parsed.scheme, parsed.netloc)
+            reused = conn.sock is not None
+            try:
+                conn.request(method, path, headers=headers or {})
+            except (http.client.HTTPException, ConnectionError):
+                self._drop(parsed.scheme, parsed.netloc)
+                if attempt or not reused:
+                    raise
+                continue
+            try:
+                response = conn.getresponse()
+                # Read the body so the connection can be reused
+                response.body = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                self._drop(parsed.scheme, parsed.netloc)
+                if attempt or not reused or not idempotent:
+                    raise
+                continue
+            self._local.used[(parsed.scheme, parsed.netloc)] = time.monotonic()
+            return response
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+            self._local.used = {}
+        key = (scheme, netloc)
+        if key in connections and time.monotonic() - self._local.used.get(key, 0) > MAX_IDLE:
+            # Servers close idle keep-alive connections; a fresh one avoids sending into a dead socket
+            self._drop(scheme, netloc)
+        if key not in connections:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            connections[key] = cls(netloc, timeout=self.timeout)
+        return connections[key]
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.connections.pop((scheme, netloc), None)
+        if conn:
+            conn.close()
+
+def check_url(pool, url, max_bytes=MAX_MEDIA_BYTES, content_types=ALLOWED_CONTENT_TYPES):
+    """Check one media URL; returns a result dict with ok/status/content_type/size/error"""
+    result = {'url': url, 'ok': False, 'status': None, 'content_type': None, 'size': None, 'error': None}
+    try:
+        response = pool.request('HEAD', url)
+        if response.status in (405, 501):
+            # Server does not support HEAD: ask for the first byte only
+            response = pool.request('GET', url, headers={'Range': 'bytes=0-0'})
+    except (OSError, http.client.HTTPException) as e:
+        result['error'] = f"{e.__class__.__name__}: {e}"
+        return result
+
+    result['status'] = response.status
+    result['content_type'] = (response.getheader('Content-Type') or '').split(';')[0].strip()
+    content_range = response.getheader('Content-Range')
+    if content_range and '/' in content_range:
+        size = content_range.rsplit('/', 1)[1]
+    else:
+        size = response.getheader('Content-Length')
+    result['size'] = int(size) if size and size.isdigit() else None
+
+    if response.status not in (200, 206):
+        result['error'] = f"HTTP {response.status}"
+    elif result['content_type'] not in content_types:
+        result['error'] = f"Unexpected content type: {result['content_type'] or 'none'}"
+    elif result['size'] is None:
+        result['error'] = "Unknown size"
+    elif result['size'] == 0:
+        result['error'] = "Empty file"
+    elif result['size'] > max_bytes:
+        result['error'] = f"Too large: {result['size']} bytes (limit {max_bytes})"
+    else:
+        result['ok'] = True
+    return result
+
+def check_card_urls(urls, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, max_bytes=MAX_MEDIA_BYTES,
+                    content_types=ALLOWED_CONTENT_TYPES):
+    """Check many URLs concurrently; returns results in the same order as urls"""
+    pool = ConnectionPool(timeout)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preflight") as executor:
+        return list(executor.map(lambda url: check_url(pool, url, max_bytes, content_types), urls))
+
+def preflight_guests(guests, card_url, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, max_bytes=MAX_MEDIA_BYTES):
+    """Check the card of every guest with a phone number; returns (results, problems)"""
+    to_check = [guest for guest in guests if guest['phone']]
+    start = time.monotonic()
+    results = check_card_urls([card_url(guest['code']) for guest in to_check], workers, timeout, max_bytes)
+    elapsed = time.monotonic() - start
+
+    for guest, result in zip(to_check, results):
+        result['name'] = guest['name']
+        result['code'] = guest['code']
+    problems = [result for result in results if not result['ok']]
+
+    print(f"Checked {len(results)} card URLs in {elapsed:.1f}s ({workers} connections)")
+    print(f"  OK: {len(results) - len(problems)}")
+    print(f"  Problems: {len(problems)}")
+    for problem in problems[:20]:
+        print(f"  ✗ {problem['code']} {problem['name']}: {problem['error']}")
+    if len(problems) > 20:
+        print(f"  ... and {len(problems) - 20} more")
+
+    return results, problems
+
+REPORT_FIELDS = ['code', 'name', 'url', 'ok', 'status', 'content_type', 'size', 'error']
+
+def write_preflight_report(results, path=PREFLIGHT_REPORT_FILE):
+    """Write preflight results to a CSV report"""
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    return path
+
+def main():
+    """Main function"""
+    import argparse
+    import sys
+    from send_cards_twilio import read_spreadsheet, CARD_BASE_URL
+
+    parser = argparse.ArgumentParser(description='Check that every guest card URL is served correctly')
+    parser.add_argument('--base-url', default=CARD_BASE_URL, help=f'Card base URL (default: {CARD_BASE_URL})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help=f'Concurrent connections (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help=f'Request timeout in seconds (default: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--max-bytes', type=int, default=MAX_MEDIA_BYTES, help=f'Maximum card size (default: {MAX_MEDIA_BYTES})')
+    parser.add_argument('--report', default=PREFLIGHT_REPORT_FILE, help=f'CSV report (default: {PREFLIGHT_REPORT_FILE})')
+
+    args = parser.parse_args()
+
+    guests = read_spreadsheet()
+    results, problems = preflight_guests(guests, lambda code: f"{args.base_url}/{code}.png",
+                                         args.workers, args.timeout, args.max_bytes)
+    write_preflight_report(results, args.report)
+    print(f"Report: {args.report}")
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Error classification and retry scheduling for failed sends
+Transient failures (throttling, provider outages, network errors) are retried
+with exponential backoff up to a per-guest attempt cap. Permanent failures
+(invalid numbers, recipients not on WhatsApp, ...) are collected for a report.
+Failures after the request went out (a timeout or dropped connection while
+waiting for the answer) are unknown: the provider may have accepted the
+message, so they are reported instead of retried.
+"""
+import csv
+import heapq
+import http.client
+import itertools
+import os
+import random
+import time
+import urllib.error
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+UNKNOWN = "unknown"
+
+# Twilio error codes that will never succeed on retry
+# https://www.twilio.com/docs/api/errors
+PERMANENT_TWILIO_CODES = {
+    20003: "Authentication failed",
+    21211: "Invalid 'To' phone number",
+    21408: "Permission to send to this region is not enabled",
+    21610: "Recipient has unsubscribed",
+    21612: "Cannot route to this number",
+    21614: "'To' number is not a valid mobile number",
+    63003: "Recipient is not on WhatsApp",
+    63016: "Outside the WhatsApp messaging window",
+    63024: "Invalid message recipient",
+    63032: "Recipient cannot receive this message",
+}
+
+# Twilio error codes worth retrying later
+TRANSIENT_TWILIO_CODES = {
+    20429: "Too many requests",
+    20500: "Twilio internal error",
+    20503: "Twilio service unavailable",
+    30001: "Queue overflow",
+    63018: "WhatsApp rate limit exceeded",
+    63038: "Daily messaging limit reached",
+}
+
+# Defaults
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 2.0   # seconds before the first retry
+DEFAULT_MAX_DELAY = 120.0  # cap on a single backoff
+DEFAULT_JITTER = 0.2       # +/- fraction of randomness added to each delay
+
+# The connection dropped after the request was written
+RESPONSE_LOST_ERRORS = (http.client.RemoteDisconnected, http.client.IncompleteRead, http.client.BadStatusLine,
+                        ConnectionResetError)
+
+def response_lost(exc):
+    """Whether a network error happened after the request was sent, so its outcome is unknown"""
+    if isinstance(exc, RESPONSE_LOST_ERRORS):
+        return True
+    name = exc.__class__.__name__
+    if name == 'ConnectTimeout':
+        # requests: the connection was never made
+        return False
+    if isinstance(exc, TimeoutError) or name.endswith('Timeout'):
+        return True
+    if isinstance(exc, urllib.error.URLError) and isinstance(exc.reason, BaseException):
+        return response_lost(exc.reason)
+    # requests wraps a dropped connection: ConnectionError(ProtocolError('Connection aborted.', RemoteDisconnected()))
+    return any(isinstance(arg, BaseException) and response_lost(arg) for arg in exc.args)
+
+def classify_error(exc):
+    """Classify a send exception as (TRANSIENT, PERMANENT or UNKNOWN, error code or None, reason)"""
+    # Transports can classify provider-specific failures themselves
+    classification = getattr(exc, 'classification', None)
+    if classification in (TRANSIENT, PERMANENT, UNKNOWN):
+        return classification, getattr(exc, 'code', None), str(exc)
+
+    # Twilio's TwilioRestException (and the SMS client's errors) carry code/status
+    code = getattr(exc, 'code', None)
+    status = getattr(exc, 'status', None)
+
+    if isinstance(code, int):
+        if code in PERMANENT_TWILIO_CODES:
+            return PERMANENT, code, PERMANENT_TWILIO_CODES[code]
+        if code in TRANSIENT_TWILIO_CODES:
+            return TRANSIENT, code, TRANSIENT_TWILIO_CODES[code]
+
+    if isinstance(status, int):
+        if status == 429 or status >= 500:
+            return TRANSIENT, code, f"HTTP {status}"
+        if status >= 400:
+            return PERMANENT, code, f"HTTP {status}"
+
+    if isinstance(exc, urllib.error.HTTPError):
+        if exc.code == 429 or exc.code >= 500:
+            return TRANSIENT, None, f"HTTP {exc.code}"
+        return PERMANENT, None, f"HTTP {exc.code}"
+
+    if isinstance(exc, (OSError, http.client.HTTPException)) and response_lost(exc):
+        return UNKNOWN, None, f"No response, may have been sent: {exc.__class__.__name__}"
+
+    # Refused connections, DNS failures, connect timeouts (requests' errors are OSErrors too)
+    if isinstance(exc, (OSError, http.client.HTTPException)):
+        return TRANSIENT, None, f"Network error: {exc.__class__.__name__}"
+
+    return PERMANENT, code, str(exc) or exc.__class__.__name__
+
+# Provider responses that mean "slow down" rather than "this message is bad"
+THROTTLED = "throttled"
+TIMEOUT = "timeout"
+OVERLOAD_CODES = {20429, 20503, 63018}
+OVERLOAD_STATUSES = {429, 503}
+
+def congestion_signal(exc):
+    """THROTTLED, TIMEOUT or None: whether a send failure means the provider is overloaded"""
+    code = getattr(exc, 'code', None)
+    status = getattr(exc, 'status', None)
+    if code in OVERLOAD_CODES or status in OVERLOAD_STATUSES:
+        return THROTTLED
+    if isinstance(exc, urllib.error.HTTPError) and exc.code in OVERLOAD_STATUSES:
+        return THROTTLED
+    if isinstance(exc, urllib.error.URLError) and isinstance(exc.reason, TimeoutError):
+        return TIMEOUT
+    # socket timeouts, and requests' Timeout/ReadTimeout/ConnectTimeout raised through the Twilio client
+    if isinstance(exc, TimeoutError) or exc.__class__.__name__.endswith('Timeout'):
+        return TIMEOUT
+    return None
+
+class RetryScheduler:
+    """Delay queue of send jobs with exponential backoff and a per-key attempt cap"""
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, jitter=DEFAULT_JITTER, clock=time.monotonic, sleep=time.sleep,
+                 rng=random):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.clock = clock
+        self.sleep = sleep
+        # Anything with uniform(), e.g. a seeded random.Random for a repeatable simulation
+        self.rng = rng
+
+        self.attempts = {}
+        self.retries = 0
+        self._queue = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def add(self, key, item, delay=0.0):
+        """Schedule a job to run after delay seconds"""
+        heapq.heappush(self._queue, (self.clock() + delay, next(self._counter), key, item))
+
+    def backoff(self, attempt):
+        """Delay before retry number `attempt` (1-based)"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay *= 1 + self.rng.uniform(-self.jitter, self.jitter)
+        return max(0.0, delay)
+
+    def next_ready(self):
+        """Pop the next due job as (key, item, attempt), sleeping until it is due"""
+        ready_at, _, key, item = heapq.heappop(self._queue)
+        wait = ready_at - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+        attempt = self.attempts.get(key, 0) + 1
+        self.attempts[key] = attempt
+        return key, item, attempt
+
+    def pop_due(self):
+        """Pop every job that is due now as a list of (key, item, attempt), without sleeping"""
+        due = []
+        now = self.clock()
+        while self._queue and self._queue[0][0] <= now:
+            _, _, key, item = heapq.heappop(self._queue)
+            attempt = self.attempts.get(key, 0) + 1
+            self.attempts[key] = attempt
+            due.append((key, item, attempt))
+        return due
+
+    def next_due_in(self):
+        """Seconds until the next job is due (None when the queue is empty)"""
+        if not self._queue:
+            return None
+        return max(0.0, self._queue[0][0] - self.clock())
+
+    def retry(self, key, item, classification, retry_after=None):
+        """Reschedule a failed job if it is worth it; returns the delay or None when giving up"""
+        attempt = self.attempts.get(key, 0)
+        if classification != TRANSIENT or attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        if retry_after:
+            delay = max(delay, retry_after)
+        self.retries += 1
+        self.add(key, item, delay)
+        return delay
+
+REPORT_FIELDS = ['name', 'phone', 'code', 'channel', 'classification', 'error_code', 'reason', 'attempts', 'error']
+
+def write_failure_report(failures, path):
+    """Write failed guests to a CSV report, replacing it in one step"""
+    # Per process, so workers finishing together never write into each other's file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for failure in failures:
+            writer.writerow(failure)
+    os.replace(tmp_path, path)
+    return path
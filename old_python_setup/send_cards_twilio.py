@@ -5,8 +5,28 @@ Send wedding invitation cards via Twilio WhatsApp
 import sys
 import os
 import json
+import functools
+import zipfile
+import xml.etree.ElementTree as ET
 from datetime import datetime
 
+from send_log import get_writer
+from ods_reader import GUEST_SHEET
+from guest_snapshot import load_guest_rows
+from guest_normalize import normalize_guests
+from retry_scheduler import write_failure_report, PERMANENT, TRANSIENT, UNKNOWN, DEFAULT_MAX_ATTEMPTS
+from preflight import preflight_guests, write_preflight_report, PREFLIGHT_REPORT_FILE, DEFAULT_WORKERS
+from media_variants import MEDIA_BASE_URL, MAX_BYTES as MEDIA_MAX_BYTES
+from simulator import ChannelModel, simulate_campaign, print_simulation
+from campaign import (SendWindow, CampaignProgress, load_vip_codes, order_by_priority, plan_delays,
+                      CAMPAIGN_TIMEZONE, PROGRESS_FILE)
+from transports import (ChannelRouter, WhatsAppTransport, SmsTransport, WHATSAPP, SMS,
+                        SMS_DEFAULT_SENDER_ID, DEFAULT_MAX_CONCURRENCY, parse_numbers)
+from sms_client import CreditGuard, SmsApiError, parse_balance
+from message_manifest import load_manifest, compile_template, MANIFEST_FILE, DEFAULT_TEMPLATES
+from sms_encoding import (sms_segments, analyze_messages, summarize, print_summary, write_report,
+                          SMS_SEGMENT_REPORT_FILE)
+
 # Try to import Twilio
 try:
     from twilio.rest import Client
@@ -20,32 +40,35 @@ except ImportError:
 TWILIO_TEMPLATE_ID = "HXf513586e349b38c570d406565e5bbb93"
 CARD_BASE_URL = "http://46.62.209.58/png"
 
+# Template whose media URL is http://46.62.209.58/wa/{{2}}.jpg (the small WhatsApp variant)
+TWILIO_MEDIA_TEMPLATE_ID = os.environ.get('TWILIO_MEDIA_TEMPLATE_ID')
+MEDIA_ORIGINAL = "original"
+MEDIA_WHATSAPP = "whatsapp"
+
 # Log file
 LOG_FILE = "twilio_send_log.jsonl"
 
-def format_tanzanian_phone(phone):
-    """Format Tanzanian phone number: replace leading 0 with +255"""
-    if not phone or str(phone) == 'nan':
-        return None
-    
-    phone_str = str(phone).strip()
-    
-    # Remove any non-digit characters except +
-    phone_clean = ''.join(c for c in phone_str if c.isdigit() or c == '+')
-    
-    # If starts with 0, replace with +255
-    if phone_clean.startswith('0'):
-        phone_clean = '+255' + phone_clean[1:]
-    elif not phone_clean.startswith('+'):
-        # If no + and doesn't start with 0, assume it needs +255
-        if phone_clean.startswith('255'):
-            phone_clean = '+' + phone_clean
-        else:
-            phone_clean = '+255' + phone_clean
-    
-    return phone_clean
+# Guests that could not be reached
+FAILURE_REPORT_FILE = "twilio_failures_report.csv"
+
+# Per-channel throughput (messages per second, requests in flight); WhatsApp is per sender number
+DEFAULT_WHATSAPP_RATE = 10
+DEFAULT_WHATSAPP_CONCURRENCY = 4
+DEFAULT_SMS_RATE = 5
+DEFAULT_SMS_CONCURRENCY = 2
+
+# Used when a guest has no message in the manifest and there is no message_sms.txt
+SMS_DEFAULT_TEMPLATE = DEFAULT_TEMPLATES['sms']
 
-def log_message(action, name, phone, code, status="pending", error=None):
+def card_url(code):
+    """Public URL of a guest's card"""
+    return f"{CARD_BASE_URL}/{code}.png"
+
+def media_url(code):
+    """Public URL of a guest's WhatsApp card variant"""
+    return f"{MEDIA_BASE_URL}/{code}.jpg"
+
+def log_message(action, name, phone, code, status="pending", error=None, media=MEDIA_ORIGINAL, **extra):
     """Log message details"""
     log_entry = {
         "timestamp": datetime.now().isoformat(),
@@ -55,93 +78,30 @@ def log_message(action, name, phone, code, status="pending", error=None):
         "code": code,
         "status": status,
         "error": error,
-        "card_url": f"{CARD_BASE_URL}/{code}.png",
-        "template_id": TWILIO_TEMPLATE_ID
+        "card_url": media_url(code) if media == MEDIA_WHATSAPP else card_url(code),
+        "template_id": TWILIO_MEDIA_TEMPLATE_ID if media == MEDIA_WHATSAPP else TWILIO_TEMPLATE_ID
     }
+    log_entry.update(extra)
     
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(log_entry) + '\n')
+    get_writer(LOG_FILE).write(log_entry)
     
     return log_entry
 
 def read_spreadsheet():
     """Read guest data from spreadsheet"""
-    guests = []
-    
     try:
-        import pandas as pd
-        df = pd.read_excel('wedding_invites.ods', engine='odf')
-        
-        for _, row in df.iterrows():
-            name = str(row.iloc[0]) if pd.notna(row.iloc[0]) else None
-            single_double = str(row.iloc[1]) if pd.notna(row.iloc[1]) else "Single"
-            phone_raw = row.iloc[2] if len(row) > 2 else None
-            code_raw = row.iloc[3] if len(row) > 3 else None
-            
-            # Handle code (preserve leading zeros)
-            if pd.notna(code_raw) and code_raw != 'nan':
-                if isinstance(code_raw, (int, float)):
-                    code = str(int(code_raw)).zfill(5)
-                else:
-                    code = str(code_raw).rstrip('.0').zfill(5)
-            else:
-                code = None
-            
-            # Format phone number
-            phone = format_tanzanian_phone(phone_raw) if pd.notna(phone_raw) else None
-            
-            if name and name != 'nan' and code and code != 'nan':
-                guests.append({
-                    'name': name,
-                    'type': single_double,
-                    'phone': phone,
-                    'code': code
-                })
-    
-    except ImportError:
-        # Fallback to XML parsing
-        try:
-            import xml.etree.ElementTree as ET
-            import zipfile
-            
-            with zipfile.ZipFile('wedding_invites.ods', 'r') as z:
-                content = z.read('content.xml')
-            root = ET.fromstring(content)
-            ns = {'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
-                  'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'}
-            
-            rows = root.findall('.//table:table-row', ns)
-            for row in rows:
-                cells = row.findall('.//table:table-cell', ns)
-                if len(cells) >= 4:
-                    name_elem = cells[0].find('.//text:p', ns)
-                    type_elem = cells[1].find('.//text:p', ns)
-                    phone_elem = cells[2].find('.//text:p', ns) if len(cells) > 2 else None
-                    code_elem = cells[3].find('.//text:p', ns)
-                    
-                    if name_elem is not None and name_elem.text and code_elem is not None and code_elem.text:
-                        name = name_elem.text.replace('&amp;', '&')
-                        single_double = type_elem.text if type_elem is not None and type_elem.text else "Single"
-                        phone_raw = phone_elem.text if phone_elem is not None and phone_elem.text else None
-                        code = code_elem.text
-                        
-                        # Format phone
-                        phone = format_tanzanian_phone(phone_raw)
-                        
-                        # Pad code to 5 digits
-                        if code.isdigit():
-                            code = code.zfill(5)
-                        
-                        guests.append({
-                            'name': name,
-                            'type': single_double,
-                            'phone': phone,
-                            'code': code
-                        })
-        except Exception as e:
-            print(f"Error reading spreadsheet: {e}")
-            sys.exit(1)
-    
+        rows = load_guest_rows(GUEST_SHEET)
+    except (OSError, KeyError, zipfile.BadZipFile, ET.ParseError) as e:
+        print(f"Error reading spreadsheet: {e}")
+        sys.exit(1)
+
+    guests, invalid = normalize_guests(rows)
+    for column in ('code', 'phone'):
+        names = [guest['name'] for guest, bad in zip(guests, invalid[column]) if bad]
+        if names:
+            shown = ', '.join(names[:5]) + (f" and {len(names) - 5} more" if len(names) > 5 else '')
+            print(f"⚠️  {len(names)} guests have an invalid {column}: {shown}")
+
     return guests
 
 def preview_messages(guests, twilio_account_sid=None, twilio_auth_token=None, from_number=None):
@@ -179,93 +139,239 @@ def preview_messages(guests, twilio_account_sid=None, twilio_auth_token=None, fr
         print("Set environment variables:")
         print("  - TWILIO_ACCOUNT_SID")
         print("  - TWILIO_AUTH_TOKEN")
-        print("  - TWILIO_FROM_NUMBER (WhatsApp number, e.g., whatsapp:+14155238886)")
+        print("  - TWILIO_FROM_NUMBER (WhatsApp number, e.g., whatsapp:+14155238886, comma separated for several)")
         return False
     
     print(f"\n✓ Twilio configured")
     print(f"  Account SID: {twilio_account_sid[:10]}...")
-    print(f"  From: {from_number}")
+    print(f"  From: {', '.join(parse_numbers(from_number))}")
     print(f"  Template ID: {TWILIO_TEMPLATE_ID}")
     print(f"  Variables: {{1}} = code, {{2}} = code")
     
     return True
 
-def send_messages(guests, twilio_account_sid, twilio_auth_token, from_number, dry_run=False):
-    """Send messages via Twilio by calling the single card script"""
-    import subprocess
+def load_sms_messages(guests, manifest_file=MANIFEST_FILE, template_file='message_sms.txt'):
+    """SMS text per code from the message manifest written by generate_cards_and_messages.py"""
+    messages = {code: entry['sms'] for code, entry in load_manifest(manifest_file).items()}
+    
+    # Guests without a generated message get the template
+    missing = [guest for guest in guests if guest['code'] not in messages]
+    if missing:
+        template = None
+        if os.path.exists(template_file):
+            with open(template_file, 'r', encoding='utf-8') as f:
+                template = f.read().strip()
+        render = compile_template(template or SMS_DEFAULT_TEMPLATE)
+        for guest in missing:
+            messages[guest['code']] = render(guest)
     
-    sent_count = 0
-    error_count = 0
+    return messages
+
+def build_transports(guests, twilio_account_sid, twilio_auth_token, from_number, primary=WHATSAPP,
+                     sms_username=None, sms_password=None, sms_sender_id=SMS_DEFAULT_SENDER_ID,
+                     whatsapp_rate=DEFAULT_WHATSAPP_RATE, whatsapp_concurrency=DEFAULT_WHATSAPP_CONCURRENCY,
+                     sms_rate=DEFAULT_SMS_RATE, sms_concurrency=DEFAULT_SMS_CONCURRENCY, media=MEDIA_ORIGINAL,
+                     adaptive=True, max_concurrency=DEFAULT_MAX_CONCURRENCY, sms_batch_size=1,
+                     sms_transliterate=False, dry_run=False):
+    """Create the delivery channels; SMS is only available with credentials (or in a dry run)"""
+    transports = {}
+    if primary == WHATSAPP:
+        template_id = TWILIO_MEDIA_TEMPLATE_ID if media == MEDIA_WHATSAPP else TWILIO_TEMPLATE_ID
+        # Each sender number gets its own rate and share of the requests in flight
+        from_numbers = parse_numbers(from_number)
+        transports[WHATSAPP] = WhatsAppTransport(twilio_account_sid, twilio_auth_token, from_numbers,
+                                                 template_id=template_id, rate=whatsapp_rate,
+                                                 concurrency=whatsapp_concurrency * len(from_numbers),
+                                                 adaptive=adaptive, max_concurrency=max_concurrency * len(from_numbers),
+                                                 dry_run=dry_run)
+    if dry_run or (sms_username and sms_password):
+        transports[SMS] = SmsTransport(sms_username, sms_password, load_sms_messages(guests),
+                                       sender_id=sms_sender_id, rate=sms_rate, concurrency=sms_concurrency,
+                                       batch_size=sms_batch_size, transliterate=sms_transliterate,
+                                       adaptive=adaptive, max_concurrency=max_concurrency, dry_run=dry_run)
+    return transports
+
+def check_sms_account(transport, guests, primary=WHATSAPP, min_balance=0):
+    """Resolve the SMS sender ID and check the balance once per campaign; False if SMS credit cannot cover it"""
+    sender_id, source = transport.client.resolve_sender_id()
+    print(f"✓ SMS sender ID: {sender_id} ({source})")
+    try:
+        balance = parse_balance(transport.client.balance())
+    except (SmsApiError, OSError, ValueError) as e:
+        print(f"⚠️  Could not check the SMS balance ({e}), sending without a credit limit")
+        return True
+
+    # Credits are charged per segment; with fallback only guests WhatsApp cannot reach get an SMS
+    needed = sum(sms_segments(transport.message_for(guest)) for guest in guests if guest['phone'])
+    transport.credit_guard = CreditGuard(balance, reserve=min_balance)
+    print(f"SMS balance: {balance:g} credits, reserve {min_balance:g}, "
+          f"{needed} needed if every guest gets an SMS")
+    if balance - needed >= min_balance:
+        return True
+    if primary == SMS:
+        print(f"✗ Not enough SMS credit for this campaign ({needed} needed, "
+              f"{max(0, balance - min_balance):g} available above the reserve). Top up first.")
+        return False
+    print("⚠️  Not enough SMS credit for every guest: fallback SMS stop when the reserve is reached")
+    return True
+
+def send_messages(guests, transports, primary=WHATSAPP, fallback=SMS, dry_run=False,
+                  max_attempts=DEFAULT_MAX_ATTEMPTS, report_file=FAILURE_REPORT_FILE, media=MEDIA_ORIGINAL,
+                  window=None, pace=None, spread=False, vips=None, progress=None, feed=None):
+    """Send messages on the primary channel, retrying transient failures and falling back on permanent ones
+
+    Campaign options: only send inside `window`, at most `pace` messages per
+    second or `spread` evenly over the window, `vips` first, and skip codes
+    already delivered according to `progress`. Guests arriving on `feed` (a
+    queue closed with None) are sent as they come and must already be filtered.
+    With report_file None the caller reports failures itself.
+    """
     skipped_count = 0
+    already_sent = 0
     
     print("\n" + "="*80)
     print("SENDING MESSAGES" if not dry_run else "DRY RUN - Would send messages")
     print("="*80)
+    for channel, transport in transports.items():
+        if channel == WHATSAPP:
+            pool = transport.pool
+            rate = pool.limiters[pool.numbers[0]].rate
+            print(f"Channel {channel}: {len(pool)} sender number(s), {rate or 'unlimited'} msg/s each, "
+                  f"{transport.concurrency} at a time")
+        else:
+            print(f"Channel {channel}: {transport.limiter.rate or 'unlimited'} msg/s, {transport.concurrency} at a time")
+        if transport.controller:
+            print(f"  adaptive concurrency, up to {transport.controller.maximum} at a time")
+    
+    to_send = []
+    for guest in guests:
+        if not guest['phone']:
+            log_message("skip", guest['name'], None, guest['code'], "skipped", "No phone number")
+            skipped_count += 1
+            print(f"⏭️  SKIP: {guest['name']} - No phone number")
+            continue
+        if progress is not None and guest['code'] in progress:
+            already_sent += 1
+            continue
+        to_send.append(guest)
+    if already_sent:
+        print(f"⏭️  {already_sent} guests already received their card in an earlier run")
     
-    # Build base command
-    base_cmd = [
-        sys.executable,
-        'send_single_card_twilio.py',
-        '--account-sid', twilio_account_sid,
-        '--auth-token', twilio_auth_token,
-        '--from-number', from_number
-    ]
+    if vips:
+        to_send = order_by_priority(to_send, vips)
+        print(f"VIPs first: {sum(1 for g in to_send if g['code'] in vips or g['name'].strip().lower() in vips)}")
     
-    if dry_run:
-        base_cmd.append('--dry-run')
+    delays = None
+    gate = None
+    if window or pace or spread:
+        delays = plan_delays(to_send, window, pace, spread)
+        if delays:
+            last = max(delays.values())
+            print(f"Campaign: {len(to_send)} messages"
+                  + (f", window {window}" if window else "")
+                  + (f", last one in {last / 3600:.1f}h" if last else ""))
+        if dry_run:
+            # Show the plan but do not wait for it
+            delays = None
+    if window and not dry_run:
+        closed = [False]
+        
+        def gate():
+            wait = window.seconds_until_open()
+            if wait and not closed[0]:
+                print(f"⏸️  Outside the send window ({window}), resuming in {wait / 3600:.1f}h")
+            elif not wait and closed[0]:
+                print("▶️  Send window open, resuming")
+            closed[0] = bool(wait)
+            return wait
     
-    for guest in guests:
+    log = functools.partial(log_message, media=media)
+    
+    def on_event(event, guest, channel, attempt, result):
         name = guest['name']
         phone = guest['phone']
         code = guest['code']
+        result = result or {}
         
-        if not phone:
-            log_message("skip", name, None, code, "skipped", "No phone number")
-            skipped_count += 1
-            print(f"⏭️  SKIP: {name} - No phone number")
-            continue
-        
-        # Log before sending
-        log_entry = log_message("send", name, phone, code, "pending")
-        print(f"\n📤 Sending to: {name}")
-        print(f"   Phone: {phone}")
-        print(f"   Code: {code}")
-        print(f"   Card URL: {CARD_BASE_URL}/{code}.png")
-        
-        # Call single card script
-        cmd = base_cmd + [phone, code]
+        # Which pool number the guest heard from, as used by the transport
+        extra = {'from_number': result['from_number']} if result.get('from_number') else {}
+        controller = transports[channel].controller
         
-        try:
-            result = subprocess.run(cmd, capture_output=True, text=True, check=False)
-            
-            if result.returncode == 0:
-                if dry_run:
-                    log_message("send", name, phone, code, "dry_run")
-                    sent_count += 1
-                else:
-                    log_message("send", name, phone, code, "sent", None)
-                    sent_count += 1
-                    print(f"   ✓ SENT")
-            else:
-                error_msg = result.stderr.strip() or result.stdout.strip()
-                log_message("send", name, phone, code, "error", error_msg)
-                error_count += 1
-                print(f"   ✗ ERROR: {error_msg}")
-                
-        except Exception as e:
-            error_msg = str(e)
-            log_message("send", name, phone, code, "error", error_msg)
-            error_count += 1
-            print(f"   ✗ ERROR: {error_msg}")
+        if event == "pending":
+            if progress is not None and not dry_run and not progress.sending(code, channel):
+                print(f"⏭️  [{channel}] {name} - no longer ours to send (lease lost)")
+                return False
+            # Log before sending
+            window = controller.limit() if controller else None
+            log("send", name, phone, code, "pending", channel=channel, attempt=attempt, window=window, **extra)
+            retry_note = f" (attempt {attempt}/{max_attempts})" if attempt > 1 else ""
+            window_note = f" x{window}" if window else ""
+            print(f"📤 [{channel}{window_note}] {name} - {phone} - code {code}{retry_note}")
+        elif event == "sent":
+            status = "dry_run" if dry_run else "sent"
+            log("send", name, phone, code, status, None, channel=channel, attempt=attempt,
+                message_id=result.get('message_id'), **extra)
+            if not dry_run:
+                print(f"   ✓ SENT [{channel}] {name}")
+                if progress is not None:
+                    progress.record(code, channel, result.get('message_id'))
+        elif event == "retry":
+            log("send", name, phone, code, "retry", result['error'], channel=channel, attempt=attempt,
+                error_class=result['classification'], error_code=result['error_code'], **extra)
+            print(f"   ⚠️  [{channel}] {name}: {result['reason']} - retrying in {result['delay']:.1f}s")
+        elif event == "fallback":
+            log("send", name, phone, code, "fallback", result['error'], channel=channel, attempt=attempt,
+                error_class=result['classification'], error_code=result['error_code'], **extra)
+            print(f"   ↪️  [{channel}] {name}: {result['reason']} - falling back to {result['fallback']}")
+        elif event == "error":
+            log("send", name, phone, code, "error", result['error'], channel=channel, attempt=attempt,
+                error_class=result['classification'], error_code=result['error_code'], **extra)
+            print(f"   ✗ ERROR [{channel}] {name} ({result['classification']}): {result['error']}")
+            if progress is not None and not dry_run:
+                progress.failed(code, channel, result['error'], result['classification'])
+    
+    router = ChannelRouter(transports, primary=primary, fallback=fallback,
+                           max_attempts=max_attempts, on_event=on_event)
+    delivered, failures = router.run(to_send, delays=delays, gate=gate, feed=feed)
+    
+    get_writer(LOG_FILE).flush()
+    if failures and report_file:
+        write_failure_report(failures, report_file)
     
     print("\n" + "="*80)
     print("SUMMARY")
     print("="*80)
-    print(f"Sent: {sent_count}")
-    print(f"Errors: {error_count}")
+    print(f"Sent: {len(delivered)}")
+    for channel in transports:
+        print(f"  {channel}: {sum(1 for d in delivered if d['channel'] == channel)}")
+    print(f"Errors: {len(failures)}")
+    print(f"  Permanent: {sum(1 for f in failures if f['classification'] == PERMANENT)}")
+    print(f"  Transient (gave up after {max_attempts} attempts): {sum(1 for f in failures if f['classification'] == TRANSIENT)}")
+    unknown = sum(1 for f in failures if f['classification'] == UNKNOWN)
+    if unknown:
+        print(f"  Unknown (no response, may have been sent, not retried): {unknown} - check the provider before resending")
+    print(f"Retries: {router.scheduler.retries}")
+    for channel, transport in transports.items():
+        if transport.controller and transport.requests:
+            stats = transport.controller.stats()
+            print(f"Concurrency {channel}: window {stats['window']} (peak {stats['peak']}, "
+                  f"{stats['decreases']} backoffs, smoothed RTT {stats['srtt_ms']:.0f} ms)")
+    if WHATSAPP in transports and len(transports[WHATSAPP].pool) > 1:
+        print("Sender numbers:")
+        for number, stats in transports[WHATSAPP].pool.stats().items():
+            rested = f", rested {stats['times_rested']}x" if stats['times_rested'] else ""
+            print(f"  {number}: {stats['sent']} sent, {stats['failed']} failed{rested}")
+    guard = getattr(transports.get(SMS), 'credit_guard', None)
+    if guard:
+        refused = f", {guard.refused} SMS not sent to keep the reserve" if guard.refused else ""
+        print(f"SMS credits used: {guard.used:g}, about {guard.balance:g} left{refused}")
     print(f"Skipped (no phone): {skipped_count}")
-    print(f"Total: {len(guests)}")
+    if progress is not None:
+        print(f"Already sent in earlier runs: {already_sent}")
+    print(f"Total: {len(guests) if feed is None else len(delivered) + len(failures)}")
     print(f"\nLog file: {LOG_FILE}")
+    if failures and report_file:
+        print(f"Failure report: {report_file}")
     print("="*80)
 
 def main():
@@ -276,7 +382,61 @@ def main():
     parser.add_argument('--dry-run', action='store_true', help='Preview without sending')
     parser.add_argument('--account-sid', help='Twilio Account SID (or set TWILIO_ACCOUNT_SID env var)')
     parser.add_argument('--auth-token', help='Twilio Auth Token (or set TWILIO_AUTH_TOKEN env var)')
-    parser.add_argument('--from-number', help='Twilio WhatsApp number (or set TWILIO_FROM_NUMBER env var)')
+    parser.add_argument('--from-number',
+                        help='Twilio WhatsApp number(s), comma separated for a pool (or set TWILIO_FROM_NUMBER env var)')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'Attempts per guest for transient errors (default: {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--report-file', default=FAILURE_REPORT_FILE,
+                        help=f'CSV report of guests that could not be reached (default: {FAILURE_REPORT_FILE})')
+    parser.add_argument('--skip-preflight', action='store_true', help='Do not check card URLs before sending')
+    parser.add_argument('--preflight-workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Concurrent connections for the card URL check (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--media', choices=[MEDIA_WHATSAPP, MEDIA_ORIGINAL],
+                        default=MEDIA_WHATSAPP if TWILIO_MEDIA_TEMPLATE_ID else MEDIA_ORIGINAL,
+                        help='Card sent on WhatsApp: the small /wa/ JPEG (needs TWILIO_MEDIA_TEMPLATE_ID) '
+                             'or the original /png/ card (default: whatsapp when the template is set)')
+    parser.add_argument('--channel', choices=[WHATSAPP, SMS], default=WHATSAPP, help='Primary channel (default: whatsapp)')
+    parser.add_argument('--no-fallback', action='store_true', help='Do not fall back to SMS when WhatsApp fails permanently')
+    parser.add_argument('--sms-username', help='sms.co.tz username (or set SMS_USERNAME env var)')
+    parser.add_argument('--sms-password', help='sms.co.tz password (or set SMS_PASSWORD env var)')
+    parser.add_argument('--sms-sender-id', help=f'SMS sender ID (or set SMS_SENDER_ID env var, default: {SMS_DEFAULT_SENDER_ID})')
+    parser.add_argument('--whatsapp-rate', type=float, default=DEFAULT_WHATSAPP_RATE,
+                        help=f'WhatsApp messages per second per sender number (default: {DEFAULT_WHATSAPP_RATE})')
+    parser.add_argument('--whatsapp-concurrency', type=int, default=DEFAULT_WHATSAPP_CONCURRENCY,
+                        help=f'WhatsApp requests in flight per sender number, the starting window when adaptive '
+                             f'(default: {DEFAULT_WHATSAPP_CONCURRENCY})')
+    parser.add_argument('--fixed-concurrency', action='store_true',
+                        help='Keep requests in flight at the --*-concurrency values instead of adapting them')
+    parser.add_argument('--max-concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f'Adaptive ceiling on requests in flight per channel/number (default: {DEFAULT_MAX_CONCURRENCY})')
+    parser.add_argument('--window', help='Only send between these local times, e.g. 09:00-20:00')
+    parser.add_argument('--timezone', default=CAMPAIGN_TIMEZONE, help=f'Time zone of --window (default: {CAMPAIGN_TIMEZONE})')
+    parser.add_argument('--pace', type=float, help='At most this many messages per minute')
+    parser.add_argument('--spread', action='store_true', help='Spread messages evenly over the send window')
+    parser.add_argument('--vip-file', help='Codes or names to send to first, one per line')
+    parser.add_argument('--codes-file',
+                        help='Only send to these codes or names, one per line (e.g. from guest_tool.py diff --codes)')
+    parser.add_argument('--campaign', help='Campaign name: delivered codes are recorded and skipped on restart')
+    parser.add_argument('--sim-latency-ms', type=float, default=300.0,
+                        help='Dry run simulation: provider mean latency (default: 300)')
+    parser.add_argument('--sim-error-rate', type=float, default=0.01,
+                        help='Dry run simulation: transient error rate (default: 0.01)')
+    parser.add_argument('--sim-not-on-whatsapp', type=float, default=0.05,
+                        help='Dry run simulation: fraction of guests not on WhatsApp (default: 0.05)')
+    parser.add_argument('--sim-throttle-rps', type=float, default=0.0,
+                        help='Dry run simulation: provider 429 threshold in requests/second (default: none)')
+    parser.add_argument('--whatsapp-price', type=float, default=0.0, help='Price per WhatsApp message, for the cost projection')
+    parser.add_argument('--sms-price', type=float, default=0.0, help='Price per SMS segment, for the cost projection')
+    parser.add_argument('--sms-rate', type=float, default=DEFAULT_SMS_RATE,
+                        help=f'SMS messages per second (default: {DEFAULT_SMS_RATE})')
+    parser.add_argument('--sms-concurrency', type=int, default=DEFAULT_SMS_CONCURRENCY,
+                        help=f'SMS requests in flight (default: {DEFAULT_SMS_CONCURRENCY})')
+    parser.add_argument('--sms-min-balance', type=float, default=0,
+                        help='SMS credits to keep in the account; sending stops before going below (default: 0)')
+    parser.add_argument('--sms-transliterate', action='store_true',
+                        help='Replace characters outside GSM-7 in SMS texts (curly quotes, emoji, accents)')
+    parser.add_argument('--sms-batch-size', type=int, default=1,
+                        help='Recipients per SMS request for guests with the same text (default: 1, no batching)')
     
     args = parser.parse_args()
     
@@ -285,29 +445,143 @@ def main():
     twilio_auth_token = args.auth_token or os.environ.get('TWILIO_AUTH_TOKEN')
     from_number = args.from_number or os.environ.get('TWILIO_FROM_NUMBER')
     
+    # Get SMS credentials
+    sms_username = args.sms_username or os.environ.get('SMS_USERNAME')
+    sms_password = args.sms_password or os.environ.get('SMS_PASSWORD')
+    sms_sender_id = args.sms_sender_id or os.environ.get('SMS_SENDER_ID') or SMS_DEFAULT_SENDER_ID
+    has_sms = bool(sms_username and sms_password)
+    
+    if args.media == MEDIA_WHATSAPP and not TWILIO_MEDIA_TEMPLATE_ID:
+        print("Error: --media whatsapp needs TWILIO_MEDIA_TEMPLATE_ID (template with media URL /wa/{{2}}.jpg)")
+        sys.exit(1)
+    
+    try:
+        window = SendWindow.parse(args.window, args.timezone) if args.window else None
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.spread and not window:
+        print("Error: --spread needs --window")
+        sys.exit(1)
+    vips = load_vip_codes(args.vip_file) if args.vip_file else None
+    progress = CampaignProgress(PROGRESS_FILE.format(name=args.campaign)) if args.campaign else None
+    if progress is not None:
+        print(f"Campaign '{args.campaign}': {len(progress)} guests already delivered ({progress.path})")
+    campaign_options = dict(window=window, pace=args.pace / 60.0 if args.pace else None, spread=args.spread,
+                            vips=vips, progress=progress)
+    
     # Read spreadsheet
     print("Reading spreadsheet...")
     guests = read_spreadsheet()
     print(f"Loaded {len(guests)} guests")
+    if args.codes_file:
+        only = load_vip_codes(args.codes_file)
+        guests = [guest for guest in guests if guest['code'] in only or guest['name'].strip().lower() in only]
+        print(f"Only the {len(guests)} guests listed in {args.codes_file}")
     
     # Preview
     can_send = preview_messages(guests, twilio_account_sid, twilio_auth_token, from_number)
+    if args.channel == SMS:
+        can_send = has_sms
+    if has_sms:
+        print(f"\n✓ SMS configured (sender ID: {sms_sender_id})")
+    elif args.channel == SMS or not args.no_fallback:
+        print("\n⚠️  SMS credentials not provided (SMS_USERNAME / SMS_PASSWORD), SMS fallback disabled.")
+    
+    # Make sure every card is served before any message goes out
+    if args.channel == WHATSAPP and not args.skip_preflight:
+        print("\nChecking card URLs...")
+        if args.media == MEDIA_WHATSAPP:
+            results, problems = preflight_guests(guests, media_url, workers=args.preflight_workers,
+                                                 max_bytes=MEDIA_MAX_BYTES)
+        else:
+            results, problems = preflight_guests(guests, card_url, workers=args.preflight_workers)
+        if problems:
+            write_preflight_report(results, PREFLIGHT_REPORT_FILE)
+            print(f"Preflight report: {PREFLIGHT_REPORT_FILE}")
+            if not args.dry_run:
+                print("\n✗ Some cards are not served correctly. Run sync_cards.sh (or use --skip-preflight).")
+                return
+        else:
+            print("✓ All cards are available")
+    
+    if args.sms_batch_size > args.sms_concurrency:
+        # Every guest waiting for its batch holds a sending thread
+        print(f"⚠️  SMS batches are limited to --sms-concurrency ({args.sms_concurrency}) recipients, "
+              f"raise it to fill batches of {args.sms_batch_size}")
+    
+    fallback = None if args.no_fallback else SMS
+    transport_options = dict(
+        primary=args.channel, sms_username=sms_username, sms_password=sms_password, sms_sender_id=sms_sender_id,
+        whatsapp_rate=args.whatsapp_rate, whatsapp_concurrency=args.whatsapp_concurrency,
+        sms_rate=args.sms_rate, sms_concurrency=args.sms_concurrency, media=args.media,
+        adaptive=not args.fixed_concurrency, max_concurrency=args.max_concurrency, sms_batch_size=args.sms_batch_size,
+        sms_transliterate=args.sms_transliterate
+    )
     
     if args.dry_run:
         print("\n🔍 DRY RUN MODE - No messages will be sent")
-        send_messages(guests, twilio_account_sid or "dry_run", twilio_auth_token or "dry_run", 
-                     from_number or "dry_run", dry_run=True)
+        transports = build_transports(guests, twilio_account_sid or "dry_run", twilio_auth_token or "dry_run",
+                                      from_number or "dry_run", dry_run=True, **transport_options)
+        send_messages(guests, transports, primary=args.channel, fallback=fallback, dry_run=True,
+                      max_attempts=args.max_attempts, report_file=args.report_file, media=args.media,
+                      **campaign_options)
+        
+        # Project the real campaign with the same limits and campaign options
+        # (a pool of sender numbers is modelled as one channel with their combined rate)
+        senders = max(1, len(parse_numbers(from_number)))
+        provider = dict(latency_ms=args.sim_latency_ms, latency_jitter_ms=args.sim_latency_ms / 3,
+                        error_rate=args.sim_error_rate, throttle_rps=args.sim_throttle_rps,
+                        adaptive=not args.fixed_concurrency)
+        models = {}
+        if args.channel == WHATSAPP:
+            models[WHATSAPP] = ChannelModel(args.whatsapp_rate * senders, args.whatsapp_concurrency * senders,
+                                            max_concurrency=args.max_concurrency * senders,
+                                            permanent_error_rate=args.sim_not_on_whatsapp,
+                                            price=args.whatsapp_price, **provider)
+        if SMS in transports:
+            models[SMS] = ChannelModel(args.sms_rate, args.sms_concurrency, max_concurrency=args.max_concurrency,
+                                       price=args.sms_price, **provider)
+        to_send = [g for g in guests if g['phone'] and (progress is None or g['code'] not in progress)]
+        if campaign_options['vips']:
+            to_send = order_by_priority(to_send, campaign_options['vips'])
+        sms_messages = {g['code']: transports[SMS].message_for(g) for g in to_send} if SMS in transports else {}
+        if sms_messages:
+            # Segments decide SMS cost and send time: flag messages that fall back to UCS-2
+            rows = analyze_messages(sms_messages, transliterated=not args.sms_transliterate)
+            write_report(rows)
+            print("\nSMS encoding:")
+            print_summary(summarize(rows))
+            print(f"Report: {SMS_SEGMENT_REPORT_FILE}")
+        results = simulate_campaign(to_send, models, primary=args.channel, fallback=fallback,
+                                    sms_text=lambda guest: sms_messages.get(guest['code'], ''),
+                                    max_attempts=args.max_attempts, window=window,
+                                    pace=campaign_options['pace'], spread=args.spread)
+        print_simulation(results)
     elif can_send:
         # Ask for confirmation
-        print("\n⚠️  Ready to send messages. This will send WhatsApp messages to all guests with phone numbers.")
+        channel_name = "WhatsApp" if args.channel == WHATSAPP else "SMS"
+        print(f"\n⚠️  Ready to send messages. This will send {channel_name} messages to all guests with phone numbers.")
+        if args.channel == WHATSAPP and fallback and has_sms:
+            print("   Guests that cannot be reached on WhatsApp will get an SMS instead.")
         response = input("Type 'SEND' to confirm: ")
         
         if response == 'SEND':
-            send_messages(guests, twilio_account_sid, twilio_auth_token, from_number, dry_run=False)
+            transports = build_transports(guests, twilio_account_sid, twilio_auth_token, from_number,
+                                          **transport_options)
+            pending = [g for g in guests if progress is None or g['code'] not in progress]
+            if SMS not in transports or check_sms_account(transports[SMS], pending, args.channel,
+                                                          args.sms_min_balance):
+                send_messages(guests, transports, primary=args.channel, fallback=fallback, dry_run=False,
+                              max_attempts=args.max_attempts, report_file=args.report_file, media=args.media,
+                              **campaign_options)
         else:
             print("Cancelled. Use --dry-run to preview without sending.")
     else:
         print("\nCannot send messages. Please check configuration.")
+    
+    if progress is not None:
+        progress.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Buffered, rotating send log shared by the Twilio scripts
+Entries are batched in memory and appended under an exclusive file lock,
+so several processes (a sender and its children, or parallel workers) can log
+to the same file without interleaving lines. A batch is written once it is
+full or, at the latest, flush_interval seconds after its first entry, even
+if nothing else is logged.
+"""
+import os
+import json
+import gzip
+import shutil
+import atexit
+import threading
+import time
+from datetime import datetime
+
+# fcntl is only available on POSIX systems
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Defaults (can be overridden with environment variables)
+DEFAULT_FLUSH_LINES = 50          # SEND_LOG_FLUSH_LINES
+DEFAULT_FLUSH_INTERVAL = 1.0      # SEND_LOG_FLUSH_INTERVAL (seconds)
+DEFAULT_FSYNC = "never"           # SEND_LOG_FSYNC: never, flush or always
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024  # SEND_LOG_MAX_BYTES (0 disables size rotation)
+DEFAULT_ROTATE = "size"           # SEND_LOG_ROTATE: size, daily or none
+
+FSYNC_POLICIES = ("never", "flush", "always")
+ROTATE_POLICIES = ("size", "daily", "none")
+
+def segment_path(path, when=None):
+    """Name for a closed log segment, e.g. twilio_send_log.20251112-123154-000123.jsonl"""
+    when = when or datetime.now()
+    base, ext = os.path.splitext(path)
+    return f"{base}.{when.strftime('%Y%m%d-%H%M%S-%f')}{ext or '.jsonl'}"
+
+def unused_segment_path(path):
+    """Segment name that does not clash with an existing segment"""
+    segment = segment_path(path)
+    while os.path.exists(segment) or os.path.exists(segment + '.gz'):
+        time.sleep(0.001)
+        segment = segment_path(path)
+    return segment
+
+def list_segments(path):
+    """List closed (rotated) segments of a log, oldest first"""
+    directory = os.path.dirname(path) or '.'
+    base, ext = os.path.splitext(os.path.basename(path))
+    segments = []
+    for filename in os.listdir(directory):
+        if filename.startswith(base + '.') and filename != os.path.basename(path):
+            if filename.endswith(ext + '.gz') or filename.endswith(ext):
+                segments.append(os.path.join(directory, filename))
+    return sorted(segments)
+
+def open_segment(path):
+    """Open a log file or segment (plain or gzipped) for reading in binary mode"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def gzip_segment(segment):
+    """Compress a closed segment and remove the uncompressed copy"""
+    gz_path = segment + '.gz'
+    with open(segment, 'rb') as src, gzip.open(gz_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(segment)
+    return gz_path
+
+class SendLogWriter:
+    """Append-only JSONL writer with batched writes, fsync policy and rotation"""
+
+    def __init__(self, path, flush_lines=DEFAULT_FLUSH_LINES, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 fsync=DEFAULT_FSYNC, max_bytes=DEFAULT_MAX_BYTES, rotate=DEFAULT_ROTATE, compress=True):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Invalid fsync policy: {fsync} (expected one of {', '.join(FSYNC_POLICIES)})")
+        if rotate not in ROTATE_POLICIES:
+            raise ValueError(f"Invalid rotate policy: {rotate} (expected one of {', '.join(ROTATE_POLICIES)})")
+
+        self.path = path
+        self.flush_lines = max(1, int(flush_lines))
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate = rotate
+        self.compress = compress
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._fd = None
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def write(self, entry):
+        """Queue a log entry, flushing when the batch is full or old enough"""
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            self._buffer.append(line.encode('utf-8'))
+            due = (self.fsync == "always"
+                   or len(self._buffer) >= self.flush_lines
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+            if due:
+                self._flush_locked()
+            elif self._timer is None:
+                # Without further entries the batch would wait in memory until exit
+                self._timer = threading.Timer(self.flush_interval, self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            try:
+                self._flush_locked()
+            except OSError:
+                # The entries stay buffered for the next write or flush
+                pass
+
+    def flush(self):
+        """Write all buffered entries to disk"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Flush and release the file descriptor"""
+        with self._lock:
+            self._cancel_timer()
+            self._flush_locked()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+
+    def _open(self):
+        """(Re)open the active log file for appending"""
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _is_stale(self):
+        """True if another process rotated the file behind our descriptor"""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _needs_rotation(self, incoming):
+        """Check the rotation policy against the file we are about to append to"""
+        stat = os.fstat(self._fd)
+        if stat.st_size == 0:
+            return False
+        if self.rotate == "size":
+            return bool(self.max_bytes) and stat.st_size + incoming > self.max_bytes
+        if self.rotate == "daily":
+            return datetime.fromtimestamp(stat.st_mtime).date() != datetime.now().date()
+        return False
+
+    def rotate_now(self):
+        """Close the active file as a segment right away and return the segment path"""
+        with self._lock:
+            self._flush_locked()
+            self._lock_active()
+            try:
+                if os.fstat(self._fd).st_size == 0:
+                    return None
+                segment = unused_segment_path(self.path)
+                os.rename(self.path, segment)
+            finally:
+                self._release()
+            self._open()
+        if self.compress:
+            segment = gzip_segment(segment)
+        return segment
+
+    def _lock_active(self):
+        """Lock the file currently at self.path, following rotations by other processes"""
+        if self._fd is None:
+            self._open()
+        while True:
+            self._acquire()
+            if not self._is_stale():
+                return
+            # Another process rotated the file while we waited for the lock
+            self._release()
+            self._open()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _flush_locked(self):
+        if not self._buffer:
+            self._last_flush = time.monotonic()
+            return
+
+        data = b''.join(self._buffer)
+        segment = None
+        self._lock_active()
+        while self.rotate != "none" and self._needs_rotation(len(data)):
+            segment = unused_segment_path(self.path)
+            os.rename(self.path, segment)
+            self._release()
+            self._open()
+            self._lock_active()
+
+        try:
+            # Writing the whole batch under the lock keeps other processes' lines out of it
+            view = memoryview(data)
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            if self.fsync in ("flush", "always"):
+                os.fsync(self._fd)
+        finally:
+            self._release()
+
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._cancel_timer()
+
+        # Nobody appends to a renamed segment, so it can be compressed outside the lock
+        if segment and self.compress:
+            gzip_segment(segment)
+
+    def _acquire(self):
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def _release(self):
+        if FCNTL_AVAILABLE:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+@atexit.register
+def _close_all_writers():
+    """Make sure nothing buffered is lost when the process exits"""
+    for writer in list(_writers.values()):
+        try:
+            writer.close()
+        except OSError:
+            pass
+
+def writer_from_env(path):
+    """Build a writer using the SEND_LOG_* environment variables"""
+    return SendLogWriter(
+        path,
+        flush_lines=int(os.environ.get('SEND_LOG_FLUSH_LINES', DEFAULT_FLUSH_LINES)),
+        flush_interval=float(os.environ.get('SEND_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)),
+        fsync=os.environ.get('SEND_LOG_FSYNC', DEFAULT_FSYNC),
+        max_bytes=int(os.environ.get('SEND_LOG_MAX_BYTES', DEFAULT_MAX_BYTES)),
+        rotate=os.environ.get('SEND_LOG_ROTATE', DEFAULT_ROTATE),
+    )
+
+def get_writer(path):
+    """Return the process-wide writer for a log file"""
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = writer_from_env(path)
+            _writers[key] = writer
+        return writer
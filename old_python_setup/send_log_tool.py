@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Query and summarize the Twilio send log
+Keeps a persistent SQLite index of twilio_send_log.jsonl (byte offsets by code,
+phone and status plus the latest state of every code). The index is updated
+incrementally, so only lines appended since the last run are read.
+
+Usage:
+  python3 send_log_tool.py stats
+  python3 send_log_tool.py query --code 35659 [--history]
+  python3 send_log_tool.py query --phone 0712412132
+  python3 send_log_tool.py query --status error
+  python3 send_log_tool.py compact
+"""
+import os
+import re
+import json
+import sqlite3
+from datetime import datetime
+
+from send_log import get_writer, list_segments, open_segment
+from guest_normalize import normalize_code, normalize_phone
+
+# Log file (same as the Twilio scripts)
+LOG_FILE = "twilio_send_log.jsonl"
+INDEX_FILE = "twilio_send_log_index.sqlite"
+SNAPSHOT_FILE = "twilio_send_log_snapshot.jsonl"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS events (
+    offset INTEGER PRIMARY KEY,
+    code TEXT,
+    phone TEXT,
+    status TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS events_code ON events (code);
+CREATE INDEX IF NOT EXISTS events_phone ON events (phone);
+CREATE INDEX IF NOT EXISTS events_status ON events (status);
+CREATE TABLE IF NOT EXISTS status_counts (status TEXT PRIMARY KEY, count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS latest (
+    code TEXT PRIMARY KEY,
+    timestamp TEXT,
+    status TEXT,
+    phone TEXT,
+    entry TEXT
+);
+CREATE INDEX IF NOT EXISTS latest_status ON latest (status);
+CREATE INDEX IF NOT EXISTS latest_phone ON latest (phone);
+"""
+
+SEGMENT_TIME = re.compile(r'\.(\d{8}-\d{6}-\d{6})\.')
+
+class SendLogIndex:
+    """Incrementally maintained index over the send log"""
+
+    def __init__(self, log_path=LOG_FILE, index_path=INDEX_FILE):
+        self.log_path = log_path
+        self.db = sqlite3.connect(index_path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def _meta(self, key, default=None):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def update(self):
+        """Index everything appended since the last update; returns the number of new lines"""
+        inode = int(self._meta('inode', -1))
+        offset = int(self._meta('offset', 0))
+        indexed_at = self._meta('indexed_at', '')
+        added = 0
+
+        if not os.path.exists(self.log_path):
+            # Freshly rotated and nothing written yet: the new file starts empty
+            with open(self.log_path, 'ab'):
+                pass
+        stat = os.stat(self.log_path)
+
+        with self.db:
+            if inode != -1 and (inode != stat.st_ino or stat.st_size < offset):
+                # The file we indexed has been rotated: pick up its unread tail and any
+                # segments closed since, then start over on the new active file
+                added += self._index_rotated(indexed_at, offset)
+                self.db.execute("DELETE FROM events")
+                offset = 0
+
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                added_here, offset = self._index_stream(f, offset, keep_offsets=True)
+                added += added_here
+
+            self._set_meta('inode', stat.st_ino)
+            self._set_meta('offset', offset)
+            self._set_meta('indexed_at', datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+
+        return added
+
+    def _index_rotated(self, indexed_at, offset):
+        """Index the segments closed after the last update"""
+        segments = {}
+        for segment in list_segments(self.log_path):
+            match = SEGMENT_TIME.search(os.path.basename(segment))
+            if match and match.group(1) > indexed_at:
+                # Prefer the plain file if a segment is caught halfway through gzip
+                segments.setdefault(match.group(1), segment)
+
+        added = 0
+        for position, key in enumerate(sorted(segments)):
+            skip = offset if position == 0 else 0
+            with open_segment(segments[key]) as f:
+                f.seek(skip)
+                added_here, _ = self._index_stream(f, skip, keep_offsets=False)
+                added += added_here
+        return added
+
+    def _index_stream(self, f, offset, keep_offsets):
+        """Index complete lines from f starting at offset; returns (lines, new offset)"""
+        events = []
+        counts = {}
+        latest = {}
+
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Partially written line, pick it up next time
+                break
+            line_offset = offset
+            offset += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+
+            code = entry.get('code')
+            status = entry.get('status')
+            timestamp = entry.get('timestamp') or ''
+            events.append((line_offset, code, entry.get('phone'), status, timestamp))
+            counts[status] = counts.get(status, 0) + 1
+            if code:
+                current = latest.get(code)
+                if current is None or timestamp >= current[0]:
+                    latest[code] = (timestamp, status, entry.get('phone'), line.decode('utf-8').rstrip('\n'))
+
+        if keep_offsets:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO events (offset, code, phone, status, timestamp) VALUES (?, ?, ?, ?, ?)",
+                events)
+        self.db.executemany(
+            "INSERT INTO status_counts (status, count) VALUES (?, ?) "
+            "ON CONFLICT(status) DO UPDATE SET count = count + excluded.count",
+            [(status or 'unknown', count) for status, count in counts.items()])
+        self.db.executemany(
+            "INSERT INTO latest (code, timestamp, status, phone, entry) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(code) DO UPDATE SET timestamp = excluded.timestamp, status = excluded.status, "
+            "phone = excluded.phone, entry = excluded.entry WHERE excluded.timestamp >= latest.timestamp",
+            [(code,) + values for code, values in latest.items()])
+
+        return len(events), offset
+
+    def read_entries(self, offsets):
+        """Read full log entries at the given offsets of the active file"""
+        entries = []
+        with open(self.log_path, 'rb') as f:
+            for offset in offsets:
+                f.seek(offset)
+                entries.append(json.loads(f.readline()))
+        return entries
+
+    def summary(self):
+        events = dict(self.db.execute("SELECT status, count FROM status_counts"))
+        guests = dict(self.db.execute("SELECT status, COUNT(*) FROM latest GROUP BY status"))
+        return {
+            'events_total': sum(events.values()),
+            'events_by_status': events,
+            'codes_total': sum(guests.values()),
+            'codes_by_latest_status': guests,
+        }
+
+    def latest(self, code=None, phone=None, status=None):
+        query = "SELECT entry FROM latest WHERE 1 = 1"
+        params = []
+        if code:
+            query += " AND code = ?"
+            params.append(code)
+        if phone:
+            query += " AND phone = ?"
+            params.append(phone)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY timestamp"
+        return [json.loads(row[0]) for row in self.db.execute(query, params)]
+
+    def history(self, code=None, phone=None, status=None):
+        """All entries in the active log matching the filters, oldest first"""
+        query = "SELECT offset FROM events WHERE 1 = 1"
+        params = []
+        if code:
+            query += " AND code = ?"
+            params.append(code)
+        if phone:
+            query += " AND phone = ?"
+            params.append(phone)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY offset"
+        return self.read_entries([row[0] for row in self.db.execute(query, params)])
+
+    def write_snapshot(self, path=SNAPSHOT_FILE):
+        """Write the latest entry of every code to a JSONL snapshot"""
+        tmp_path = path + '.tmp'
+        count = 0
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for (entry,) in self.db.execute("SELECT entry FROM latest ORDER BY code"):
+                f.write(entry + '\n')
+                count += 1
+        os.replace(tmp_path, path)
+        return count
+
+def print_entries(entries, as_json=False):
+    if as_json:
+        for entry in entries:
+            print(json.dumps(entry))
+        return
+
+    print(f"{'Timestamp':<28} {'Code':<8} {'Status':<10} {'Phone':<16} {'Name':<30} Error")
+    print("-"*110)
+    for entry in entries:
+        print(f"{entry.get('timestamp', ''):<28} {entry.get('code') or '':<8} {entry.get('status') or '':<10} "
+              f"{entry.get('phone') or 'N/A':<16} {(entry.get('name') or '')[:30]:<30} {entry.get('error') or ''}")
+    print(f"\n{len(entries)} entries")
+
+def cmd_stats(index, args):
+    summary = index.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print("="*60)
+    print("SEND LOG SUMMARY")
+    print("="*60)
+    print(f"Events: {summary['events_total']}")
+    for status, count in sorted(summary['events_by_status'].items()):
+        print(f"  {status:<12} {count}")
+    print(f"\nCodes: {summary['codes_total']} (by latest status)")
+    for status, count in sorted(summary['codes_by_latest_status'].items()):
+        print(f"  {status:<12} {count}")
+    print("="*60)
+
+def cmd_query(index, args):
+    code, _ = normalize_code(args.code)
+    # Logged phones are normalized (+255...)
+    phone, _ = normalize_phone(args.phone)
+    if args.history:
+        entries = index.history(code=code, phone=phone, status=args.status)
+    else:
+        entries = index.latest(code=code, phone=phone, status=args.status)
+    print_entries(entries, as_json=args.json)
+
+def cmd_compact(index, args):
+    # Close the active file as a gzipped segment, fold it into the index and
+    # keep only the latest state per code in the snapshot
+    segment = get_writer(index.log_path).rotate_now()
+    index.update()
+    count = index.write_snapshot(args.snapshot)
+    print(f"Archived log segment: {segment or 'nothing to archive'}")
+    print(f"Wrote latest state for {count} codes to {args.snapshot}")
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Query and summarize the Twilio send log')
+    parser.add_argument('--log-file', default=LOG_FILE, help=f'Send log (default: {LOG_FILE})')
+    parser.add_argument('--index-file', default=INDEX_FILE, help=f'Index database (default: {INDEX_FILE})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stats_parser = subparsers.add_parser('stats', help='Summarize events and latest status per code')
+    stats_parser.add_argument('--json', action='store_true', help='Output JSON')
+
+    query_parser = subparsers.add_parser('query', help='Look up entries by code, phone or status')
+    query_parser.add_argument('--code', help='Invitation code')
+    query_parser.add_argument('--phone', help='Phone number')
+    query_parser.add_argument('--status', help='Status (pending, dry_run, sent, skipped, error)')
+    query_parser.add_argument('--history', action='store_true',
+                              help='Show every entry in the active log instead of the latest state')
+    query_parser.add_argument('--json', action='store_true', help='Output JSON lines')
+
+    compact_parser = subparsers.add_parser('compact', help='Archive the log and write a latest-state snapshot')
+    compact_parser.add_argument('--snapshot', default=SNAPSHOT_FILE, help=f'Snapshot file (default: {SNAPSHOT_FILE})')
+
+    args = parser.parse_args()
+
+    if args.command == 'query' and not (args.code or args.phone or args.status):
+        parser.error("query needs at least one of --code, --phone or --status")
+
+    index = SendLogIndex(args.log_file, args.index_file)
+    try:
+        index.update()
+        {'stats': cmd_stats, 'query': cmd_query, 'compact': cmd_compact}[args.command](index, args)
+    finally:
+        index.close()
+
+if __name__ == '__main__':
+    main()
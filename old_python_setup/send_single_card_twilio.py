@@ -8,6 +8,9 @@ import os
 import json
 from datetime import datetime
 
+from send_log import get_writer
+from guest_normalize import normalize_code, normalize_phone
+
 # Try to import Twilio
 try:
     from twilio.rest import Client
@@ -22,28 +25,6 @@ CARD_BASE_URL = "http://46.62.209.58/png"
 # Log file
 LOG_FILE = "twilio_send_log.jsonl"
 
-def format_tanzanian_phone(phone):
-    """Format Tanzanian phone number: replace leading 0 with +255"""
-    if not phone:
-        return None
-    
-    phone_str = str(phone).strip()
-    
-    # Remove any non-digit characters except +
-    phone_clean = ''.join(c for c in phone_str if c.isdigit() or c == '+')
-    
-    # If starts with 0, replace with +255
-    if phone_clean.startswith('0'):
-        phone_clean = '+255' + phone_clean[1:]
-    elif not phone_clean.startswith('+'):
-        # If no + and doesn't start with 0, assume it needs +255
-        if phone_clean.startswith('255'):
-            phone_clean = '+' + phone_clean
-        else:
-            phone_clean = '+255' + phone_clean
-    
-    return phone_clean
-
 def log_message(action, name, phone, code, status="pending", error=None):
     """Log message details"""
     log_entry = {
@@ -58,25 +39,34 @@ def log_message(action, name, phone, code, status="pending", error=None):
         "template_id": TWILIO_TEMPLATE_ID
     }
     
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(json.dumps(log_entry) + '\n')
+    get_writer(LOG_FILE).write(log_entry)
     
     return log_entry
 
+def deliver_card(client, from_number, formatted_phone, code, template_id=TWILIO_TEMPLATE_ID):
+    """Send the card template to one formatted phone number (raises on failure)"""
+    return client.messages.create(
+        from_=from_number,
+        to=f"whatsapp:{formatted_phone}",
+        content_sid=template_id,
+        content_variables=json.dumps({
+            "1": code,
+            "2": code
+        })
+    )
+
 def send_single_card(phone, code, twilio_account_sid, twilio_auth_token, from_number, dry_run=False):
     """Send a single card to a phone number"""
     
     # Format phone number
-    formatted_phone = format_tanzanian_phone(phone)
+    formatted_phone, _ = normalize_phone(phone)
     if not formatted_phone:
         print(f"Error: Invalid phone number: {phone}")
         return False
     
     # Ensure code is 5 digits with leading zeros
-    code_str = str(code).strip()
-    if code_str.isdigit():
-        code = code_str.zfill(5)
-    else:
+    code, valid = normalize_code(code)
+    if not valid:
         print(f"Error: Invalid code: {code}")
         return False
     
@@ -108,15 +98,7 @@ def send_single_card(phone, code, twilio_account_sid, twilio_auth_token, from_nu
         client = Client(twilio_account_sid, twilio_auth_token)
         
         # Send WhatsApp message with template
-        message = client.messages.create(
-            from_=from_number,
-            to=f"whatsapp:{formatted_phone}",
-            content_sid=TWILIO_TEMPLATE_ID,
-            content_variables=json.dumps({
-                "1": code,
-                "2": code
-            })
-        )
+        message = deliver_card(client, from_number, formatted_phone, code)
         
         log_message("send", "Single Send", formatted_phone, code, "sent", None)
         print(f"\n✓ MESSAGE SENT SUCCESSFULLY")
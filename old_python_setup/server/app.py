@@ -6,90 +6,48 @@ from flask import Flask, render_template, request, jsonify, redirect, url_for
 import os
 import sys
 
-# Try to read ODS file
-try:
-    import pandas as pd
-    HAS_PANDAS = True
-except ImportError:
-    HAS_PANDAS = False
-    # Fallback to XML parsing
-    import xml.etree.ElementTree as ET
-    import zipfile
+# The shared ODS reader and snapshot cache sit next to app.py when deployed,
+# one directory up in the repository
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from guest_snapshot import load_guest_rows
+from guest_normalize import normalize_code
 
 app = Flask(__name__)
 
 # Path to the database file
 DB_PATH = os.path.join(os.path.dirname(__file__), 'wedding_invites.ods')
 
-def normalize_code(code):
-    """Normalize code to 5-digit string with leading zeros"""
-    if code is None:
-        return None
-    code_str = str(code).strip()
-    # Remove any trailing .0 from float conversion
-    code_str = code_str.rstrip('.0')
-    # If it's all digits, pad to 5 digits
-    if code_str.isdigit():
-        return code_str.zfill(5)
-    return code_str
+# Guests of the last load, kept until the spreadsheet on disk changes
+_database = {'stat': None, 'guests': {}}
 
 def load_database():
-    """Load the guest database from ODS file"""
-    if not os.path.exists(DB_PATH):
+    """Load the guest database, re-reading the ODS snapshot only when the file changed"""
+    try:
+        stat = os.stat(DB_PATH)
+    except OSError:
         return {}
-    
+    key = (stat.st_size, stat.st_mtime_ns)
+    if _database['stat'] == key:
+        return _database['guests']
+
     guests = {}
-    
     try:
-        if HAS_PANDAS:
-            df = pd.read_excel(DB_PATH, engine='odf')
-            # Read code column as string to preserve leading zeros
-            df[df.columns[3]] = df.iloc[:, 3].astype(str)
-            for _, row in df.iterrows():
-                name = str(row.iloc[0]) if pd.notna(row.iloc[0]) else None
-                single_double = str(row.iloc[1]) if pd.notna(row.iloc[1]) else "Single"
-                code_raw = row.iloc[3]
-                
-                if pd.notna(code_raw) and code_raw != 'nan':
-                    code = normalize_code(code_raw)
-                else:
-                    code = None
-                
-                if name and code and name != 'nan' and code != 'nan':
-                    guests[code] = {
-                        'name': name,
-                        'type': single_double,
-                        'code': code
-                    }
-        else:
-            # Parse ODS XML directly
-            with zipfile.ZipFile(DB_PATH, 'r') as z:
-                content = z.read('content.xml')
-            root = ET.fromstring(content)
-            ns = {'table': 'urn:oasis:names:tc:opendocument:xmlns:table:1.0',
-                  'text': 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'}
-            
-            rows = root.findall('.//table:table-row', ns)
-            for row in rows:
-                cells = row.findall('.//table:table-cell', ns)
-                if len(cells) >= 4:
-                    name_elem = cells[0].find('.//text:p', ns)
-                    type_elem = cells[1].find('.//text:p', ns)
-                    code_elem = cells[3].find('.//text:p', ns)
-                    
-                    if name_elem is not None and name_elem.text and code_elem is not None and code_elem.text:
-                        name = name_elem.text.replace('&amp;', '&')
-                        single_double = type_elem.text if type_elem is not None and type_elem.text else "Single"
-                        code = normalize_code(code_elem.text)
-                        if code:
-                            guests[code] = {
-                                'name': name,
-                                'type': single_double,
-                                'code': code
-                            }
+        for row in load_guest_rows(DB_PATH):
+            code, _ = normalize_code(row['code'])
+            if code in guests:
+                # guest_tool.py lint reports these before the sheet is synced
+                print(f"Warning: code {code} of {row['name']} is already used by {guests[code]['name']}",
+                      file=sys.stderr)
+            guests[code] = {
+                'name': row['name'],
+                'type': row['type'],
+                'code': code
+            }
     except Exception as e:
         print(f"Error loading database: {e}", file=sys.stderr)
-    
+        return _database['guests']
+
+    _database.update(stat=key, guests=guests)
     return guests
 
 @app.route('/')
@@ -103,7 +61,7 @@ def verify_code(code):
     guests = load_database()
     
     # Normalize the input code
-    normalized_code = normalize_code(code)
+    normalized_code, _ = normalize_code(code)
     
     # Try normalized code first
     if normalized_code and normalized_code in guests:
@@ -144,7 +102,7 @@ def api_verify(code):
     guests = load_database()
     
     # Normalize the input code
-    normalized_code = normalize_code(code)
+    normalized_code, _ = normalize_code(code)
     
     # Try normalized code first
     if normalized_code and normalized_code in guests:
@@ -16,21 +16,22 @@ ssh "$SERVER" "mkdir -p $REMOTE_DIR/server/{templates,static/css}"
 # Copy application files
 echo "Copying application files..."
 rsync -avz --exclude='__pycache__' --exclude='*.pyc' \
-    app.py "$SERVER:$REMOTE_DIR/server/"
+    app.py ../ods_reader.py ../guest_snapshot.py ../guest_normalize.py "$SERVER:$REMOTE_DIR/server/"
 rsync -avz templates/ "$SERVER:$REMOTE_DIR/server/templates/"
 rsync -avz static/ "$SERVER:$REMOTE_DIR/server/static/"
 
 # Copy database file
 echo "Copying database file..."
 rsync -avz ../wedding_invites.ods "$SERVER:$REMOTE_DIR/server/"
+ssh "$SERVER" "cd $REMOTE_DIR/server && python3 guest_snapshot.py"
 
 # Install dependencies on server
 echo "Installing Python dependencies..."
 ssh "$SERVER" << 'ENDSSH'
     cd /opt/wedding/server
-    python3 -m pip install --break-system-packages flask pandas odfpy 2>/dev/null || \
-    apt-get update && apt-get install -y python3-flask python3-pandas python3-odfpy || \
-    python3 -m pip install flask pandas odfpy --user
+    python3 -m pip install --break-system-packages flask 2>/dev/null || \
+    apt-get update && apt-get install -y python3-flask || \
+    python3 -m pip install flask --user
 ENDSSH
 
 # Create nginx password file
@@ -1,38 +1,34 @@
 #!/bin/bash
 # Script to sync wedding invitation cards to the server
 # Cards will be accessible at http://46.62.209.58/png/{code}.png
+# WhatsApp variants (media_variants.py) at http://46.62.209.58/wa/{code}.jpg
 
 SERVER="root@46.62.209.58"
 REMOTE_DIR="/opt/wedding/cards"
+REMOTE_WA_DIR="/opt/wedding/cards_wa"
 LOCAL_CARDS_DIR="../cards"
+LOCAL_WA_DIR="../cards_whatsapp"
 
 if [ ! -d "$LOCAL_CARDS_DIR" ]; then
     echo "Error: $LOCAL_CARDS_DIR not found!"
     exit 1
 fi
 
-echo "Syncing cards to server..."
-echo "This will copy all PNG files from subfolders to the server"
-
-# Create temporary directory for flattened cards
-TEMP_DIR=$(mktemp -d)
-echo "Creating flattened card structure in $TEMP_DIR..."
-
-# Find all PNG files in subfolders and copy them with their code as filename
-find "$LOCAL_CARDS_DIR" -name "*.png" -type f | while read png_file; do
-    # Extract the code from filename (e.g., 77073.png -> 77073.png)
-    filename=$(basename "$png_file")
-    code="${filename%.png}"
-    
-    # Copy to temp directory with code as filename
-    cp "$png_file" "$TEMP_DIR/${code}.png"
-done
+if [ ! -d "$LOCAL_CARDS_DIR/png" ]; then
+    echo "Error: $LOCAL_CARDS_DIR/png not found, run generate_cards_and_messages.py first"
+    echo "(or python3 card_store.py --import for cards in the old per-guest folders)"
+    exit 1
+fi
 
-echo "Found $(ls -1 "$TEMP_DIR"/*.png 2>/dev/null | wc -l) cards to sync"
+echo "Syncing cards to server..."
+echo "This will copy the card store (objects/ and the png/ code aliases) to the server"
+echo "Found $(find "$LOCAL_CARDS_DIR/png" -name "*.png" | wc -l) cards to sync"
 
-# Sync to server
+# The store is already laid out as served: cards/objects/{hash[:2]}/{hash}.png,
+# and cards/png/{code[:2]}/{code}.png symlinks to them (kept as symlinks by -a).
+# Unchanged cards have the same name on both sides, so only new ones are sent.
 echo "Syncing to server..."
-rsync -avz --delete "$TEMP_DIR/" "$SERVER:$REMOTE_DIR/"
+rsync -avz --delete "$LOCAL_CARDS_DIR/objects" "$LOCAL_CARDS_DIR/png" "$SERVER:$REMOTE_DIR/"
 
 if [ $? -eq 0 ]; then
     echo "✓ Cards synced successfully!"
@@ -43,15 +39,27 @@ if [ $? -eq 0 ]; then
     
     echo "Cards are available at: http://46.62.209.58/png/{code}.png"
     
-    # Clean up temp directory
-    rm -rf "$TEMP_DIR"
+    # Sync the WhatsApp variants (already flat: {code}.jpg)
+    if [ -d "$LOCAL_WA_DIR" ]; then
+        echo "Syncing WhatsApp variants..."
+        rsync -avz --delete "$LOCAL_WA_DIR/" "$SERVER:$REMOTE_WA_DIR/"
+        ssh "$SERVER" "chown -R www-data:www-data $REMOTE_WA_DIR && chmod -R 755 $REMOTE_WA_DIR"
+        echo "Variants are available at: http://46.62.209.58/wa/{code}.jpg"
+    else
+        echo "⚠️  $LOCAL_WA_DIR not found, run media_variants.py to build the WhatsApp variants"
+    fi
     
     # Reload nginx on server to ensure new files are served
     ssh "$SERVER" "systemctl reload nginx" 2>/dev/null || true
     echo "✓ Nginx reloaded"
+    
+    # Fetch every variant once so the first Twilio fetches are served hot
+    if [ -d "$LOCAL_WA_DIR" ]; then
+        echo "Warming media cache..."
+        (cd .. && python3 media_variants.py --warm-only)
+    fi
 else
     echo "✗ Error syncing cards"
-    rm -rf "$TEMP_DIR"
     exit 1
 fi
 
@@ -15,11 +15,12 @@ rsync -avz "$LOCAL_PATH" "$SERVER:$REMOTE_PATH"
 
 if [ $? -eq 0 ]; then
     echo "✓ Spreadsheet synced successfully!"
-    echo "Restarting service on server..."
-    ssh "$SERVER" "systemctl restart wedding-verification || supervisorctl restart wedding-verification || pkill -f 'python.*app.py'"
-    echo "✓ Service restarted"
+    # The service notices the new file on the next request; building the
+    # snapshot here keeps that request fast (the service can't write the directory)
+    echo "Compiling guest snapshot on server..."
+    ssh "$SERVER" "cd $(dirname $REMOTE_PATH) && python3 guest_snapshot.py"
+    echo "✓ Snapshot up to date"
 else
     echo "✗ Error syncing spreadsheet"
     exit 1
 fi
-
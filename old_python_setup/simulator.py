@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Campaign throughput and cost simulator
+Replays a campaign on a virtual clock against a model of each channel: rate
+limit, requests in flight (fixed or adaptive), provider latency, transient and
+permanent failure rates and a throttling threshold. Uses the real retry
+scheduler, concurrency controller and campaign window, so the projection
+follows the same rules as a live send, in milliseconds instead of hours.
+
+Usage:
+  python3 simulator.py --guests 800 --whatsapp-rate 10 --latency-ms 300 --permanent-error-rate 0.1
+"""
+import heapq
+import itertools
+import random
+from collections import deque
+from datetime import datetime, timedelta
+
+from retry_scheduler import RetryScheduler, TRANSIENT, PERMANENT, DEFAULT_MAX_ATTEMPTS, DEFAULT_BASE_DELAY
+from transports import ConcurrencyController, SendError, WHATSAPP, SMS, DEFAULT_MAX_CONCURRENCY
+from sms_encoding import sms_segments
+
+class ChannelModel:
+    """How a channel behaves: our limits plus the provider's latency and failures"""
+
+    def __init__(self, rate=0, concurrency=4, adaptive=False, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 latency_ms=300.0, latency_jitter_ms=100.0, error_rate=0.0, permanent_error_rate=0.0,
+                 throttle_rps=0.0, price=0.0):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.adaptive = adaptive
+        self.max_concurrency = max_concurrency
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.permanent_error_rate = permanent_error_rate
+        self.throttle_rps = throttle_rps
+        # Per message on WhatsApp, per segment on SMS
+        self.price = price
+
+class _ChannelState:
+    def __init__(self, model, clock):
+        self.model = model
+        self.waiting = deque()
+        self.in_flight = 0
+        self.peak = 0
+        self.next_slot = 0.0
+        self.bucket = None
+        self.bucket_count = 0
+        self.requests = 0
+        self.delivered = 0
+        self.segments = 0
+        self.throttled = 0
+        self.controller = (ConcurrencyController(model.concurrency, maximum=model.max_concurrency, clock=clock)
+                           if model.adaptive else None)
+
+    def limit(self):
+        return self.controller.limit() if self.controller else self.model.concurrency
+
+def simulate_campaign(guests, models, primary=WHATSAPP, fallback=SMS, sms_text=None,
+                      max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                      window=None, pace=None, spread=False, start=None, seed=1):
+    """Simulate sending to guests; returns a results dict like benchmark_senders.run_benchmark
+
+    `models` maps channel -> ChannelModel. `sms_text(guest)` gives the SMS body
+    for segment counts. `window`/`pace`/`spread` are the campaign options of
+    send_cards_twilio.py, starting at `start` (default: now).
+    """
+    from campaign import plan_delays
+
+    rng = random.Random(seed)
+    now = [0.0]
+    clock = lambda: now[0]
+    scheduler = RetryScheduler(max_attempts=max_attempts, base_delay=base_delay, clock=clock, sleep=lambda s: None,
+                               rng=rng)
+    states = {channel: _ChannelState(model, clock) for channel, model in models.items()}
+    fallback = fallback if fallback in states and fallback != primary else None
+    sms_text = sms_text or (lambda guest: "")
+
+    start = start or (window.now() if window else datetime.now().astimezone())
+    delays = plan_delays(guests, window, pace, spread, now=start) if (window or pace or spread) else {}
+    for guest in guests:
+        scheduler.add((guest['code'], primary), (guest, primary), delays.get(guest['code'], 0.0))
+
+    finished = []  # heap of (time, seq, channel, key, guest, attempt, outcome, rtt)
+    counter = itertools.count()
+    failures = []
+    delivered = 0
+    last_event = 0.0
+
+    def window_wait():
+        if not window:
+            return 0.0
+        return window.seconds_until_open(start + timedelta(seconds=now[0]))
+
+    def dispatch(channel, state, key, guest, attempt):
+        model = state.model
+        begin = max(now[0], state.next_slot)
+        if model.rate:
+            state.next_slot = begin + 1.0 / model.rate
+        state.in_flight += 1
+        state.peak = max(state.peak, state.in_flight)
+        state.requests += 1
+        saturated = state.controller.started() if state.controller else False
+
+        # The provider counts requests per second to decide when to throttle
+        second = int(begin)
+        if state.bucket != second:
+            state.bucket, state.bucket_count = second, 0
+        state.bucket_count += 1
+        roll = rng.random()
+        if model.throttle_rps and state.bucket_count > model.throttle_rps:
+            outcome = 'throttled'
+        elif roll < model.permanent_error_rate:
+            outcome = 'rejected'
+        elif roll < model.permanent_error_rate + model.error_rate:
+            outcome = 'error'
+        else:
+            outcome = 'ok'
+        rtt = max(0.01, rng.gauss(model.latency_ms, model.latency_jitter_ms) / 1000.0)
+        heapq.heappush(finished, (begin + rtt, next(counter), channel, key, guest, attempt, outcome, rtt, saturated))
+
+    while scheduler or finished or any(state.waiting for state in states.values()):
+        for key, (guest, channel), attempt in scheduler.pop_due():
+            states[channel].waiting.append((key, guest, attempt))
+
+        paused = window_wait()
+        if not paused:
+            for channel, state in states.items():
+                while state.waiting and state.in_flight < state.limit():
+                    dispatch(channel, state, *state.waiting.popleft())
+
+        # Jump to the next thing that can happen
+        candidates = []
+        if finished:
+            candidates.append(finished[0][0])
+        due_in = scheduler.next_due_in()
+        if due_in is not None:
+            candidates.append(now[0] + due_in)
+        if paused:
+            candidates.append(now[0] + paused)
+        if not candidates:
+            break
+        now[0] = max(now[0], min(candidates))
+
+        while finished and finished[0][0] <= now[0]:
+            done_at, _, channel, key, guest, attempt, outcome, rtt, saturated = heapq.heappop(finished)
+            state = states[channel]
+            state.in_flight -= 1
+            last_event = max(last_event, done_at)
+
+            if outcome == 'ok':
+                if state.controller:
+                    state.controller.finished(rtt, None, saturated)
+                state.delivered += 1
+                delivered += 1
+                if channel == SMS:
+                    state.segments += sms_segments(sms_text(guest))
+                continue
+
+            status = {'throttled': 429, 'error': 503, 'rejected': 400}[outcome]
+            if state.controller:
+                state.controller.finished(rtt, SendError(outcome, status=status), saturated)
+            state.throttled += outcome == 'throttled'
+            classification = PERMANENT if outcome == 'rejected' else TRANSIENT
+            if scheduler.retry(key, (guest, channel), classification) is not None:
+                continue
+            if classification == PERMANENT and channel == primary and fallback:
+                scheduler.add((guest['code'], fallback), (guest, fallback))
+                continue
+            failures.append({'code': guest['code'], 'channel': channel, 'classification': classification})
+
+    channels = {}
+    for channel, state in states.items():
+        units = state.segments if channel == SMS else state.delivered
+        channels[channel] = {
+            'requests': state.requests,
+            'delivered': state.delivered,
+            'segments': state.segments if channel == SMS else None,
+            'throttled': state.throttled,
+            'peak_in_flight': state.peak,
+            'cost': round(units * state.model.price, 2),
+        }
+        if state.controller:
+            channels[channel]['concurrency'] = state.controller.stats()
+
+    return {
+        'guests': len(guests),
+        'delivered': delivered,
+        'failed': len(failures),
+        'retries': scheduler.retries,
+        'seconds': round(last_event, 1),
+        'ends_at': (start + timedelta(seconds=last_event)).isoformat(timespec='minutes'),
+        'messages_per_second': round(delivered / last_event, 2) if last_event else 0.0,
+        'cost': round(sum(c['cost'] for c in channels.values()), 2),
+        'channels': channels,
+    }
+
+def print_simulation(results):
+    print("\n" + "="*80)
+    print("SIMULATED CAMPAIGN")
+    print("="*80)
+    hours, rest = divmod(int(results['seconds']), 3600)
+    print(f"Guests:          {results['guests']}")
+    print(f"Delivered:       {results['delivered']}")
+    print(f"Failed:          {results['failed']}")
+    print(f"Retries:         {results['retries']}")
+    print(f"Duration:        {hours}h {rest // 60:02d}m {rest % 60:02d}s (finishes {results['ends_at']})")
+    print(f"Throughput:      {results['messages_per_second']:.2f} msg/s")
+    if results['cost']:
+        print(f"Cost:            {results['cost']:.2f}")
+    for channel, stats in results['channels'].items():
+        segments = f", {stats['segments']} segments" if stats['segments'] is not None else ""
+        print(f"\n  {channel}: {stats['requests']} requests, {stats['delivered']} delivered{segments}")
+        print(f"    peak {stats['peak_in_flight']} in flight, {stats['throttled']} throttled")
+        if 'concurrency' in stats:
+            window = stats['concurrency']
+            print(f"    adaptive window {window['window']} (peak {window['peak']}, {window['decreases']} backoffs)")
+        if stats['cost']:
+            print(f"    cost {stats['cost']:.2f}")
+    print("="*80)
+
+def main():
+    """Main function"""
+    import argparse
+    import json
+    from benchmark_senders import synthetic_guests
+    from campaign import SendWindow, CAMPAIGN_TIMEZONE
+
+    parser = argparse.ArgumentParser(description='Project the duration and cost of a campaign')
+    parser.add_argument('--guests', type=int, default=500, help='Synthetic guests (default: 500)')
+    parser.add_argument('--channel', choices=[WHATSAPP, SMS], default=WHATSAPP, help='Primary channel')
+    parser.add_argument('--no-fallback', action='store_true', help='Disable WhatsApp to SMS fallback')
+    parser.add_argument('--whatsapp-rate', type=float, default=10, help='WhatsApp msg/s (default: 10)')
+    parser.add_argument('--whatsapp-concurrency', type=int, default=4, help='WhatsApp requests in flight (default: 4)')
+    parser.add_argument('--sms-rate', type=float, default=5, help='SMS msg/s (default: 5)')
+    parser.add_argument('--sms-concurrency', type=int, default=2, help='SMS requests in flight (default: 2)')
+    parser.add_argument('--adaptive', action='store_true', help='Adaptive concurrency')
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='Provider mean latency (default: 300)')
+    parser.add_argument('--latency-jitter-ms', type=float, default=100.0, help='Latency std deviation (default: 100)')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='Transient error rate (default: 0.01)')
+    parser.add_argument('--permanent-error-rate', type=float, default=0.05,
+                        help='Permanent error rate, e.g. guests not on WhatsApp (default: 0.05)')
+    parser.add_argument('--throttle-rps', type=float, default=0.0, help='Provider 429 threshold (default: none)')
+    parser.add_argument('--whatsapp-price', type=float, default=0.0, help='Price per WhatsApp message')
+    parser.add_argument('--sms-price', type=float, default=0.0, help='Price per SMS segment')
+    parser.add_argument('--sms-text', default="Mwaliko wa harusi. Namba ya mwaliko {code}", help='SMS body template')
+    parser.add_argument('--window', help='Send window, e.g. 09:00-20:00')
+    parser.add_argument('--pace', type=float, help='At most this many messages per minute')
+    parser.add_argument('--spread', action='store_true', help='Spread evenly over the window')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    args = parser.parse_args()
+
+    provider = dict(latency_ms=args.latency_ms, latency_jitter_ms=args.latency_jitter_ms, error_rate=args.error_rate,
+                    throttle_rps=args.throttle_rps, adaptive=args.adaptive)
+    models = {SMS: ChannelModel(args.sms_rate, args.sms_concurrency, price=args.sms_price, **provider)}
+    if args.channel == WHATSAPP:
+        models[WHATSAPP] = ChannelModel(args.whatsapp_rate, args.whatsapp_concurrency, price=args.whatsapp_price,
+                                        permanent_error_rate=args.permanent_error_rate, **provider)
+    window = SendWindow.parse(args.window, CAMPAIGN_TIMEZONE) if args.window else None
+
+    results = simulate_campaign(synthetic_guests(args.guests), models, primary=args.channel,
+                                fallback=None if args.no_fallback else SMS,
+                                sms_text=lambda guest: args.sms_text.format(code=guest['code']),
+                                window=window, pace=args.pace / 60.0 if args.pace else None, spread=args.spread)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_simulation(results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Client for the sms.co.tz HTTP API
+Requests go over per-thread keep-alive HTTPS connections (no TLS handshake per
+message) with the credentials encoded once. Messages with the same text can go
+out as one request to many recipients, and a list of messages is submitted
+concurrently.
+
+Usage:
+  python3 sms_client.py balance
+  python3 sms_client.py senderids
+  python3 sms_client.py send 0712412132 "Test message" [--sender-id SMS.co.tz]
+"""
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from preflight import ConnectionPool
+from retry_scheduler import TRANSIENT, PERMANENT
+
+SMS_API_URL = "https://www.sms.co.tz/api.php"
+SMS_DEFAULT_SENDER_ID = "SMS.co.tz"
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_WORKERS = 8
+
+# Recipients per multi-recipient request; keeps the URL well under server limits
+MAX_RECIPIENTS = 100
+
+# How long a send waits for others with the same text to join its request
+BATCH_LINGER = 0.05
+
+# Sender IDs tried when the configured one is not approved for the account
+SENDER_ID_CANDIDATES = ['SMS.co.tz', 'SMS', 'Wedding', 'MITIKAZINC', 'mitikazinc']
+
+# The approved sender ID is remembered per account for a day
+SENDER_ID_CACHE_FILE = "sms_sender_id_cache.json"
+SENDER_ID_TTL = 24 * 3600
+
+# Response words that mean "try again later" rather than "this message is bad"
+TRANSIENT_WORDS = ('busy', 'try again', 'timeout', 'throttl', 'too many')
+
+class SmsApiError(Exception):
+    """An ERR response or unexpected HTTP status from the SMS API"""
+
+    def __init__(self, message, status=None, classification=None):
+        super().__init__(message)
+        self.code = None
+        self.status = status
+        self.classification = classification
+
+def classify_sms_error(result):
+    """Classify an ERR response from the SMS API"""
+    lowered = result.lower()
+    if any(word in lowered for word in TRANSIENT_WORDS):
+        return TRANSIENT
+    return PERMANENT
+
+def sender_rejected(error):
+    """Whether an error says the sender ID is not (or no longer) approved"""
+    return isinstance(error, SmsApiError) and 'sender' in str(error).lower()
+
+def parse_balance(text):
+    """Credits from a balance response such as '1234' or 'OK: 1,234.5'"""
+    match = re.search(r'-?\d[\d,]*(?:\.\d+)?', text)
+    if not match:
+        raise ValueError(f"Unexpected balance response: {text}")
+    return float(match.group().replace(',', ''))
+
+def parse_sender_ids(text):
+    """Sender IDs from a senderids response (comma, space or line separated)"""
+    return [sender_id for sender_id in re.split(r'[,;\s]+', text) if sender_id]
+
+def format_phone_for_sms(phone):
+    """Format phone number for SMS API (255 without +)"""
+    if not phone:
+        return None
+
+    phone_clean = ''.join(c for c in str(phone).strip() if c.isdigit() or c == '+')
+    if phone_clean.startswith('0'):
+        phone_clean = '255' + phone_clean[1:]
+    elif phone_clean.startswith('+255'):
+        phone_clean = phone_clean[1:]
+    elif not phone_clean.startswith('255'):
+        phone_clean = '255' + phone_clean.lstrip('+')
+
+    return phone_clean
+
+class SmsClient:
+    """Thread-safe sms.co.tz client; share one instance between all sending threads"""
+
+    def __init__(self, username, password, sender_id=SMS_DEFAULT_SENDER_ID, api_url=SMS_API_URL,
+                 timeout=DEFAULT_TIMEOUT, max_recipients=MAX_RECIPIENTS):
+        self.username = username
+        self.sender_id = sender_id
+        # What was configured, as opposed to what resolve_sender_id settled on
+        self.requested_sender_id = sender_id
+        self.sender_id_cache = None
+        # Sender IDs the provider refused during this run
+        self.rejected_sender_ids = set()
+        self._sender_lock = threading.Lock()
+        self.api_url = api_url
+        self.max_recipients = max(1, max_recipients)
+        self.pool = ConnectionPool(timeout=timeout)
+        # Encoded once instead of for every request
+        self._auth = urllib.parse.urlencode({'username': username, 'password': password})
+
+    def request(self, action, **params):
+        """Call the API; returns the response text without the 'OK:' prefix or raises SmsApiError"""
+        query = urllib.parse.urlencode(dict(params, do=action))
+        # A sent SMS must not be sent again because its response was lost
+        response = self.pool.request('GET', f"{self.api_url}?{query}&{self._auth}", idempotent=action != 'sms')
+        result = response.body.decode('utf-8').strip()
+        if response.status != 200:
+            raise SmsApiError(result or f"HTTP {response.status}", status=response.status)
+        if result.startswith('ERR'):
+            raise SmsApiError(result, classification=classify_sms_error(result))
+        return result[3:].strip() if result.startswith('OK:') else result
+
+    def balance(self):
+        return self.request('balance')
+
+    def sender_ids(self):
+        return self.request('senderids')
+
+    def resolve_sender_id(self, candidates=SENDER_ID_CANDIDATES, cache_file=SENDER_ID_CACHE_FILE,
+                          ttl=SENDER_ID_TTL):
+        """Pick an approved sender ID once and reuse it; returns (sender_id, 'cached'/'resolved'/'unverified')
+
+        The configured sender ID wins if the account has it approved, otherwise
+        the first approved candidate. The choice is cached for `ttl` seconds.
+        Sender IDs rejected during this run are never picked, nor taken from the cache.
+        """
+        self.sender_id_cache = cache_file
+        cache = load_sender_id_cache(cache_file)
+        entry = cache.get(self.username)
+        requested = self.requested_sender_id
+        if (entry and entry.get('requested') == requested and time.time() - entry['resolved_at'] < ttl
+                and entry['sender_id'] not in self.rejected_sender_ids):
+            self.sender_id = entry['sender_id']
+            return self.sender_id, 'cached'
+
+        try:
+            rejected = {sender_id.lower() for sender_id in self.rejected_sender_ids}
+            approved = [sender_id for sender_id in parse_sender_ids(self.sender_ids())
+                        if sender_id.lower() not in rejected]
+        except (SmsApiError, OSError):
+            approved = []
+        if not approved:
+            # Nothing to check against: keep the configured one and ask again next time
+            return self.sender_id, 'unverified'
+
+        preferred = [requested] + [c for c in candidates if c != requested]
+        lowered = {sender_id.lower(): sender_id for sender_id in approved}
+        self.sender_id = next((lowered[c.lower()] for c in preferred if c.lower() in lowered), approved[0])
+        cache[self.username] = {'requested': requested, 'sender_id': self.sender_id, 'resolved_at': time.time()}
+        save_sender_id_cache(cache_file, cache)
+        return self.sender_id, 'resolved'
+
+    def send(self, recipients, message, sender_id=None):
+        """Send one text to one number or a list of numbers in a single request; returns the message id
+
+        When the resolved sender ID is rejected (its approval was withdrawn),
+        another approved one is picked and the text is sent once more with it.
+        """
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        current = sender_id or self.sender_id
+        if current in self.rejected_sender_ids:
+            raise SmsApiError(f"Sender ID {current} was rejected and no other one is approved",
+                              classification=PERMANENT)
+        try:
+            return self.request('sms', senderid=current, dest=','.join(recipients), msg=message)
+        except SmsApiError as e:
+            if not (self.sender_id_cache and sender_rejected(e)):
+                raise
+            if sender_id:
+                # Chosen by the caller: only make the next run resolve again
+                forget_sender_id(self.sender_id_cache, self.username)
+                raise
+            replacement = self.replace_sender_id(current)
+            if replacement is None:
+                raise
+        # A rejected request sent nothing, so it is safe to send again
+        return self.request('sms', senderid=replacement, dest=','.join(recipients), msg=message)
+
+    def replace_sender_id(self, rejected):
+        """Resolve a sender ID other than the rejected one; returns it, or None when there is none"""
+        with self._sender_lock:
+            if self.sender_id != rejected:
+                # Another thread already replaced it
+                return self.sender_id
+            self.rejected_sender_ids.add(rejected)
+            # Approval was withdrawn: the cached choice is stale for the next run too
+            forget_sender_id(self.sender_id_cache, self.username)
+            sender_id, _ = self.resolve_sender_id(cache_file=self.sender_id_cache)
+            if sender_id in self.rejected_sender_ids:
+                return None
+            print(f"⚠️  SMS sender ID {rejected} was rejected, switching to {sender_id}")
+            return sender_id
+
+    def send_each(self, recipients, message, error):
+        """After a multi-recipient request failed with error, find out which recipients it was for
+
+        A permanent error may be about a single bad number, so each recipient is
+        sent on its own. Returns {msisdn: (message_id, error)}, one of the two being None.
+        """
+        if len(recipients) < 2 or getattr(error, 'classification', None) != PERMANENT or sender_rejected(error):
+            return {msisdn: (None, error) for msisdn in recipients}
+        results = {}
+        for msisdn in dict.fromkeys(recipients):
+            try:
+                results[msisdn] = (self.send(msisdn, message), None)
+            except Exception as e:
+                results[msisdn] = (None, e)
+        return results
+
+    def send_many(self, messages, workers=DEFAULT_WORKERS):
+        """Send (phone, text) pairs concurrently, one request per text and chunk of recipients
+
+        Returns {msisdn: (message_id, error)}, one of the two being None.
+        """
+        by_text = {}
+        for phone, text in messages:
+            msisdn = format_phone_for_sms(phone)
+            if msisdn:
+                by_text.setdefault(text, []).append(msisdn)
+        requests = [
+            (text, msisdns[i:i + self.max_recipients])
+            for text, msisdns in by_text.items()
+            for i in range(0, len(msisdns), self.max_recipients)
+        ]
+
+        def submit(request):
+            text, chunk = request
+            try:
+                message_id = self.send(chunk, text)
+            except Exception as e:
+                return self.send_each(chunk, text, e)
+            return {msisdn: (message_id, None) for msisdn in chunk}
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sms") as executor:
+            for chunk_results in executor.map(submit, requests):
+                results.update(chunk_results)
+        return results
+
+def load_sender_id_cache(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_sender_id_cache(path, cache):
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, path)
+
+def forget_sender_id(path, username):
+    cache = load_sender_id_cache(path)
+    if cache.pop(username, None) is not None:
+        save_sender_id_cache(path, cache)
+
+class CreditGuard:
+    """Running SMS balance that refuses sends once it would drop below a reserve"""
+
+    def __init__(self, balance, reserve=0):
+        self.balance = balance
+        self.reserve = reserve
+        self.used = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    def take(self, credits):
+        """Reserve credits for a message; False if the balance does not allow it"""
+        with self._lock:
+            if self.balance - credits < self.reserve:
+                self.refused += 1
+                return False
+            self.balance -= credits
+            self.used += credits
+            return True
+
+    def refund(self, credits):
+        with self._lock:
+            self.balance += credits
+            self.used -= credits
+
+    def update(self, balance):
+        """Take a fresh balance from the provider, which also counts what other senders spent"""
+        with self._lock:
+            self.balance = balance
+
+class RecipientBatcher:
+    """Joins concurrent sends of the same text into multi-recipient requests
+
+    The first thread to send a text waits up to `linger` seconds (less if the
+    batch fills up) for others with the same text, then makes one request for
+    all of them; every caller gets that request's result or exception, unless a
+    permanent error makes the recipients be sent one by one (SmsClient.send_each).
+    Every waiting caller holds a sending thread, so a batch never grows beyond
+    the number of sends in flight.
+    """
+
+    def __init__(self, client, linger=BATCH_LINGER, max_recipients=None):
+        self.client = client
+        self.linger = linger
+        self.max_recipients = max_recipients or client.max_recipients
+        self._open = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+
+    def send(self, msisdn, message):
+        with self._lock:
+            batch = self._open.get(message)
+            leader = batch is None
+            if leader:
+                batch = self._open[message] = {'recipients': [], 'full': threading.Event(),
+                                               'done': threading.Event(), 'results': None}
+            batch['recipients'].append(msisdn)
+            if len(batch['recipients']) >= self.max_recipients:
+                # Later senders of this text start a new batch
+                del self._open[message]
+                batch['full'].set()
+
+        if not leader:
+            batch['done'].wait()
+        else:
+            batch['full'].wait(self.linger)
+            with self._lock:
+                if self._open.get(message) is batch:
+                    del self._open[message]
+                self.requests += 1
+            recipients = batch['recipients']
+            try:
+                message_id = self.client.send(recipients, message)
+                batch['results'] = {recipient: (message_id, None) for recipient in recipients}
+            except Exception as e:
+                batch['results'] = self.client.send_each(recipients, message, e)
+            finally:
+                if batch['results'] is None:
+                    # Interrupted: nobody's message is known to have gone out
+                    batch['results'] = {recipient: (None, RuntimeError("SMS batch was not sent"))
+                                        for recipient in batch['recipients']}
+                batch['done'].set()
+
+        message_id, error = batch['results'][msisdn]
+        if error is not None:
+            raise error
+        return message_id
+
+def main():
+    """Main function"""
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='sms.co.tz API client')
+    parser.add_argument('--username', help='SMS username (or set SMS_USERNAME env var)')
+    parser.add_argument('--password', help='SMS password (or set SMS_PASSWORD env var)')
+    parser.add_argument('--api-url', default=SMS_API_URL, help=f'API endpoint (default: {SMS_API_URL})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('balance', help='Show the account balance')
+    subparsers.add_parser('senderids', help='List the approved sender IDs')
+    send_parser = subparsers.add_parser('send', help='Send one message')
+    send_parser.add_argument('phone', help='Phone number(s), comma separated')
+    send_parser.add_argument('message', help='Message text')
+    send_parser.add_argument('--sender-id', default=os.environ.get('SMS_SENDER_ID') or SMS_DEFAULT_SENDER_ID,
+                             help=f'Sender ID (or set SMS_SENDER_ID env var, default: {SMS_DEFAULT_SENDER_ID})')
+    args = parser.parse_args()
+
+    username = args.username or os.environ.get('SMS_USERNAME')
+    password = args.password or os.environ.get('SMS_PASSWORD')
+    if not username or not password:
+        print("Error: SMS credentials required (--username/--password or SMS_USERNAME/SMS_PASSWORD)")
+        sys.exit(1)
+
+    client = SmsClient(username, password, api_url=args.api_url)
+    try:
+        if args.command == 'balance':
+            print(f"Balance: {client.balance()}")
+        elif args.command == 'senderids':
+            print(f"Sender IDs: {client.sender_ids()}")
+        else:
+            recipients = [format_phone_for_sms(phone) for phone in args.phone.split(',')]
+            message_id = client.send(recipients, args.message, args.sender_id)
+            print(f"✓ Sent to {', '.join(recipients)} (message id {message_id})")
+    except (SmsApiError, OSError) as e:
+        print(f"✗ Error: {e}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+SMS encoding and segment analysis
+A message made only of GSM-7 characters fits 160 characters in one SMS (153
+per part when split); a single other character (curly quote, emoji, most
+accented letters) switches the whole message to UCS-2 with 70 (67) per part,
+doubling or tripling the segments billed and sent. This analyzes every rendered
+SMS, writes a per-campaign report, and can transliterate messages to GSM-7.
+
+Usage:
+  python3 sms_encoding.py                      # Report on the SMS texts in cards/manifest.jsonl
+  python3 sms_encoding.py --transliterate      # Show what transliteration would save
+  python3 sms_encoding.py --transliterate --write
+"""
+import csv
+import os
+import unicodedata
+
+from message_manifest import load_manifest, write_manifest, MANIFEST_FILE
+
+# Characters of the GSM 03.38 basic set (one septet each) and its extension table (two septets)
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENDED = set("^{}\\[~]|€\f")
+
+GSM7 = "GSM-7"
+UCS2 = "UCS-2"
+
+# Characters per single SMS and per part of a split one
+SEGMENT_SIZES = {GSM7: (160, 153), UCS2: (70, 67)}
+
+# Common characters outside GSM-7 and their closest GSM-7 spelling
+TRANSLITERATIONS = {
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '′': "'", '`': "'", '´': "'",
+    '“': '"', '”': '"', '„': '"', '″': '"', '«': '"', '»': '"',
+    '–': '-', '—': '-', '‒': '-', '−': '-', '‐': '-', '‑': '-',
+    '…': '...', '•': '-', '·': '.',
+    '\u00a0': ' ', '\u2007': ' ', '\u2009': ' ', '\u200a': ' ', '\u202f': ' ', '\t': ' ',
+    '\u200b': '', '\u200d': '', '\ufe0f': '', '\ufeff': '',
+    '©': '(c)', '®': '(R)', '™': 'TM', '°': 'o', '×': 'x', '÷': '/',
+    'ç': 'c', 'œ': 'oe', 'Œ': 'OE', 'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D',
+}
+
+SMS_SEGMENT_REPORT_FILE = "sms_segment_report.csv"
+
+def is_gsm7(text):
+    return all(c in GSM7_BASIC or c in GSM7_EXTENDED for c in text)
+
+def analyze(text):
+    """Encoding, length in characters as billed, segments and the characters forcing UCS-2"""
+    if is_gsm7(text):
+        encoding = GSM7
+        length = sum(2 if c in GSM7_EXTENDED else 1 for c in text)
+        offending = []
+    else:
+        encoding = UCS2
+        # Characters outside the Basic Multilingual Plane (most emoji) take two UCS-2 units
+        length = len(text.encode('utf-16-le')) // 2
+        offending = sorted({c for c in text if c not in GSM7_BASIC and c not in GSM7_EXTENDED})
+    single, multi = SEGMENT_SIZES[encoding]
+    segments = 1 if length <= single else -(-length // multi)
+    return {'encoding': encoding, 'length': length, 'segments': segments, 'offending': offending}
+
+def sms_segments(text):
+    """Number of SMS parts a message is billed as (GSM-7 160/153, otherwise UCS-2 70/67)"""
+    return analyze(text)['segments']
+
+def transliterate_char(c):
+    if c in GSM7_BASIC or c in GSM7_EXTENDED:
+        return c
+    if c in TRANSLITERATIONS:
+        return TRANSLITERATIONS[c]
+    # Accented letters: drop the accent if the base letter is GSM-7 (á -> a)
+    base = ''.join(d for d in unicodedata.normalize('NFKD', c) if not unicodedata.combining(d))
+    if base and all(d in GSM7_BASIC for d in base):
+        return base
+    # Emoji and anything else without a GSM-7 spelling
+    return ''
+
+def transliterate(text):
+    """The text with every character outside GSM-7 replaced by its closest GSM-7 spelling"""
+    out = []
+    dropped = False
+    for c in text:
+        replacement = transliterate_char(c)
+        if not replacement:
+            dropped = True
+            continue
+        if dropped:
+            # A removed character must not leave a double space, or a space at either end of a line
+            if replacement[0] == ' ' and (not out or out[-1] in ' \n'):
+                replacement = replacement[1:]
+            elif replacement[0] == '\n' and out and out[-1] == ' ':
+                out.pop()
+            dropped = False
+        out.extend(replacement)
+    if dropped and out and out[-1] == ' ':
+        out.pop()
+    return ''.join(out)
+
+def analyze_messages(messages, transliterated=False):
+    """Report rows for {code: text}, optionally with the transliterated text's figures"""
+    rows = []
+    for code, text in messages.items():
+        info = analyze(text)
+        row = {
+            'code': code,
+            'encoding': info['encoding'],
+            'length': info['length'],
+            'segments': info['segments'],
+            'offending': ''.join(info['offending']),
+        }
+        if transliterated:
+            fixed = analyze(transliterate(text))
+            row['transliterated_segments'] = fixed['segments']
+            row['transliterated_length'] = fixed['length']
+        rows.append(row)
+    return rows
+
+def write_report(rows, path=SMS_SEGMENT_REPORT_FILE):
+    if not rows:
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+def summarize(rows):
+    """Totals of a report: messages, segments, UCS-2 messages, multi-part messages"""
+    summary = {
+        'messages': len(rows),
+        'segments': sum(row['segments'] for row in rows),
+        'ucs2': sum(1 for row in rows if row['encoding'] == UCS2),
+        'multipart': sum(1 for row in rows if row['segments'] > 1),
+        'offending': ''.join(sorted({c for row in rows for c in row['offending']})),
+    }
+    if rows and 'transliterated_segments' in rows[0]:
+        summary['transliterated_segments'] = sum(row['transliterated_segments'] for row in rows)
+    return summary
+
+def print_summary(summary):
+    print(f"SMS messages: {summary['messages']}, {summary['segments']} segments")
+    if summary['ucs2']:
+        shown = ' '.join(repr(c) for c in summary['offending'])
+        print(f"⚠️  {summary['ucs2']} messages are sent as UCS-2 (70 characters per SMS) because of: {shown}")
+    if summary['multipart']:
+        print(f"⚠️  {summary['multipart']} messages need more than one SMS")
+    saved = summary['segments'] - summary.get('transliterated_segments', summary['segments'])
+    if saved:
+        print(f"Transliterated to GSM-7: {summary['transliterated_segments']} segments ({saved} fewer)")
+
+def load_card_messages(manifest_file=MANIFEST_FILE):
+    """{code: text} of every SMS in the message manifest"""
+    return {code: entry['sms'] for code, entry in sorted(load_manifest(manifest_file).items())}
+
+def main():
+    """Main function"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='SMS encoding and segment report for the generated messages')
+    parser.add_argument('--manifest', default=MANIFEST_FILE, help=f'Message manifest (default: {MANIFEST_FILE})')
+    parser.add_argument('--template', default='message_sms.txt', help='SMS template (default: message_sms.txt)')
+    parser.add_argument('--report', default=SMS_SEGMENT_REPORT_FILE,
+                        help=f'Report file (default: {SMS_SEGMENT_REPORT_FILE})')
+    parser.add_argument('--transliterate', action='store_true',
+                        help='Show the segments after transliterating to GSM-7')
+    parser.add_argument('--write', action='store_true',
+                        help='With --transliterate: rewrite the template and the manifest\'s SMS texts in GSM-7')
+    args = parser.parse_args()
+
+    if os.path.exists(args.template):
+        with open(args.template, 'r', encoding='utf-8') as f:
+            template = f.read().strip()
+        # Codes are 5 digits, so the template's length is known without a guest
+        info = analyze(template.replace('{code}', '00000'))
+        print(f"Template {args.template}: {info['encoding']}, {info['length']} characters, "
+              f"{info['segments']} segment(s)")
+        if info['offending']:
+            print(f"  Not in GSM-7: {' '.join(repr(c) for c in info['offending'])}")
+        if args.transliterate and args.write and info['offending']:
+            with open(args.template, 'w', encoding='utf-8') as f:
+                f.write(transliterate(template))
+            print(f"  ✓ Rewrote {args.template} in GSM-7")
+
+    messages = load_card_messages(args.manifest)
+    if not messages:
+        print(f"No messages found in {args.manifest}. Run generate_cards_and_messages.py first.")
+        return
+
+    rows = analyze_messages(messages, args.transliterate)
+    write_report(rows, args.report)
+    print()
+    print_summary(summarize(rows))
+    print(f"Report: {args.report}")
+
+    if args.transliterate and args.write:
+        manifest = load_manifest(args.manifest)
+        changed = 0
+        for entry in manifest.values():
+            fixed = transliterate(entry['sms'])
+            if fixed != entry['sms']:
+                entry['sms'] = fixed
+                changed += 1
+        if changed:
+            write_manifest(manifest, args.manifest)
+        print(f"✓ Rewrote {changed} SMS texts in GSM-7")
+
+if __name__ == '__main__':
+    main()
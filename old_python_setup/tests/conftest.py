@@ -0,0 +1,17 @@
+import pytest
+
+class FakeClock:
+    """time.monotonic stand-in that only moves when a test (or a fake sleep) moves it"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock():
+    return FakeClock()
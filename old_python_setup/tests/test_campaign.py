@@ -0,0 +1,99 @@
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from campaign import (CampaignProgress, SendWindow, load_vip_codes, order_by_priority, plan_send_times,
+                      plan_delays)
+from outbox import IN_DOUBT
+from retry_scheduler import PERMANENT, UNKNOWN
+
+def test_progress_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'progress.jsonl')
+    progress = CampaignProgress(path)
+    progress.record('00001', 'whatsapp', 'SM1')
+    progress.failed('00002', 'sms', 'timed out', UNKNOWN)
+    progress.failed('00003', 'sms', 'invalid number', PERMANENT)
+    progress.close()
+
+    restarted = CampaignProgress(path)
+    assert '00001' in restarted and '00002' in restarted
+    # Permanent failures are tried again by the next run
+    assert '00003' not in restarted
+    assert restarted.in_doubt() == ['00002']
+    assert restarted.delivered['00002']['status'] == IN_DOUBT
+
+def test_line_cut_inside_a_multibyte_character_is_repaired(tmp_path):
+    path = tmp_path / 'progress.jsonl'
+    progress = CampaignProgress(str(path))
+    progress.failed('00001', 'sms', 'Hitilafu ya mtandao – jaribu tena', UNKNOWN)
+    progress.close()
+    # A crash in the middle of the en dash (3 bytes in UTF-8)
+    data = path.read_bytes()
+    cut = data.index('–'.encode('utf-8')) + 1
+    path.write_bytes(data + data[:cut])
+
+    progress = CampaignProgress(str(path))
+    assert list(progress.delivered) == ['00001']
+    progress.record('00002', 'whatsapp', 'SM2')
+    progress.close()
+    lines = path.read_bytes().split(b'\n')
+    assert lines[-1] == b'' and lines[-2].startswith(b'{"code": "00002"')
+    assert sorted(CampaignProgress(str(path)).delivered) == ['00001', '00002']
+
+DAR = ZoneInfo('Africa/Dar_es_Salaam')
+
+def at(hour, minute=0, day=1):
+    return datetime(2025, 12, day, hour, minute, tzinfo=DAR)
+
+def test_window_opens_and_closes_in_local_time():
+    window = SendWindow.parse('09:00-20:00')
+    assert not window.is_open(at(8, 59))
+    assert window.is_open(at(9)) and window.is_open(at(19, 59))
+    assert not window.is_open(at(20))
+    # 07:00 UTC is 10:00 in Dar es Salaam
+    assert window.is_open(datetime(2025, 12, 1, 7, tzinfo=ZoneInfo('UTC')))
+    assert window.next_open(at(21)) == at(9, day=2)
+    assert window.next_open(at(6)) == at(9)
+    assert window.closes_at(at(10)) == at(20)
+    assert window.seconds_until_open(at(8, 30)) == 1800
+
+def test_window_past_midnight():
+    window = SendWindow.parse('22:00-02:00')
+    assert window.is_open(at(23)) and window.is_open(at(1, 59, day=2))
+    assert not window.is_open(at(2, day=2))
+    assert window.closes_at(at(23)) == at(2, day=2)
+    assert window.closes_at(at(1, day=2)) == at(2, day=2)
+    assert window.next_open(at(3)) == at(22)
+
+@pytest.mark.parametrize('value', ['09:00', '9-20', '09:00-09:00'])
+def test_invalid_windows_are_refused(value):
+    with pytest.raises(ValueError):
+        SendWindow.parse(value)
+
+def test_rate_paces_messages_and_carries_over_to_the_next_window():
+    window = SendWindow(time(9), time(9, 1))
+    times = plan_send_times(4, window, rate=1 / 30, now=at(8))
+    assert times == [at(9), at(9) + timedelta(seconds=30), at(9, day=2), at(9, day=2) + timedelta(seconds=30)]
+
+def test_spread_fills_the_rest_of_the_window():
+    window = SendWindow.parse('09:00-21:00')
+    times = plan_send_times(4, window, spread=True, now=at(15))
+    assert times == [at(15), at(16, 30), at(18), at(19, 30)]
+    # Spreading 6 messages over 6 hours would be faster than the rate allows
+    assert plan_send_times(6, window, rate=1 / 7200, spread=True, now=at(15))[1] == at(17)
+
+def test_delays_by_code():
+    window = SendWindow.parse('09:00-21:00')
+    guests = [{'code': '00001'}, {'code': '00002'}]
+    assert plan_delays(guests, window, rate=0.5, now=at(8, 59)) == {'00001': 60.0, '00002': 62.0}
+    assert plan_delays(guests, now=at(10)) == {'00001': 0.0, '00002': 0.0}
+
+def test_vips_go_first_by_code_or_name(tmp_path):
+    path = tmp_path / 'vips.txt'
+    path.write_text("# Family\n35659\n  Mr & Mrs Eng. Ngwisa Mpembe  # by name\n\n123\n", encoding='utf-8')
+    vips = load_vip_codes(str(path))
+    assert vips == {'35659', 'mr & mrs eng. ngwisa mpembe', '00123'}
+    guests = [{'code': f'{i:05d}', 'name': f'Guest {i}'} for i in (1, 2)]
+    guests += [{'code': '00003', 'name': 'Mr & Mrs Eng. Ngwisa Mpembe'}, {'code': '00123', 'name': 'Guest 123'}]
+    assert [g['code'] for g in order_by_priority(guests, vips)] == ['00003', '00123', '00001', '00002']
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import time
+
+from card_store import (put_object, link_alias, resolve, remove_alias, alias_path, object_path, object_digest,
+                        new_object_file, collect_garbage, import_folders, iter_aliases)
+
+def card(store, data):
+    path = new_object_file(str(store))
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+def age(path, seconds):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+def test_put_object_names_objects_by_hash(tmp_path):
+    src = card(tmp_path, b'card one')
+    path = put_object(src, str(tmp_path))
+    digest = hashlib.sha256(b'card one').hexdigest()
+    assert path == object_path(digest, str(tmp_path))
+    assert path.endswith(os.path.join('objects', digest[:2], digest + '.png'))
+    assert object_digest(path) == digest
+    assert not os.path.exists(src)
+
+def test_put_object_stores_identical_cards_once(tmp_path):
+    first = put_object(card(tmp_path, b'same'), str(tmp_path))
+    age(first, 7200)
+    src = card(tmp_path, b'same')
+    assert put_object(src, str(tmp_path)) == first
+    assert not os.path.exists(src)
+    # Reused objects are touched so a garbage collection leaves them alone
+    assert os.path.getmtime(first) > time.time() - 60
+
+def test_object_digest_outside_the_store(tmp_path):
+    assert object_digest(str(tmp_path / 'card.png')) is None
+    assert object_digest(os.path.join('objects', 'ab', 'ab' + '0' * 62 + '.jpg')) is None
+
+def test_link_alias_is_relative_and_replaced(tmp_path):
+    store = str(tmp_path)
+    first = put_object(card(tmp_path, b'v1'), store)
+    second = put_object(card(tmp_path, b'v2'), store)
+    alias = link_alias('00042', first, store)
+    assert alias == alias_path('00042', store) == os.path.join(store, 'png', '00', '00042.png')
+    assert not os.path.isabs(os.readlink(alias))
+    assert resolve('00042', store) == first
+
+    link_alias('00042', second, store)
+    assert resolve('00042', store) == second
+    assert not os.path.lexists(alias + '.tmp')
+    assert iter_aliases(store) == {'00042': alias}
+
+    remove_alias('00042', store)
+    assert resolve('00042', store) is None
+
+def test_alias_of_short_code(tmp_path):
+    assert alias_path('7', str(tmp_path)) == os.path.join(str(tmp_path), 'png', '7', '7.png')
+
+def test_collect_garbage_removes_old_unreferenced_files(tmp_path):
+    store = str(tmp_path)
+    kept = put_object(card(tmp_path, b'linked'), store)
+    link_alias('00001', kept, store)
+    orphan = put_object(card(tmp_path, b'orphan'), store)
+    leftover = card(tmp_path, b'crashed render')
+    for path in (kept, orphan, leftover):
+        age(path, 7200)
+
+    assert collect_garbage(store) == (2, len(b'orphan') + len(b'crashed render'))
+    assert os.path.exists(kept)
+    assert not os.path.exists(orphan) and not os.path.exists(leftover)
+
+def test_collect_garbage_spares_recent_files(tmp_path):
+    store = str(tmp_path)
+    unlinked = put_object(card(tmp_path, b'not linked yet'), store)
+    assert collect_garbage(store) == (0, 0)
+    assert os.path.exists(unlinked)
+
+    # A run only collects what was there before it started
+    age(unlinked, 10)
+    started = time.time()
+    rendering = card(tmp_path, b'rendered by another run')
+    os.utime(rendering, (started + 1, started + 1))
+    assert collect_garbage(store, older_than=started) == (1, len(b'not linked yet'))
+    assert os.path.exists(rendering)
+
+def test_import_folders_keeps_the_current_folder(tmp_path):
+    store = str(tmp_path)
+    for folder, data in (('Anna_Tarimo_00001', b'old name'), ('Anna_Mushi_00001', b'new name')):
+        os.makedirs(tmp_path / folder)
+        (tmp_path / folder / '00001.png').write_bytes(data)
+
+    assert import_folders(store, {'00001': 'Anna_Mushi_00001'}) == ['00001']
+    with open(resolve('00001', store), 'rb') as f:
+        assert f.read() == b'new name'
+    assert sorted(os.listdir(store)) == ['objects', 'png']
@@ -0,0 +1,85 @@
+import socket
+
+from transports import ConcurrencyController
+
+class Throttled(Exception):
+    code = 20429
+    status = 429
+
+def run(controller, rtt, error=None):
+    saturated = controller.started()
+    controller.finished(rtt, error, saturated)
+
+def fill(controller, rtt, rounds=1):
+    """Send `rounds` windows of requests that keep the window in full use"""
+    for _ in range(rounds):
+        limit = controller.limit()
+        saturated = [controller.started() for _ in range(limit)]
+        for flag in saturated:
+            controller.finished(rtt, None, flag)
+
+def test_initial_window_is_clamped():
+    assert ConcurrencyController(initial=100, maximum=8).limit() == 8
+    assert ConcurrencyController(initial=0, minimum=2).limit() == 2
+
+def test_window_grows_while_saturated_and_fast(clock):
+    controller = ConcurrencyController(initial=2, maximum=16, clock=clock)
+    fill(controller, 0.1, rounds=10)
+    assert controller.limit() > 2
+    assert controller.peak == controller.window
+    assert controller.decreases == 0
+
+def test_window_never_exceeds_maximum(clock):
+    controller = ConcurrencyController(initial=4, maximum=6, clock=clock)
+    fill(controller, 0.1, rounds=50)
+    assert controller.limit() == 6
+
+def test_unsaturated_requests_leave_the_window_alone(clock):
+    controller = ConcurrencyController(initial=8, clock=clock)
+    run(controller, 0.1)
+    for _ in range(20):
+        # One request at a time never fills a window of 8, however slow it is
+        run(controller, 5.0)
+    assert controller.limit() == 8
+    assert controller.decreases == 0
+
+def test_throttling_halves_the_window_once_per_round_trip(clock):
+    clock = clock
+    controller = ConcurrencyController(initial=16, clock=clock)
+    fill(controller, 0.1)
+    window = controller.window
+    for _ in range(5):
+        run(controller, 0.1, Throttled())
+    assert controller.window == window / 2
+    assert controller.decreases == 1
+    clock.now += 1
+    run(controller, 0.1, Throttled())
+    assert controller.window == window / 4
+
+def test_timeouts_count_as_congestion(clock):
+    controller = ConcurrencyController(initial=8, clock=clock)
+    run(controller, 10, socket.timeout())
+    assert controller.limit() == 4
+
+def test_other_errors_do_not_shrink_the_window(clock):
+    controller = ConcurrencyController(initial=8, clock=clock)
+    run(controller, 0.1, ValueError("invalid number"))
+    assert controller.limit() == 8
+    assert controller.in_flight == 0
+
+def test_rising_latency_shrinks_the_window(clock):
+    clock = clock
+    controller = ConcurrencyController(initial=8, clock=clock)
+    fill(controller, 0.1)
+    for _ in range(10):
+        clock.now += 1
+        fill(controller, 1.0)
+    assert controller.limit() < 8
+
+def test_window_stays_above_minimum(clock):
+    clock = clock
+    controller = ConcurrencyController(initial=4, minimum=2, clock=clock)
+    for _ in range(10):
+        clock.now += 1
+        run(controller, 0.1, Throttled())
+    assert controller.limit() == 2
@@ -0,0 +1,54 @@
+import os
+import runpy
+
+import pytest
+
+from card_store import put_object, link_alias, new_object_file
+from message_manifest import manifest_entries, update_manifest, load_manifest
+
+generator = pytest.importorskip('generate_cards_and_messages')
+
+GUEST = {'code': '00042', 'name': 'Anna Tarimo', 'type': 'Double', 'phone': None}
+
+def store_card(store, guest, data):
+    path = new_object_file(store)
+    with open(path, 'wb') as f:
+        f.write(data)
+    card = put_object(path, store)
+    link_alias(guest['code'], card, store)
+    return card
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / 'cards')
+
+def manifest(store, guest, card):
+    path = f"{store}/manifest.jsonl"
+    update_manifest(manifest_entries([guest], {'sms': "{code}"}, {guest['code']: card}), path=path)
+    return load_manifest(path)
+
+def test_card_of_an_unchanged_guest_is_current(store):
+    card = store_card(store, GUEST, b'card')
+    entry = manifest(store, GUEST, card)[GUEST['code']]
+    assert generator.current_card(GUEST, entry, store) == card
+
+def test_edits_made_while_not_watching_are_caught_up(store):
+    card = store_card(store, GUEST, b'card')
+    entry = manifest(store, GUEST, card)[GUEST['code']]
+    assert generator.current_card(dict(GUEST, name='Anna Mushi'), entry, store) is None
+    assert generator.current_card(dict(GUEST, type='Single'), entry, store) is None
+    assert generator.current_card(GUEST, None, store) is None
+
+def test_alias_moved_without_the_manifest_is_not_current(store):
+    card = store_card(store, GUEST, b'card')
+    entry = manifest(store, GUEST, card)[GUEST['code']]
+    store_card(store, GUEST, b'other card')
+    assert generator.current_card(GUEST, entry, store) is None
+
+def test_sample_uses_the_card_renderer(tmp_path, monkeypatch):
+    drawn = []
+    monkeypatch.setattr(generator, 'generate_card', lambda *args, **kwargs: drawn.append(args) or True)
+    monkeypatch.setattr('sys.argv', ['generate_sample.py'])
+    monkeypatch.chdir(tmp_path)
+    sample = runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'generate_sample.py'))
+    assert drawn == [(sample['DEFAULT_SAMPLE']['name'], 'Double', '52822', 'cards/sample_card.png')]
@@ -0,0 +1,55 @@
+from guest_normalize import normalize_code, normalize_phone, normalize_guests, sanitize_folder_name
+
+def row(code, phone=None, name='Guest', type_='Single'):
+    return {'name': name, 'type': type_, 'phone': phone, 'code': code}
+
+def test_codes_get_their_leading_zeros_back():
+    assert normalize_code('123') == ('00123', True)
+    assert normalize_code(' 42 ') == ('00042', True)
+    assert normalize_code('123.0') == ('00123', True)
+    assert normalize_code('52822') == ('52822', True)
+
+def test_invalid_codes_are_kept_but_flagged():
+    assert normalize_code('123456') == ('123456', False)
+    assert normalize_code('12.50') == ('12.50', False)
+    assert normalize_code('1e5') == ('1e5', False)
+    assert normalize_code('A12') == ('A12', False)
+    assert normalize_code('') == ('', False)
+    assert normalize_code(None) == (None, False)
+
+def test_phone_prefixes_become_plus_255():
+    assert normalize_phone('0712412132') == ('+255712412132', True)
+    assert normalize_phone('255712412132') == ('+255712412132', True)
+    assert normalize_phone('712412132') == ('+255712412132', True)
+    assert normalize_phone('+255 712 412 132') == ('+255712412132', True)
+    assert normalize_phone('(0712) 412-132') == ('+255712412132', True)
+
+def test_foreign_numbers_are_kept():
+    assert normalize_phone('+1 202 555 0100') == ('+12025550100', True)
+
+def test_international_dialling_prefix():
+    assert normalize_phone('00255712412132') == ('+255712412132', True)
+    assert normalize_phone('00 1 202 555 0100') == ('+12025550100', True)
+
+def test_missing_phones():
+    assert normalize_phone(None) == (None, True)
+    assert normalize_phone('') == (None, True)
+    assert normalize_phone('N/A') == (None, True)
+    assert normalize_phone('+') == (None, True)
+
+def test_invalid_phones_are_flagged():
+    assert normalize_phone('07124') == ('+2557124', False)
+    assert normalize_phone('1e5') == ('+25515', False)
+    assert normalize_phone('12.50') == ('+2551250', False)
+
+def test_normalize_guests_returns_aligned_masks():
+    rows = [row('1', '0712412132', name='One'), row('abc', '123', name='Two'), row(None, None, name='Three')]
+    guests, invalid = normalize_guests(rows)
+    assert [guest['code'] for guest in guests] == ['00001', 'abc', None]
+    assert [guest['phone'] for guest in guests] == ['+255712412132', '+255123', None]
+    assert [guest['name'] for guest in guests] == ['One', 'Two', 'Three']
+    assert invalid == {'code': [False, True, True], 'phone': [False, True, False]}
+
+def test_sanitize_folder_name():
+    assert sanitize_folder_name('Mr & Mrs Eng. Ngwisa Mpembe') == 'Mr_Mrs_Eng_Ngwisa_Mpembe'
+    assert sanitize_folder_name(' Dr. (Mrs) Tarimo ') == 'Dr_Mrs_Tarimo'
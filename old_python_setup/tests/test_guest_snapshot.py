@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+import guest_snapshot
+from guest_snapshot import (load_guest_rows, snapshot_state, snapshot_path, previous_snapshot_path,
+                            read_snapshot_rows)
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Sheets the fake parser read; a "sheet" is one guest name per line"""
+    parses = []
+
+    def fake_rows(path):
+        parses.append(path)
+        with open(path, encoding='utf-8') as f:
+            for i, name in enumerate(f.read().split('\n'), start=1):
+                if name:
+                    yield {'name': name, 'type': 'Single', 'phone': None, 'code': f'{i:05d}'}
+
+    monkeypatch.setattr(guest_snapshot, 'iter_guest_rows', fake_rows)
+    return parses
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = tmp_path / 'wedding_invites.ods'
+    path.write_text("Anna Tarimo\nJuma Mushi\n", encoding='utf-8')
+    return str(path)
+
+def names(rows):
+    return [row['name'] for row in rows]
+
+def test_unchanged_sheet_is_read_from_the_snapshot(sheet, parses):
+    assert names(load_guest_rows(sheet)) == ['Anna Tarimo', 'Juma Mushi']
+    assert names(load_guest_rows(sheet)) == ['Anna Tarimo', 'Juma Mushi']
+    assert len(parses) == 1
+    meta, current = snapshot_state(sheet)
+    assert current and meta['rows'] == '2'
+
+def test_touched_sheet_with_the_same_content_is_not_parsed(sheet, parses):
+    load_guest_rows(sheet)
+    stat = os.stat(sheet)
+    os.utime(sheet, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert names(load_guest_rows(sheet)) == ['Anna Tarimo', 'Juma Mushi']
+    assert len(parses) == 1
+    # The new timestamp is recorded, so the next run does not hash the sheet again
+    assert snapshot_state(sheet)[0]['mtime_ns'] == str(stat.st_mtime_ns + 10**9)
+
+def test_changed_sheet_is_parsed_again_and_the_old_snapshot_kept(sheet, parses):
+    load_guest_rows(sheet)
+    with open(sheet, 'a', encoding='utf-8') as f:
+        f.write("Neema Sechu\n")
+    assert not snapshot_state(sheet)[1]
+    assert names(load_guest_rows(sheet)) == ['Anna Tarimo', 'Juma Mushi', 'Neema Sechu']
+    assert len(parses) == 2
+    previous = previous_snapshot_path(sheet)
+    assert names(read_snapshot_rows(previous)) == ['Anna Tarimo', 'Juma Mushi']
+
+def test_edit_that_keeps_the_size_is_parsed_again(sheet, parses):
+    load_guest_rows(sheet)
+    with open(sheet, 'w', encoding='utf-8') as f:
+        f.write("Anna Tarimo\nJuma Mushy\n")
+    assert names(load_guest_rows(sheet)) == ['Anna Tarimo', 'Juma Mushy']
+    assert len(parses) == 2
+
+def test_snapshot_of_an_older_version_is_rebuilt(sheet, parses, monkeypatch):
+    load_guest_rows(sheet)
+    monkeypatch.setattr(guest_snapshot, 'SNAPSHOT_VERSION', guest_snapshot.SNAPSHOT_VERSION + 1)
+    load_guest_rows(sheet)
+    load_guest_rows(sheet, rebuild=True)
+    assert len(parses) == 3
+
+def test_unwritable_snapshot_only_costs_the_speed_up(sheet, parses, tmp_path, capsys):
+    snapshot = str(tmp_path / 'missing' / 'guests.sqlite')
+    assert names(load_guest_rows(sheet, snapshot=snapshot)) == ['Anna Tarimo', 'Juma Mushi']
+    assert "could not write guest snapshot" in capsys.readouterr().err
+    assert not os.path.exists(snapshot_path(sheet))
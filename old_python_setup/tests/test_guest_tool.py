@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+from guest_tool import (lint_rows, load_name_measure, find_duplicates, name_parts, diff_guests, changed_codes, duplicate_codes,
+                        ERROR, WARNING, ADDED, REMOVED, RENAMED, TYPE_CHANGED, PHONE_CHANGED)
+
+def sheet_row(number, name, code, phone=None, type_='Single'):
+    return {'row': number, 'name': name, 'type': type_, 'phone': phone, 'code': code}
+
+def checks(issues):
+    return [(issue['row'], issue['check']) for issue in issues]
+
+def test_clean_sheet_has_no_issues():
+    rows = [sheet_row(2, 'Guest One', '1', '0712412132'), sheet_row(3, 'Guest Two', '2', '0712412133', 'Double')]
+    assert lint_rows(rows) == []
+
+def test_missing_name_or_code():
+    rows = [sheet_row(2, '  ', '1'), sheet_row(3, 'Guest', None)]
+    issues = lint_rows(rows)
+    assert checks(issues) == [(2, 'empty_name'), (3, 'missing_code')]
+    assert issues[0]['message'] == "Row has a code but no name"
+    assert issues[1]['message'] == "Row has a name but no code"
+
+def test_row_without_name_and_code_is_one_issue():
+    issues = lint_rows([sheet_row(2, '', None, '0712412132')])
+    assert checks(issues) == [(2, 'incomplete_row')]
+    assert issues[0]['severity'] == ERROR
+
+def test_codes_colliding_once_normalized():
+    issues = lint_rows([sheet_row(2, 'A', '123'), sheet_row(3, 'B', '00123'), sheet_row(4, 'C', '124')])
+    assert checks(issues) == [(2, 'duplicate_code'), (3, 'duplicate_code')]
+    assert all(issue['code'] == '00123' for issue in issues)
+
+def test_invalid_values_and_shared_phones():
+    rows = [
+        sheet_row(2, 'A', '1e5', '0712412132'),
+        sheet_row(3, 'B', '2', '07124'),
+        sheet_row(4, 'C', '3', '+255 712 412 132', type_='Triple'),
+    ]
+    issues = lint_rows(rows)
+    assert checks(issues) == [(2, 'duplicate_phone'), (2, 'invalid_code'), (3, 'invalid_phone'),
+                              (4, 'duplicate_phone'), (4, 'unknown_type')]
+    severities = {issue['check']: issue['severity'] for issue in issues}
+    assert severities == {'duplicate_phone': WARNING, 'invalid_code': ERROR, 'invalid_phone': ERROR,
+                          'unknown_type': WARNING}
+
+def test_names_too_wide_for_the_card():
+    measure = (lambda name: len(name) * 10, 100)
+    issues = lint_rows([sheet_row(2, 'Short', '1'), sheet_row(3, 'A much longer name', '2')], measure)
+    assert checks(issues) == [(3, 'name_too_wide')]
+
+def test_names_are_measured_as_the_card_generator_draws_them():
+    generator = pytest.importorskip('generate_cards_and_messages')
+    card = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), generator.BLANK_CARD)
+    measure, max_width = load_name_measure(card)
+    assert max_width == generator.name_measure(card)[1]
+    with generator.Image.open(card) as blank:
+        assert max_width == blank.size[0] - 2 * generator.CARD_MARGIN
+    assert 0 < measure('Anna') < measure('Anna Tarimo') < max_width
+    issues = lint_rows([sheet_row(2, 'Anna Tarimo', '1'), sheet_row(3, 'Anna Tarimo ' * 20, '2')],
+                       (measure, max_width))
+    assert checks(issues) == [(3, 'name_too_wide')]
+
+def pairs(duplicates):
+    return [(a['row'], b['row']) for _, _, a, b in duplicates]
+
+def test_name_parts_ignore_titles():
+    assert name_parts('Dr Mrs Geoffrey Tarimo') == (['geoffrey'], 'tarimo')
+    assert name_parts('Mr & Mrs Eng. Ngwisa Mpembe') == (['ngwisa'], 'mpembe')
+    assert name_parts('Mr & Mrs') == ([], '')
+
+def test_initial_matches_the_given_name():
+    duplicates = find_duplicates([sheet_row(2, 'Dr Mrs Geoffrey Tarimo', '1'), sheet_row(3, 'Mrs G. Tarimo', '2')])
+    assert pairs(duplicates) == [(2, 3)]
+    assert 'matching given name or initial' in duplicates[0][1]
+
+def test_misspelled_surname():
+    duplicates = find_duplicates([sheet_row(2, 'Peter Mrema', '1'), sheet_row(3, 'Peter Mremma', '2')])
+    assert pairs(duplicates) == [(2, 3)]
+    assert duplicates[0][1] == ['similar surname', 'same given name']
+
+def test_different_people_are_not_duplicates():
+    rows = [
+        sheet_row(2, 'John Mushi', '1', '0712412132'),
+        sheet_row(3, 'Mary Kimaro', '2', '0712412132'),
+        sheet_row(4, 'Anna Tarimo', '3'),
+        sheet_row(5, 'Joseph Tarimo', '4'),
+    ]
+    assert find_duplicates(rows) == []
+
+def test_household_without_given_name_is_compared_with_the_whole_surname():
+    rows = [sheet_row(2, 'Anna Tarimo', '1'), sheet_row(3, 'Joseph Tarimo', '2'), sheet_row(4, 'Mr & Mrs Tarimo', '3')]
+    assert pairs(find_duplicates(rows, threshold=0.5)) == [(2, 4), (3, 4)]
+
+def test_same_phone_raises_the_score():
+    rows = [sheet_row(2, 'Anna Tarimo', '1', '0712412132'), sheet_row(3, 'Mr & Mrs Tarimo', '2', '+255712412132')]
+    score, reasons, _, _ = find_duplicates(rows)[0]
+    assert score == 1.0
+    assert 'same phone' in reasons
+
+def test_diff_matches_guests_by_normalized_code():
+    old = [sheet_row(2, 'Anna Tarimo', '1', '0712412132'), sheet_row(3, 'John Mushi', '2'),
+           sheet_row(4, 'Peter Mrema', '3', type_='Single')]
+    new = [sheet_row(2, 'Anna  Tarimo', '00001', '+255712412132'), sheet_row(3, 'Peter Mrema', '3.0', type_='Double'),
+           sheet_row(4, 'Mary Kimaro', '4')]
+    changes = diff_guests(old, new)
+    assert [guest['code'] for guest in changes[ADDED]] == ['00004']
+    assert [guest['code'] for guest in changes[REMOVED]] == ['00002']
+    assert [(entry['code'], entry['changes']) for entry in changes['modified']] == [('00003', [TYPE_CHANGED])]
+    assert changes['unchanged'] == 1
+
+def test_diff_reports_renames_and_phone_changes():
+    old = [sheet_row(2, 'Mrs G. Tarimo', '1', '0712412132')]
+    new = [sheet_row(2, 'Dr Mrs Geoffrey Tarimo', '1', '0712412133', type_='Double')]
+    entry = diff_guests(old, new)['modified'][0]
+    assert entry['changes'] == [RENAMED, TYPE_CHANGED, PHONE_CHANGED]
+    assert (entry['old']['name'], entry['new']['name']) == ('Mrs G. Tarimo', 'Dr Mrs Geoffrey Tarimo')
+
+def test_changed_codes():
+    old = [sheet_row(2, 'A', '1'), sheet_row(3, 'B', '2'), sheet_row(4, 'C', '3', '0712412132')]
+    new = [sheet_row(2, 'A2', '1'), sheet_row(4, 'C', '3'), sheet_row(5, 'D', '4')]
+    changes = diff_guests(old, new)
+    assert changed_codes(changes) == ['00004', '00002', '00001', '00003']
+    assert changed_codes(changes, [ADDED, RENAMED]) == ['00004', '00001']
+
+def test_rows_without_code_are_left_out():
+    changes = diff_guests([sheet_row(2, 'A', None)], [sheet_row(2, 'A', None), sheet_row(3, 'B', None)])
+    assert changes == {ADDED: [], REMOVED: [], 'modified': [], 'unchanged': 0}
+
+def test_duplicate_codes():
+    guests = [{'code': '00001'}, {'code': '00002'}, {'code': '00001'}, {'code': None}, {'code': None}]
+    assert duplicate_codes(guests) == ['00001']
+
+@pytest.mark.parametrize('version', ['old', 'new'])
+def test_diff_refuses_duplicate_codes(version):
+    clean = [sheet_row(2, 'A', '1'), sheet_row(3, 'B', '2')]
+    duplicated = [sheet_row(2, 'A', '1'), sheet_row(3, 'B', '001')]
+    old, new = (duplicated, clean) if version == 'old' else (clean, duplicated)
+    with pytest.raises(ValueError, match=f"{version} list: 00001"):
+        diff_guests(old, new)
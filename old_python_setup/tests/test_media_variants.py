@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from media_variants import make_whatsapp_variant, build_variants, variant_path, MAX_SIDE
+
+@pytest.fixture
+def card(tmp_path):
+    # Noise compresses badly, like the photo on the real cards
+    path = str(tmp_path / 'card.png')
+    Image.effect_noise((2000, 1400), 40).convert('RGB').save(path, compress_level=1)
+    return path
+
+def test_variant_is_resized_jpeg(card, tmp_path):
+    dst = str(tmp_path / 'card.jpg')
+    size = make_whatsapp_variant(card, dst)
+    assert size == os.path.getsize(dst)
+    with Image.open(dst) as img:
+        assert img.format == 'JPEG'
+        assert img.size == (MAX_SIDE, 896)
+    assert not os.path.exists(dst + '.tmp')
+
+def test_quality_is_lowered_to_fit_the_cap(card, tmp_path):
+    dst = str(tmp_path / 'card.jpg')
+    uncapped = make_whatsapp_variant(card, dst, max_bytes=10 * 1024 * 1024)
+    capped = make_whatsapp_variant(card, dst, max_bytes=uncapped - 1)
+    assert capped <= uncapped - 1
+    # A cap that cannot be met stops at the lowest quality instead of looping
+    assert make_whatsapp_variant(card, dst, max_bytes=1000) > 1000
+
+def test_only_missing_or_outdated_variants_are_built(card, tmp_path):
+    variants_dir = str(tmp_path / 'variants')
+    cards = {'00001': card, '00002': card}
+    assert build_variants(cards, variants_dir, workers=1) == (2, 0, 0)
+    assert build_variants(cards, variants_dir, workers=1) == (0, 2, 0)
+
+    # A card regenerated after its variant was built
+    variant = variant_path('00001', variants_dir)
+    stat = os.stat(variant)
+    os.utime(variant, (stat.st_atime, os.path.getmtime(card) - 10))
+    assert build_variants(cards, variants_dir, workers=1) == (1, 1, 0)
+    assert build_variants(cards, variants_dir, force=True, workers=1) == (2, 0, 0)
+
+def test_unreadable_card_is_counted_as_an_error(tmp_path, capsys):
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not a png')
+    assert build_variants({'00001': str(broken)}, str(tmp_path / 'variants'), workers=1) == (0, 0, 1)
+    assert "Error building variant for 00001" in capsys.readouterr().out
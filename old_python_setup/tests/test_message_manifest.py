@@ -0,0 +1,67 @@
+import pytest
+
+from message_manifest import compile_template, manifest_entries, update_manifest, load_manifest, card_is_current
+
+GUEST = {'code': '00042', 'name': 'Anna Tarimo', 'type': 'Double'}
+
+def test_literal_template():
+    render = compile_template("Karibu {{harusi}}")
+    assert render(GUEST) == "Karibu {harusi}"
+
+def test_fields_are_filled_in():
+    render = compile_template("{name}, namba ya mwaliko *{code}* ({type})")
+    assert render(GUEST) == "Anna Tarimo, namba ya mwaliko *00042* (Double)"
+
+def test_format_spec_and_conversion():
+    render = compile_template("[{name:>12}] {code!r}")
+    assert render(GUEST) == "[ Anna Tarimo] '00042'"
+
+def test_matches_str_format():
+    template = "Mwaliko {name} {code:.3} {type!s:<8}."
+    assert compile_template(template)(GUEST) == template.format(**GUEST)
+
+def test_unknown_field_is_rejected_up_front():
+    with pytest.raises(ValueError, match=r"\{phone\}"):
+        compile_template("Namba {phone}")
+
+def test_manifest_keeps_cards_of_messages_rebuilt_without_rendering(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    templates = {'sms': "Namba {code}"}
+    card = str(tmp_path / 'card.png')
+    with open(card, 'wb') as f:
+        f.write(b'png')
+    update_manifest(manifest_entries([GUEST], templates, {'00042': card}), path=path)
+
+    other = dict(GUEST, code='00043')
+    manifest = update_manifest(manifest_entries([GUEST, other], {'sms': "Mwaliko {code}"}), path=path)
+    assert manifest['00042']['sms'] == "Mwaliko 00042"
+    assert manifest['00042']['card'] == card and manifest['00042']['hash']
+    assert manifest['00043']['card'] is None
+
+    update_manifest([], removed=['00042'], path=path)
+    assert list(load_manifest(path)) == ['00043']
+
+def test_manifest_remembers_what_each_card_was_rendered_from(tmp_path):
+    path = str(tmp_path / 'manifest.jsonl')
+    templates = {'sms': "Namba {code}"}
+    first = tmp_path / 'first.png'
+    first.write_bytes(b'first')
+    update_manifest(manifest_entries([GUEST], templates, {'00042': str(first)}), path=path)
+    assert card_is_current(GUEST, load_manifest(path)['00042'])
+
+    # Messages rebuilt after a rename keep the card, which still shows the old name
+    renamed = dict(GUEST, name='Anna Mushi')
+    update_manifest(manifest_entries([renamed], templates, {'00042': str(first)}), path=path)
+    entry = load_manifest(path)['00042']
+    assert entry['name'] == 'Anna Mushi'
+    assert not card_is_current(renamed, entry)
+    assert card_is_current(dict(GUEST, name=' Anna   Tarimo'), entry)
+    assert not card_is_current(dict(GUEST, type='Single'), entry)
+
+    second = tmp_path / 'second.png'
+    second.write_bytes(b'second')
+    update_manifest(manifest_entries([renamed], templates, {'00042': str(second)}), path=path)
+    assert card_is_current(renamed, load_manifest(path)['00042'])
+    second.unlink()
+    assert not card_is_current(renamed, load_manifest(path)['00042'])
+    assert not card_is_current(GUEST, None)
@@ -0,0 +1,62 @@
+import pytest
+
+import transports
+from mock_provider_server import ProviderBehaviour, start_server
+from retry_scheduler import classify_error, PERMANENT, TRANSIENT
+from sms_client import SmsApiError
+from transports import SmsTransport
+
+def guest(code):
+    return {'code': code, 'name': f'Guest {code}', 'type': 'Single', 'phone': '+255712412132'}
+
+@pytest.fixture
+def provider():
+    behaviour = ProviderBehaviour(latency_ms=0, latency_jitter_ms=0, balance=100, seed=1)
+    server, base_url = start_server(behaviour)
+    yield behaviour, base_url
+    server.shutdown()
+    server.server_close()
+
+def sms_transport(base_url, **kwargs):
+    return SmsTransport('user', 'secret', "Mwaliko {code}", api_url=f"{base_url}/api.php", **kwargs)
+
+def test_sms_sends_are_counted_and_timed(provider):
+    behaviour, base_url = provider
+    transport = sms_transport(base_url)
+    for code in ('00001', '00002', '00003'):
+        assert transport.send(guest(code))
+    assert transport.requests == 3
+    assert len(transport.latencies) == 3
+    assert behaviour.counts['accepted'] == 3
+    assert behaviour.balance == 97
+    assert transport.client.balance() == '97'
+
+def test_failed_requests_are_counted_too(provider):
+    behaviour, base_url = provider
+    behaviour.permanent_error_rate = 1.0
+    transport = sms_transport(base_url)
+    with pytest.raises(SmsApiError) as error:
+        transport.send(guest('00001'))
+    assert classify_error(error.value)[0] == PERMANENT
+    assert transport.requests == 1 and len(transport.latencies) == 1
+
+def test_throttled_requests_are_transient(provider):
+    behaviour, base_url = provider
+    behaviour.throttle_rps = 1
+    transport = sms_transport(base_url)
+    transport.send(guest('00001'))
+    with pytest.raises(SmsApiError) as error:
+        transport.send(guest('00002'))
+    assert error.value.status == 429
+    assert classify_error(error.value)[0] == TRANSIENT
+    assert behaviour.counts['throttled'] == 1
+
+def test_latency_samples_are_bounded(provider, monkeypatch):
+    _, base_url = provider
+    monkeypatch.setattr(transports, 'LATENCY_SAMPLES', 2)
+    transport = sms_transport(base_url)
+    for code in ('00001', '00002', '00003'):
+        transport.send(guest(code))
+    # Only the most recent samples are kept, but every request is counted
+    assert len(transport.latencies) == 2
+    assert transport.requests == 3
@@ -0,0 +1,85 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+from ods_reader import _row_values, iter_rows, iter_guest_rows, cell_value
+
+NAMESPACES = ('xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+              'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+              'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"')
+
+def text_cell(value, repeat=1):
+    repeated = f' table:number-columns-repeated="{repeat}"' if repeat > 1 else ''
+    return f'<table:table-cell office:value-type="string"{repeated}><text:p>{value}</text:p></table:table-cell>'
+
+def empty_cell(repeat=1):
+    repeated = f' table:number-columns-repeated="{repeat}"' if repeat > 1 else ''
+    return f'<table:table-cell{repeated}/>'
+
+def row(*cells, repeat=1):
+    repeated = f' table:number-rows-repeated="{repeat}"' if repeat > 1 else ''
+    return f'<table:table-row {NAMESPACES}{repeated}>{"".join(cells)}</table:table-row>'
+
+def parse_row(*cells):
+    return ET.fromstring(row(*cells))
+
+def write_ods(path, rows):
+    content = (f'<?xml version="1.0" encoding="UTF-8"?><office:document-content {NAMESPACES}>'
+               f'<office:body><office:spreadsheet><table:table table:name="Guests">'
+               f'{"".join(rows)}</table:table></office:spreadsheet></office:body></office:document-content>')
+    with zipfile.ZipFile(path, 'w') as z:
+        z.writestr('content.xml', content)
+    return str(path)
+
+def test_repeated_cells_are_expanded_in_place():
+    values = _row_values(parse_row(text_cell('a', repeat=2), empty_cell(), text_cell('b')), None)
+    assert values == ['a', 'a', '', 'b']
+
+def test_repeated_empty_cells_keep_later_columns_in_place():
+    values = _row_values(parse_row(text_cell('Name'), empty_cell(repeat=2), text_cell('00123')), None)
+    assert values == ['Name', '', '', '00123']
+
+def test_trailing_empty_cells_are_not_expanded():
+    values = _row_values(parse_row(text_cell('Name'), empty_cell(repeat=16384)), None)
+    assert values == ['Name']
+
+def test_max_columns_stops_huge_repeats():
+    values = _row_values(parse_row(text_cell('x', repeat=1000000)), 4)
+    assert values == ['x', 'x', 'x', 'x']
+    values = _row_values(parse_row(text_cell('a'), empty_cell(repeat=1000000), text_cell('b')), 4)
+    assert values == ['a']
+
+def test_covered_cells_take_a_column():
+    covered = '<table:covered-table-cell/>'
+    values = _row_values(parse_row(text_cell('merged'), covered, text_cell('c')), None)
+    assert values == ['merged', '', 'c']
+
+def test_numbers_use_the_stored_value():
+    cell = ET.fromstring(f'<table:table-cell {NAMESPACES} office:value-type="float" office:value="8982">'
+                         f'<text:p>8,982.00</text:p></table:table-cell>')
+    assert cell_value(cell) == '8982'
+
+def test_text_with_spaces_and_line_breaks():
+    cell = ET.fromstring(f'<table:table-cell {NAMESPACES} office:value-type="string">'
+                         f'<text:p>Mr<text:s text:c="2"/>&amp; Mrs<text:line-break/>Tarimo</text:p></table:table-cell>')
+    assert cell_value(cell) == 'Mr  & Mrs\nTarimo'
+
+def test_iter_rows_counts_repeated_rows(tmp_path):
+    path = write_ods(tmp_path / 'sheet.ods', [
+        row(text_cell('Name'), text_cell('Type')),
+        row(empty_cell(repeat=4), repeat=3),
+        row(text_cell('Same'), repeat=2),
+        row(empty_cell(), repeat=1048570),
+    ])
+    assert list(iter_rows(path)) == [(1, ['Name', 'Type']), (5, ['Same']), (6, ['Same'])]
+
+def test_iter_guest_rows(tmp_path):
+    path = write_ods(tmp_path / 'guests.ods', [
+        row(text_cell('Name'), text_cell('Type'), text_cell('Phone'), text_cell('Code')),
+        row(text_cell('Guest One'), text_cell('Double'), text_cell('0712412132'), text_cell(' 00001 ')),
+        row(text_cell('Guest Two'), empty_cell(repeat=2), text_cell('2')),
+        row(text_cell('No Code')),
+    ])
+    assert list(iter_guest_rows(path)) == [
+        {'name': 'Guest One', 'type': 'Double', 'phone': '0712412132', 'code': '00001'},
+        {'name': 'Guest Two', 'type': 'Single', 'phone': None, 'code': '2'},
+    ]
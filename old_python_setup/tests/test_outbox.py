@@ -0,0 +1,216 @@
+import threading
+import time
+
+import pytest
+
+import send_cards_twilio
+from outbox import Outbox, Lease, run_worker, QUEUED, LEASED, SENDING, SENT, FAILED, IN_DOUBT
+from retry_scheduler import PERMANENT, UNKNOWN
+
+def guest(code, phone='+255712412132'):
+    return {'code': code, 'name': f'Guest {code}', 'type': 'Single', 'phone': phone}
+
+@pytest.fixture
+def outbox(tmp_path, clock):
+    outbox = Outbox(str(tmp_path / 'outbox.sqlite'), clock=clock)
+    yield outbox
+    outbox.close()
+
+def status(outbox, code):
+    return outbox.db.execute("SELECT status FROM outbox WHERE code = ?", (code,)).fetchone()[0]
+
+def test_enqueue_skips_known_guests_and_guests_without_phone(outbox):
+    assert outbox.enqueue([guest('00001'), guest('00002', phone=None)]) == 1
+    assert outbox.enqueue([guest('00001'), guest('00003')]) == 1
+    assert outbox.counts() == {QUEUED: 2}
+
+def test_claims_do_not_overlap(outbox):
+    outbox.enqueue([guest(f'{i:05d}') for i in range(5)])
+    first, first_guests = outbox.claim('a', batch_size=3)
+    second, second_guests = outbox.claim('b', batch_size=3)
+    assert [g['code'] for g in first_guests] == ['00000', '00001', '00002']
+    assert [g['code'] for g in second_guests] == ['00003', '00004']
+    assert outbox.claim('c')[1] == []
+    assert outbox.counts() == {LEASED: 5}
+
+def test_expired_lease_is_requeued(outbox, clock):
+    outbox.enqueue([guest('00001')])
+    lease_id, _ = outbox.claim('dead', lease_seconds=60)
+    clock.now += 61
+    assert outbox.heartbeat(lease_id) == 0
+    assert not outbox.mark_sending(lease_id, '00001', 'whatsapp')
+    _, guests = outbox.claim('alive')
+    assert [g['code'] for g in guests] == ['00001']
+
+def test_guest_mid_send_of_a_dead_worker_becomes_in_doubt(outbox, clock):
+    outbox.enqueue([guest('00001'), guest('00002')])
+    lease_id, _ = outbox.claim('dead', lease_seconds=60)
+    assert outbox.mark_sending(lease_id, '00001', 'whatsapp')
+    clock.now += 61
+    assert outbox.reclaim_expired() == (1, 1)
+    assert status(outbox, '00001') == IN_DOUBT
+    assert status(outbox, '00002') == QUEUED
+    # In-doubt guests are only sent again when asked to
+    assert [g['code'] for g in outbox.claim('alive')[1]] == ['00002']
+    assert outbox.requeue([IN_DOUBT]) == 1
+    assert status(outbox, '00001') == QUEUED
+
+def test_heartbeat_keeps_the_lease(outbox, clock):
+    outbox.enqueue([guest('00001')])
+    lease_id, _ = outbox.claim('a', lease_seconds=60)
+    clock.now += 50
+    assert outbox.heartbeat(lease_id, lease_seconds=60) == 1
+    clock.now += 50
+    assert outbox.reclaim_expired() == (0, 0)
+    assert outbox.mark_sending(lease_id, '00001', 'sms')
+
+def test_complete_and_release(outbox):
+    outbox.enqueue([guest('00001'), guest('00002'), guest('00003')])
+    lease_id, _ = outbox.claim('a')
+    outbox.mark_sending(lease_id, '00001', 'whatsapp')
+    outbox.complete(lease_id, '00001', SENT, 'whatsapp', message_id='SM1')
+    outbox.mark_sending(lease_id, '00002', 'whatsapp')
+    assert outbox.release(lease_id) == 1
+    assert outbox.counts() == {SENT: 1, SENDING: 1, QUEUED: 1}
+
+def test_lease_records_unknown_outcomes_as_in_doubt(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite')
+    outbox = Outbox(path)
+    outbox.enqueue([guest('00001'), guest('00002'), guest('00003')])
+    lease_id, _ = outbox.claim('a')
+    with Lease(path, lease_id) as lease:
+        for code in ('00001', '00002', '00003'):
+            assert lease.sending(code, 'whatsapp')
+        lease.record('00001', 'whatsapp', 'SM1')
+        lease.failed('00002', 'whatsapp', 'timed out', UNKNOWN)
+        lease.failed('00003', 'whatsapp', 'invalid number', PERMANENT)
+    assert status(outbox, '00001') == SENT
+    assert status(outbox, '00002') == IN_DOUBT
+    assert status(outbox, '00003') == FAILED
+    outbox.close()
+
+def test_outbox_refuses_workers_on_another_machine(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite')
+    Outbox(path, host='laptop').close()
+    Outbox(path, host='laptop').close()
+    with pytest.raises(RuntimeError, match='laptop'):
+        Outbox(path, host='server')
+
+def test_failures_of_all_workers_are_reported_from_the_outbox(outbox, clock):
+    outbox.enqueue([guest('00001'), guest('00002'), guest('00003')])
+    first, _ = outbox.claim('a', batch_size=1)
+    outbox.complete(first, '00001', FAILED, 'whatsapp', error='invalid number', error_class=PERMANENT)
+    second, _ = outbox.claim('b', batch_size=1)
+    outbox.mark_sending(second, '00002', 'sms')
+    clock.now += 3600
+    outbox.reclaim_expired()
+    rows = outbox.failures()
+    assert [(row['code'], row['classification'], row['reason']) for row in rows] == [
+        ('00001', PERMANENT, FAILED), ('00002', UNKNOWN, IN_DOUBT)]
+    assert rows[0]['error'] == 'invalid number'
+    outbox.requeue([FAILED])
+    assert [row['code'] for row in outbox.failures()] == ['00002']
+
+def test_outbox_without_error_class_column_is_upgraded(tmp_path):
+    import sqlite3
+    path = str(tmp_path / 'outbox.sqlite')
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE outbox (code TEXT PRIMARY KEY, name TEXT, type TEXT, phone TEXT, "
+               "status TEXT NOT NULL DEFAULT 'queued', lease_id TEXT, worker TEXT, lease_expires REAL, "
+               "channel TEXT, message_id TEXT, error TEXT, updated_at REAL)")
+    db.commit()
+    db.close()
+    outbox = Outbox(path)
+    outbox.enqueue([guest('00001')])
+    lease_id, _ = outbox.claim('a')
+    outbox.complete(lease_id, '00001', FAILED, 'sms', error='no credit', error_class=PERMANENT)
+    assert outbox.failures()[0]['classification'] == PERMANENT
+    outbox.close()
+
+def test_lease_is_not_lost_when_its_batch_completes(tmp_path, capsys):
+    path = str(tmp_path / 'outbox.sqlite')
+    outbox = Outbox(path)
+    outbox.enqueue([guest('00001'), guest('00002')])
+    lease_id, _ = outbox.claim('a', lease_seconds=0.3)
+    with Lease(path, lease_id, lease_seconds=0.3) as lease:
+        assert lease.sending('00001', 'whatsapp')
+        lease.record('00001', 'whatsapp', 'SM1')
+        # Heartbeats keep the rest of the batch while it is still sending
+        time.sleep(0.35)
+        assert lease.sending('00002', 'whatsapp')
+        lease.record('00002', 'whatsapp', 'SM2')
+        assert lease.done()
+        # No guest left in the lease: a heartbeat racing the end of the batch renews nothing
+        assert outbox.heartbeat(lease_id, 0.3) == 0
+        lease._stop.clear()
+        racing = threading.Thread(target=lease._heartbeat)
+        racing.start()
+        racing.join(timeout=1)
+        assert not racing.is_alive()
+        assert not lease.lost
+    assert "Lease lost" not in capsys.readouterr().out
+    assert outbox.counts() == {SENT: 2}
+    outbox.close()
+
+def test_lease_lost_when_its_guests_are_reclaimed(tmp_path):
+    path = str(tmp_path / 'outbox.sqlite')
+    outbox = Outbox(path)
+    outbox.enqueue([guest('00001'), guest('00002')])
+    lease_id, _ = outbox.claim('a', lease_seconds=0.1)
+    lease = Lease(path, lease_id, lease_seconds=0.1)
+    lease.record('00001', 'whatsapp', 'SM1')
+    time.sleep(0.15)
+    outbox.reclaim_expired()
+    lease._heartbeat()
+    assert lease.lost
+    assert not lease.sending('00002', 'whatsapp')
+    lease.outbox.close()
+    outbox.close()
+
+class FakeSmsClient:
+    def __init__(self, balances):
+        self.balances = list(balances)
+
+    def resolve_sender_id(self):
+        return 'WEDDING', 'cache'
+
+    def balance(self):
+        return f"OK: {self.balances.pop(0)}"
+
+class FakeSmsTransport:
+    def __init__(self, balances):
+        self.client = FakeSmsClient(balances)
+        self.credit_guard = None
+
+    def message_for(self, guest):
+        return f"Mwaliko {guest['code']}"
+
+def test_worker_does_not_claim_without_sms_credit(tmp_path, monkeypatch):
+    path = str(tmp_path / 'outbox.sqlite')
+    outbox = Outbox(path)
+    outbox.enqueue([guest('00001'), guest('00002')])
+    sent = []
+    monkeypatch.setattr(send_cards_twilio, 'send_messages', lambda guests, *args, **kwargs: sent.append(guests))
+    transports = {'sms': FakeSmsTransport([1])}
+    assert run_worker(path, transports, {'primary': 'sms'}, batch_size=1) == 0
+    assert sent == [] and outbox.counts() == {QUEUED: 2}
+    outbox.close()
+
+def test_worker_guards_sms_credit_and_refreshes_it_per_batch(tmp_path, monkeypatch):
+    path = str(tmp_path / 'outbox.sqlite')
+    outbox = Outbox(path)
+    outbox.enqueue([guest('00001'), guest('00002')])
+    transport = FakeSmsTransport([10, 7])
+    balances = []
+
+    def send_messages(guests, transports, progress=None, **kwargs):
+        balances.append(transport.credit_guard.balance)
+        for g in guests:
+            progress.record(g['code'], 'sms')
+
+    monkeypatch.setattr(send_cards_twilio, 'send_messages', send_messages)
+    assert run_worker(path, {'sms': transport}, {'primary': 'sms'}, batch_size=1) == 2
+    # Checked once before claiming, then read again for the second batch
+    assert balances == [10, 7]
+    assert outbox.counts() == {SENT: 2}
+    outbox.close()
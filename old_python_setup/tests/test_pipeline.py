@@ -0,0 +1,108 @@
+import os
+import threading
+
+import pytest
+
+import pipeline
+from card_store import put_object, link_alias, new_object_file
+from media_variants import variant_path
+
+GUEST = {'code': '00042', 'name': 'Anna Tarimo', 'type': 'Double', 'phone': '+255712412132'}
+
+@pytest.fixture
+def rendered(tmp_path, monkeypatch):
+    """Guests whose card the fake renderer drew, in order"""
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    def fake_generate(name, single_double, code, cards_dir='cards'):
+        calls.append(code)
+        path = new_object_file(cards_dir)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"{name} {single_double} {code}")
+        card = put_object(path, cards_dir)
+        link_alias(code, card, cards_dir)
+        os.makedirs(os.path.dirname(variant_path(code)), exist_ok=True)
+        open(variant_path(code), 'wb').close()
+        return card
+
+    monkeypatch.setattr(pipeline, 'generate_guest_files', fake_generate)
+    return calls
+
+def manifest_entry(guest, card):
+    return {'card': card, 'rendered': {'name': guest['name'], 'type': guest['type']}}
+
+def test_card_rendered_from_the_same_guest_is_reused(rendered):
+    _, card, _ = pipeline.render_guest(GUEST)
+    assert pipeline.render_guest(GUEST, entry=manifest_entry(GUEST, card)) == (GUEST, card, None)
+    assert rendered == ['00042']
+
+@pytest.mark.parametrize('change', [{'name': 'Anna Mushi'}, {'type': 'Single'}])
+def test_card_of_a_changed_guest_is_rendered_again(rendered, change):
+    _, card, _ = pipeline.render_guest(GUEST)
+    changed = dict(GUEST, **change)
+    _, new_card, error = pipeline.render_guest(changed, entry=manifest_entry(GUEST, card))
+    assert error is None and new_card != card
+    assert rendered == ['00042', '00042']
+
+def test_card_without_manifest_entry_or_variant_is_rendered(rendered):
+    _, card, _ = pipeline.render_guest(GUEST)
+    pipeline.render_guest(GUEST)
+    os.remove(variant_path('00042'))
+    pipeline.render_guest(GUEST, entry=manifest_entry(GUEST, card))
+    pipeline.render_guest(GUEST, force=True, entry=manifest_entry(GUEST, card))
+    assert rendered == ['00042'] * 4
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Guests the fake sender took from the feed, in order"""
+    sent = []
+
+    def fake_send_messages(guests, transports, feed=None, **kwargs):
+        while True:
+            guest = feed.get()
+            if guest is None:
+                return
+            sent.append(guest['code'])
+
+    monkeypatch.setattr(pipeline, 'send_messages', fake_send_messages)
+    return sent
+
+def run_in_thread(*args, **kwargs):
+    """run_pipeline's result, failing the test instead of hanging when a stage never finishes"""
+    result = []
+    runner = threading.Thread(target=lambda: result.append(pipeline.run_pipeline(*args, **kwargs)), daemon=True)
+    runner.start()
+    runner.join(timeout=30)
+    assert not runner.is_alive(), "pipeline did not shut down"
+    return result[0] if result else None
+
+def guests(count):
+    return [dict(GUEST, code=f'{i:05d}', phone=GUEST['phone'] if i % 2 else None) for i in range(1, count + 1)]
+
+def test_guests_move_through_every_stage(rendered, sent):
+    publisher = run_in_thread(guests(5), {}, render_workers=2, publisher=pipeline.Publisher(dry_run=True),
+                              publish_batch=2, publish_interval=0.05, dry_run=True)
+    assert publisher.published == 5
+    # Only guests with a phone number are handed to the sender
+    assert sorted(sent) == ['00001', '00003', '00005']
+    assert sorted(pipeline.load_manifest()) == [g['code'] for g in guests(5)]
+
+def test_render_failure_still_shuts_the_pipeline_down(rendered, sent, monkeypatch):
+    def broken_manifest():
+        raise ValueError("manifest is corrupt")
+
+    monkeypatch.setattr(pipeline, 'load_manifest', broken_manifest)
+    monkeypatch.setattr(threading, 'excepthook', lambda args: None)
+    publisher = run_in_thread(guests(3), {}, publisher=pipeline.Publisher(dry_run=True), publish_interval=0.05)
+    assert publisher.published == 0 and sent == []
+
+class BrokenPublisher(pipeline.Publisher):
+    def publish(self, batch):
+        raise RuntimeError("rsync crashed")
+
+def test_publish_failure_still_shuts_the_pipeline_down(rendered, sent, monkeypatch):
+    monkeypatch.setattr(threading, 'excepthook', lambda args: None)
+    publisher = run_in_thread(guests(3), {}, render_workers=1, publisher=BrokenPublisher(dry_run=True),
+                              publish_interval=0.05)
+    assert publisher.published == 0 and sent == []
@@ -0,0 +1,100 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from preflight import ConnectionPool, check_url, preflight_guests
+
+PNG = b'\x89PNG' + b'\0' * 96
+
+class CardHandler(BaseHTTPRequestHandler):
+    """Serves /png/<code>.png; /nohead/ paths refuse HEAD like some CDNs do"""
+
+    protocol_version = 'HTTP/1.1'
+    files = {
+        '/png/00001.png': ('image/png', PNG),
+        '/png/00002.png': ('text/html', b'<html>Not a card</html>'),
+        '/png/00003.png': ('image/png', b''),
+        '/nohead/00004.png': ('image/png', PNG),
+    }
+    connections = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _headers(self, status, content_type=None, length=0, extra=None):
+        self.connections.add(self.client_address)
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def do_HEAD(self):
+        if self.path.startswith('/nohead/'):
+            return self._headers(405)
+        if self.path not in self.files:
+            return self._headers(404)
+        content_type, data = self.files[self.path]
+        self._headers(200, content_type, len(data))
+
+    def do_GET(self):
+        if self.path not in self.files:
+            return self._headers(404)
+        content_type, data = self.files[self.path]
+        if self.headers.get('Range') == 'bytes=0-0':
+            self._headers(206, content_type, 1, {'Content-Range': f'bytes 0-0/{len(data)}'})
+            self.wfile.write(data[:1])
+        else:
+            self._headers(200, content_type, len(data))
+            self.wfile.write(data)
+
+@pytest.fixture
+def base_url():
+    CardHandler.connections = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), CardHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+def test_card_is_checked_with_head(base_url):
+    result = check_url(ConnectionPool(), f"{base_url}/png/00001.png")
+    assert result['ok'] and result['status'] == 200
+    assert result['content_type'] == 'image/png' and result['size'] == len(PNG)
+
+def test_ranged_get_when_head_is_refused(base_url):
+    result = check_url(ConnectionPool(), f"{base_url}/nohead/00004.png")
+    assert result['ok'] and result['status'] == 206
+    assert result['size'] == len(PNG)
+
+@pytest.mark.parametrize('path, error', [
+    ('/png/00002.png', 'Unexpected content type: text/html'),
+    ('/png/00003.png', 'Empty file'),
+    ('/png/99999.png', 'HTTP 404'),
+])
+def test_problems_are_reported(base_url, path, error):
+    result = check_url(ConnectionPool(), base_url + path)
+    assert not result['ok'] and result['error'] == error
+
+def test_cards_larger_than_the_limit_are_refused(base_url):
+    result = check_url(ConnectionPool(), f"{base_url}/png/00001.png", max_bytes=10)
+    assert result['error'] == f"Too large: {len(PNG)} bytes (limit 10)"
+
+def test_refused_connection_is_a_problem():
+    result = check_url(ConnectionPool(timeout=1), "http://127.0.0.1:9/png/00001.png")
+    assert not result['ok'] and result['error'].startswith('ConnectionRefusedError')
+
+def test_preflight_keeps_connections_alive_per_worker(base_url, capsys):
+    guests = [{'code': f'{i:05d}', 'name': f'Guest {i}', 'phone': '+255712412132'} for i in range(1, 4)] * 10
+    guests.append({'code': '00001', 'name': 'No phone', 'phone': None})
+    results, problems = preflight_guests(guests, lambda code: f"{base_url}/png/{code}.png", workers=2)
+    assert len(results) == 30
+    # Results come back in guest order whatever thread checked them
+    assert [r['code'] for r in results[:3]] == ['00001', '00002', '00003']
+    assert sorted({p['code'] for p in problems}) == ['00002', '00003']
+    assert len(CardHandler.connections) <= 2
+    assert "Problems: 20" in capsys.readouterr().out
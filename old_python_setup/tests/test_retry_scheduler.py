@@ -0,0 +1,121 @@
+import http.client
+import socket
+import urllib.error
+
+from retry_scheduler import (RetryScheduler, classify_error, congestion_signal, TRANSIENT, PERMANENT, UNKNOWN,
+                             THROTTLED, TIMEOUT)
+from sms_client import SmsApiError
+
+class TwilioError(Exception):
+    def __init__(self, code=None, status=None):
+        super().__init__(f"Twilio error {code}")
+        self.code = code
+        self.status = status
+
+def make_scheduler(clock, **kwargs):
+    return RetryScheduler(clock=clock, sleep=clock.sleep, jitter=0, **kwargs)
+
+def test_classify_twilio_codes():
+    assert classify_error(TwilioError(21211))[:2] == (PERMANENT, 21211)
+    assert classify_error(TwilioError(63003))[:2] == (PERMANENT, 63003)
+    assert classify_error(TwilioError(20429))[:2] == (TRANSIENT, 20429)
+    assert classify_error(TwilioError(63018))[:2] == (TRANSIENT, 63018)
+
+def test_unknown_delivery_error_is_not_transient():
+    assert classify_error(TwilioError(30008, status=400))[0] == PERMANENT
+
+def test_classify_http_status():
+    assert classify_error(TwilioError(status=429))[0] == TRANSIENT
+    assert classify_error(TwilioError(status=503))[0] == TRANSIENT
+    assert classify_error(TwilioError(status=404))[0] == PERMANENT
+    assert classify_error(urllib.error.HTTPError('http://x', 502, 'Bad Gateway', {}, None))[0] == TRANSIENT
+    assert classify_error(urllib.error.HTTPError('http://x', 400, 'Bad Request', {}, None))[0] == PERMANENT
+
+def test_connection_failures_before_sending_are_transient():
+    assert classify_error(ConnectionRefusedError())[0] == TRANSIENT
+    assert classify_error(urllib.error.URLError(socket.gaierror('no such host')))[0] == TRANSIENT
+
+def test_lost_responses_are_unknown():
+    assert classify_error(socket.timeout('timed out'))[0] == UNKNOWN
+    assert classify_error(http.client.RemoteDisconnected('closed'))[0] == UNKNOWN
+    assert classify_error(urllib.error.URLError(TimeoutError()))[0] == UNKNOWN
+
+def test_requests_style_errors():
+    class ConnectTimeout(OSError):
+        pass
+
+    class ReadTimeout(OSError):
+        pass
+
+    class ProtocolError(Exception):
+        pass
+
+    class RequestsConnectionError(OSError):
+        pass
+
+    assert classify_error(ConnectTimeout())[0] == TRANSIENT
+    assert classify_error(ReadTimeout())[0] == UNKNOWN
+    dropped = RequestsConnectionError(ProtocolError('Connection aborted.', http.client.RemoteDisconnected('closed')))
+    assert classify_error(dropped)[0] == UNKNOWN
+    refused = RequestsConnectionError(ProtocolError('Connection refused'))
+    assert classify_error(refused)[0] == TRANSIENT
+
+def test_transport_classification_wins():
+    assert classify_error(SmsApiError('ERR: busy', classification=TRANSIENT))[0] == TRANSIENT
+    assert classify_error(SmsApiError('ERR: invalid', classification=PERMANENT))[0] == PERMANENT
+
+def test_congestion_signal():
+    assert congestion_signal(TwilioError(20429)) == THROTTLED
+    assert congestion_signal(TwilioError(status=503)) == THROTTLED
+    assert congestion_signal(socket.timeout()) == TIMEOUT
+    assert congestion_signal(TwilioError(21211)) is None
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    scheduler = make_scheduler(clock, base_delay=2, max_delay=10)
+    assert [scheduler.backoff(attempt) for attempt in range(1, 6)] == [2, 4, 8, 10, 10]
+
+def test_jobs_come_out_in_due_order(clock):
+    scheduler = make_scheduler(clock)
+    scheduler.add('late', 'b', delay=5)
+    scheduler.add('early', 'a', delay=1)
+    assert scheduler.next_ready() == ('early', 'a', 1)
+    assert clock.now == 1
+    assert scheduler.next_ready() == ('late', 'b', 1)
+    assert clock.now == 5
+    assert len(scheduler) == 0
+
+def test_pop_due_does_not_wait(clock):
+    scheduler = make_scheduler(clock)
+    scheduler.add('now', 'a')
+    scheduler.add('later', 'b', delay=3)
+    assert scheduler.pop_due() == [('now', 'a', 1)]
+    assert scheduler.next_due_in() == 3
+    clock.now = 3
+    assert scheduler.pop_due() == [('later', 'b', 1)]
+    assert scheduler.next_due_in() is None
+
+def test_only_transient_failures_are_retried(clock):
+    scheduler = make_scheduler(clock)
+    scheduler.add('guest', 'job')
+    scheduler.next_ready()
+    assert scheduler.retry('guest', 'job', PERMANENT) is None
+    assert scheduler.retry('guest', 'job', UNKNOWN) is None
+    assert scheduler.retry('guest', 'job', TRANSIENT) == 2
+    assert scheduler.retries == 1
+
+def test_retries_stop_at_max_attempts(clock):
+    scheduler = make_scheduler(clock, max_attempts=3)
+    scheduler.add('guest', 'job')
+    attempts = []
+    while scheduler:
+        _, _, attempt = scheduler.next_ready()
+        attempts.append(attempt)
+        scheduler.retry('guest', 'job', TRANSIENT)
+    assert attempts == [1, 2, 3]
+    assert scheduler.retries == 2
+
+def test_retry_after_extends_the_backoff(clock):
+    scheduler = make_scheduler(clock)
+    scheduler.add('guest', 'job')
+    scheduler.next_ready()
+    assert scheduler.retry('guest', 'job', TRANSIENT, retry_after=30) == 30
@@ -0,0 +1,83 @@
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from send_log import SendLogWriter, list_segments
+
+def lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'send_log.jsonl')
+
+def test_entries_are_batched(log_path):
+    writer = SendLogWriter(log_path, flush_lines=3, flush_interval=60)
+    writer.write({'n': 1})
+    writer.write({'n': 2})
+    assert lines(log_path) == []
+    writer.write({'n': 3})
+    assert [entry['n'] for entry in lines(log_path)] == [1, 2, 3]
+    writer.close()
+
+def test_idle_batch_is_flushed_by_the_timer(log_path):
+    writer = SendLogWriter(log_path, flush_lines=50, flush_interval=0.1)
+    writer.write({'n': 1})
+    assert lines(log_path) == []
+    # Nothing else is logged: the batch must not wait for the next entry or exit
+    deadline = time.monotonic() + 2
+    while not lines(log_path) and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert lines(log_path) == [{'n': 1}]
+    writer.write({'n': 2})
+    writer.close()
+    assert writer._timer is None
+    assert [entry['n'] for entry in lines(log_path)] == [1, 2]
+
+def test_close_flushes_and_cancels_the_timer(log_path):
+    writer = SendLogWriter(log_path, flush_lines=50, flush_interval=60)
+    writer.write({'n': 1})
+    assert writer._timer is not None
+    writer.close()
+    assert writer._timer is None
+    assert lines(log_path) == [{'n': 1}]
+
+def test_size_rotation_compresses_the_closed_segment(log_path):
+    writer = SendLogWriter(log_path, flush_lines=1, max_bytes=30)
+    for n in range(3):
+        writer.write({'n': n, 'pad': 'x' * 10})
+    writer.close()
+    segments = list_segments(log_path)
+    assert segments and all(segment.endswith('.jsonl.gz') for segment in segments)
+    rotated = []
+    for segment in segments:
+        with gzip.open(segment, 'rt', encoding='utf-8') as f:
+            rotated += [json.loads(line)['n'] for line in f]
+    assert rotated + [entry['n'] for entry in lines(log_path)] == [0, 1, 2]
+
+def test_writers_follow_a_rotation_by_another_process(log_path):
+    first = SendLogWriter(log_path, flush_lines=1, compress=False)
+    second = SendLogWriter(log_path, flush_lines=1, compress=False)
+    first.write({'n': 1})
+    second.write({'n': 2})
+    segment = first.rotate_now()
+    second.write({'n': 3})
+    first.write({'n': 4})
+    first.close()
+    second.close()
+    with open(segment, 'r', encoding='utf-8') as f:
+        assert [json.loads(line)['n'] for line in f] == [1, 2]
+    # The second writer's descriptor pointed at the renamed file; its next line goes to the new one
+    assert [entry['n'] for entry in lines(log_path)] == [3, 4]
+
+def test_invalid_policies_are_rejected(log_path):
+    with pytest.raises(ValueError, match='fsync'):
+        SendLogWriter(log_path, fsync='sometimes')
+    with pytest.raises(ValueError, match='rotate'):
+        SendLogWriter(log_path, rotate='weekly')
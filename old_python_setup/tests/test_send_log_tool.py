@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+from send_log import SendLogWriter, list_segments
+from send_log_tool import SendLogIndex
+
+def entry(code, status, timestamp, phone='+255712412132'):
+    return {'timestamp': timestamp, 'code': code, 'phone': phone, 'status': status}
+
+def append(path, *entries, partial=''):
+    with open(path, 'a', encoding='utf-8') as f:
+        for e in entries:
+            f.write(json.dumps(e) + '\n')
+        f.write(partial)
+
+@pytest.fixture
+def index(tmp_path):
+    index = SendLogIndex(str(tmp_path / 'send_log.jsonl'), str(tmp_path / 'index.sqlite'))
+    yield index
+    index.close()
+
+def test_update_only_reads_new_complete_lines(index):
+    append(index.log_path, entry('00001', 'pending', '2025-11-12T10:00:00'),
+           entry('00001', 'sent', '2025-11-12T10:00:01'))
+    assert index.update() == 2
+    assert index.update() == 0
+
+    # A line still being written is left for the next update
+    line = json.dumps(entry('00002', 'error', '2025-11-12T10:00:02'))
+    append(index.log_path, partial=line[:10])
+    assert index.update() == 0
+    append(index.log_path, partial=line[10:] + '\n')
+    assert index.update() == 1
+
+    summary = index.summary()
+    assert summary['events_by_status'] == {'pending': 1, 'sent': 1, 'error': 1}
+    assert summary['codes_by_latest_status'] == {'sent': 1, 'error': 1}
+    assert [e['status'] for e in index.latest(code='00001')] == ['sent']
+    assert [e['status'] for e in index.history(code='00001')] == ['pending', 'sent']
+
+def test_index_survives_reopening(tmp_path):
+    log_path, index_path = str(tmp_path / 'send_log.jsonl'), str(tmp_path / 'index.sqlite')
+    append(log_path, entry('00001', 'sent', '2025-11-12T10:00:00'))
+    index = SendLogIndex(log_path, index_path)
+    assert index.update() == 1
+    index.close()
+    append(log_path, entry('00002', 'sent', '2025-11-12T10:00:01'))
+    index = SendLogIndex(log_path, index_path)
+    assert index.update() == 1
+    assert index.summary()['events_total'] == 2
+    index.close()
+
+def test_compaction_archives_the_log_and_keeps_the_latest_state(index, tmp_path):
+    writer = SendLogWriter(index.log_path, flush_lines=1, flush_interval=60)
+    writer.write(entry('00001', 'pending', '2025-11-12T10:00:00'))
+    assert index.update() == 1
+    # Written after the last update, only readable from the rotated segment
+    writer.write(entry('00001', 'sent', '2025-11-12T10:00:01'))
+    writer.write(entry('00002', 'error', '2025-11-12T10:00:02'))
+    segment = writer.rotate_now()
+    writer.close()
+    assert segment.endswith('.gz') and list_segments(index.log_path) == [segment]
+
+    assert index.update() == 2
+    assert index.summary()['events_total'] == 3
+    # Full history of the archived segment is gone from the active log
+    assert index.history(code='00001') == []
+
+    snapshot = str(tmp_path / 'snapshot.jsonl')
+    assert index.write_snapshot(snapshot) == 2
+    with open(snapshot, encoding='utf-8') as f:
+        latest = [json.loads(line) for line in f]
+    assert [(e['code'], e['status']) for e in latest] == [('00001', 'sent'), ('00002', 'error')]
@@ -0,0 +1,51 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from campaign import SendWindow
+from simulator import ChannelModel, simulate_campaign
+from transports import WHATSAPP, SMS
+
+def guests(count):
+    return [{'code': f'{i:05d}', 'name': f'Guest {i}', 'phone': '+255712412132'} for i in range(1, count + 1)]
+
+def model(**kwargs):
+    return ChannelModel(**dict({'latency_ms': 100.0, 'latency_jitter_ms': 0.0}, **kwargs))
+
+def test_rate_limit_sets_the_pace():
+    results = simulate_campaign(guests(100), {WHATSAPP: model(rate=10, concurrency=4)})
+    assert results['delivered'] == 100 and results['failed'] == 0
+    assert results['seconds'] == pytest.approx(10.0, abs=0.2)
+    assert results['channels'][WHATSAPP]['peak_in_flight'] <= 4
+
+def test_requests_in_flight_set_the_pace_without_a_rate():
+    results = simulate_campaign(guests(10), {WHATSAPP: model(concurrency=2, latency_ms=500.0)})
+    assert results['seconds'] == pytest.approx(2.5)
+    assert results['channels'][WHATSAPP]['peak_in_flight'] == 2
+
+def test_rejected_whatsapp_falls_back_to_sms_and_is_priced_per_segment():
+    models = {WHATSAPP: model(permanent_error_rate=1.0, price=0.05), SMS: model(price=0.02)}
+    # 161 GSM characters take two segments
+    results = simulate_campaign(guests(10), models, sms_text=lambda guest: 'x' * 161)
+    assert results['delivered'] == 10 and results['failed'] == 0
+    assert results['channels'][WHATSAPP]['delivered'] == 0
+    assert results['channels'][SMS]['segments'] == 20
+    assert results['cost'] == pytest.approx(0.4)
+
+def test_transient_errors_are_retried_until_attempts_run_out():
+    results = simulate_campaign(guests(5), {WHATSAPP: model(error_rate=1.0)}, max_attempts=3)
+    assert results['delivered'] == 0 and results['failed'] == 5
+    assert results['retries'] == 10
+    assert results['channels'][WHATSAPP]['requests'] == 15
+
+def test_same_seed_gives_the_same_projection():
+    models = {WHATSAPP: model(error_rate=0.2, latency_jitter_ms=50.0), SMS: model()}
+    assert simulate_campaign(guests(50), models, seed=7) == simulate_campaign(guests(50), models, seed=7)
+
+def test_sending_waits_for_the_window_to_open():
+    window = SendWindow.parse('09:00-21:00')
+    start = datetime(2025, 12, 1, 8, 0, tzinfo=ZoneInfo('Africa/Dar_es_Salaam'))
+    results = simulate_campaign(guests(3), {WHATSAPP: model()}, window=window, start=start)
+    assert results['delivered'] == 3
+    assert results['ends_at'] == '2025-12-01T09:00+03:00'
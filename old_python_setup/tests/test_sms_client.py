@@ -0,0 +1,197 @@
+import http.client
+import http.server
+import threading
+
+import pytest
+
+from preflight import ConnectionPool
+from retry_scheduler import PERMANENT, TRANSIENT
+from sms_client import SmsClient, SmsApiError, RecipientBatcher, CreditGuard, format_phone_for_sms
+
+class FakeClient(SmsClient):
+    """SmsClient answering from a function instead of the API"""
+
+    def __init__(self, answer, **kwargs):
+        super().__init__('user', 'secret', **kwargs)
+        self.answer = answer
+        self.calls = []
+        self._calls_lock = threading.Lock()
+
+    def request(self, action, **params):
+        with self._calls_lock:
+            self.calls.append((action, params))
+        return self.answer(action, params)
+
+def invalid_number(bad):
+    def answer(action, params):
+        if bad in params['dest'].split(','):
+            raise SmsApiError('ERR: invalid number', classification=PERMANENT)
+        return f"id-{params['dest']}"
+    return answer
+
+def send_together(batcher, msisdns, message='Karibu'):
+    results = {}
+
+    def send(msisdn):
+        try:
+            results[msisdn] = batcher.send(msisdn, message)
+        except SmsApiError as e:
+            results[msisdn] = e
+
+    threads = [threading.Thread(target=send, args=(msisdn,)) for msisdn in msisdns]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def test_format_phone_for_sms():
+    assert format_phone_for_sms('0712 412 132') == '255712412132'
+    assert format_phone_for_sms('+255712412132') == '255712412132'
+    assert format_phone_for_sms('712412132') == '255712412132'
+    assert format_phone_for_sms('') is None
+
+def test_batcher_joins_concurrent_sends_of_the_same_text():
+    client = FakeClient(invalid_number(None), max_recipients=3)
+    batcher = RecipientBatcher(client, linger=5)
+    results = send_together(batcher, ['2551', '2552', '2553'])
+    assert batcher.requests == 1
+    assert len(set(results.values())) == 1
+    assert sorted(client.calls[0][1]['dest'].split(',')) == ['2551', '2552', '2553']
+
+def test_permanent_batch_failure_only_fails_the_bad_number():
+    client = FakeClient(invalid_number('2552'), max_recipients=3)
+    batcher = RecipientBatcher(client, linger=5)
+    results = send_together(batcher, ['2551', '2552', '2553'])
+    assert results['2551'] == 'id-2551'
+    assert results['2553'] == 'id-2553'
+    assert isinstance(results['2552'], SmsApiError)
+    # One batch request, then one per recipient
+    assert len(client.calls) == 4
+
+def test_transient_batch_failure_is_not_split():
+    def busy(action, params):
+        raise SmsApiError('ERR: server busy', classification=TRANSIENT)
+
+    client = FakeClient(busy, max_recipients=2)
+    results = send_together(RecipientBatcher(client, linger=5), ['2551', '2552'])
+    assert all(isinstance(result, SmsApiError) for result in results.values())
+    assert len(client.calls) == 1
+
+def test_send_many_reports_each_recipient():
+    client = FakeClient(invalid_number('255700000002'), max_recipients=10)
+    results = client.send_many([('0700000001', 'Hi'), ('0700000002', 'Hi'), ('0700000003', 'Bye')])
+    assert results['255700000001'] == ('id-255700000001', None)
+    assert results['255700000003'] == ('id-255700000003', None)
+    assert isinstance(results['255700000002'][1], SmsApiError)
+
+class DroppingHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    paths = []
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        if self.path.startswith('/drop'):
+            # Read the request, then hang up without answering
+            self.close_connection = True
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'OK')
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), DroppingHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    DroppingHandler.paths = []
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_connection_is_kept_alive(server):
+    pool = ConnectionPool(timeout=2)
+    assert pool.request('GET', server + '/a').body == b'OK'
+    conn = pool._local.connections[('http', server[len('http://'):])]
+    pool.request('GET', server + '/b')
+    assert pool._local.connections[('http', server[len('http://'):])] is conn
+
+def test_lost_response_is_retried_only_when_idempotent(server):
+    pool = ConnectionPool(timeout=2)
+    pool.request('GET', server + '/warm-up')
+    with pytest.raises(http.client.RemoteDisconnected):
+        pool.request('GET', server + '/drop', idempotent=True)
+    assert DroppingHandler.paths.count('/drop') == 2
+
+    pool.request('GET', server + '/warm-up')
+    with pytest.raises(http.client.RemoteDisconnected):
+        pool.request('GET', server + '/drop-sms', idempotent=False)
+    assert DroppingHandler.paths.count('/drop-sms') == 1
+
+def sender_ids(approved, rejected=()):
+    def answer(action, params):
+        if action == 'senderids':
+            return ', '.join(approved)
+        if params['senderid'] in rejected:
+            raise SmsApiError('ERR: invalid sender id', classification=PERMANENT)
+        return f"id-{params['senderid']}"
+    return answer
+
+def test_configured_sender_id_is_kept_when_approved(tmp_path):
+    client = FakeClient(sender_ids(['Wedding', 'SMS.co.tz']), sender_id='Wedding')
+    cache = str(tmp_path / 'cache.json')
+    assert client.resolve_sender_id(cache_file=cache) == ('Wedding', 'resolved')
+    assert client.resolve_sender_id(cache_file=cache) == ('Wedding', 'cached')
+
+def test_first_approved_candidate_replaces_an_unapproved_sender_id(tmp_path):
+    client = FakeClient(sender_ids(['wedding']), sender_id='Mine')
+    assert client.resolve_sender_id(cache_file=str(tmp_path / 'cache.json')) == ('wedding', 'resolved')
+
+def test_rejected_sender_id_is_replaced_and_the_message_resent(tmp_path):
+    client = FakeClient(sender_ids(['Wedding', 'SMS.co.tz'], rejected={'Wedding'}), sender_id='Wedding')
+    client.resolve_sender_id(cache_file=str(tmp_path / 'cache.json'))
+    assert client.send('255712412132', 'Karibu') == 'id-SMS.co.tz'
+    assert client.sender_id == 'SMS.co.tz'
+    assert client.send('255712412132', 'Karibu') == 'id-SMS.co.tz'
+
+def test_sms_stops_when_no_other_sender_id_is_approved(tmp_path):
+    client = FakeClient(sender_ids(['Wedding'], rejected={'Wedding'}), sender_id='Wedding')
+    client.resolve_sender_id(cache_file=str(tmp_path / 'cache.json'))
+    with pytest.raises(SmsApiError):
+        client.send('255712412132', 'Karibu')
+    requests = len(client.calls)
+    with pytest.raises(SmsApiError) as error:
+        client.send('255712412132', 'Karibu')
+    assert error.value.classification == PERMANENT
+    assert len(client.calls) == requests
+
+def test_credit_guard_keeps_the_reserve():
+    guard = CreditGuard(10, reserve=3)
+    assert guard.take(4)
+    assert guard.take(3)
+    assert not guard.take(1)
+    assert (guard.balance, guard.used, guard.refused) == (3, 7, 1)
+    guard.refund(3)
+    assert guard.take(2)
+    assert (guard.balance, guard.used) == (4, 6)
+
+def test_credit_guard_is_thread_safe():
+    guard = CreditGuard(1000)
+    taken = []
+
+    def take():
+        for _ in range(200):
+            taken.append(guard.take(1))
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert taken.count(True) == 1000
+    assert guard.balance == 0
+    assert guard.refused == 600
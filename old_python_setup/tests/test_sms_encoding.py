@@ -0,0 +1,47 @@
+from sms_encoding import analyze, sms_segments, transliterate, GSM7, UCS2
+
+def test_gsm7_segments():
+    assert sms_segments('a' * 160) == 1
+    assert sms_segments('a' * 161) == 2
+    assert sms_segments('a' * 306) == 2
+    assert sms_segments('a' * 307) == 3
+
+def test_extended_characters_count_twice():
+    info = analyze('€' * 80)
+    assert (info['encoding'], info['length'], info['segments']) == (GSM7, 160, 1)
+    assert sms_segments('€' * 81) == 2
+
+def test_one_other_character_switches_to_ucs2():
+    info = analyze('a' * 69 + '’')
+    assert (info['encoding'], info['segments'], info['offending']) == (UCS2, 1, ['’'])
+    assert sms_segments('a' * 70 + '’') == 2
+    assert sms_segments('a' * 134) == 1
+    assert sms_segments('a' * 133 + '’') == 2
+    assert sms_segments('a' * 134 + '’') == 3
+
+def test_emoji_take_two_ucs2_units():
+    assert analyze('🎉')['length'] == 2
+    assert sms_segments('a' * 68 + '🎉') == 1
+    assert sms_segments('a' * 69 + '🎉') == 2
+
+def test_empty_message_is_one_segment():
+    assert sms_segments('') == 1
+
+def test_transliterate_to_gsm7():
+    assert transliterate('“Karibu” – it’s Zoë’s…') == '"Karibu" - it\'s Zoe\'s...'
+    # Accents GSM-7 has are kept, the others dropped
+    assert transliterate('café') == 'café'
+    assert transliterate('Ñandú') == 'Ñandu'
+    assert analyze(transliterate('Sherehe ya “harusi” – 12·05'))['encoding'] == GSM7
+
+def test_transliterate_drops_spaces_left_by_removed_characters():
+    assert transliterate('Karibu 🎉 harusini') == 'Karibu harusini'
+    assert transliterate('🎉 Karibu') == 'Karibu'
+    assert transliterate('Karibu 🎉') == 'Karibu'
+    assert transliterate('Karibu 👰🤵 🎉 harusini') == 'Karibu harusini'
+    assert transliterate('Karibu🎉harusini') == 'Karibuharusini'
+
+def test_transliterate_keeps_the_author_spacing():
+    assert transliterate('Namba:  {code}') == 'Namba:  {code}'
+    assert transliterate('  Karibu  ') == '  Karibu  '
+    assert transliterate('Line one\n\nLine two 🎉\nEnd') == 'Line one\n\nLine two\nEnd'
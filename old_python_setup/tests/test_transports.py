@@ -0,0 +1,149 @@
+import time
+
+import pytest
+
+from retry_scheduler import RetryScheduler, PERMANENT, TRANSIENT
+from transports import RateLimiter, ChannelRouter, SenderPool, Transport, SendError, WHATSAPP, SMS
+
+@pytest.fixture
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(time, 'monotonic', clock)
+    monkeypatch.setattr(time, 'sleep', clock.sleep)
+    return clock
+
+def test_rate_limiter_spaces_calls(fake_time):
+    limiter = RateLimiter(rate=10)
+    for _ in range(5):
+        limiter.acquire()
+    assert fake_time.now == pytest.approx(0.4)
+
+def test_rate_limiter_allows_a_burst_after_idling(fake_time):
+    limiter = RateLimiter(rate=10, burst=3)
+    fake_time.now = 10.0
+    for _ in range(3):
+        limiter.acquire()
+    assert fake_time.now == pytest.approx(10.0)
+    limiter.acquire()
+    assert fake_time.now == pytest.approx(10.1)
+
+def test_unlimited_rate_never_waits(fake_time):
+    limiter = RateLimiter(rate=0)
+    for _ in range(100):
+        limiter.acquire()
+    assert fake_time.now == 0.0
+
+class FakeTransport(Transport):
+    """Fails each guest with the errors queued for its code, then succeeds"""
+
+    def __init__(self, channel, errors=None, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+        self.errors = {code: list(queued) for code, queued in (errors or {}).items()}
+        self.sent = []
+
+    def deliver(self, guest):
+        queued = self.errors.get(guest['code'])
+        if queued:
+            raise queued.pop(0)
+        self.sent.append(guest['code'])
+        return f"{self.channel}-{guest['code']}"
+
+def guest(code):
+    return {'code': code, 'name': f'Guest {code}', 'type': 'Single', 'phone': '+255712412132'}
+
+def router(transports, **kwargs):
+    scheduler = RetryScheduler(max_attempts=3, base_delay=0.01, max_delay=0.01, jitter=0)
+    events = []
+    router = ChannelRouter(transports, scheduler=scheduler,
+                           on_event=lambda event, g, channel, *args: events.append((event, g['code'], channel)),
+                           **kwargs)
+    return router, events
+
+def test_permanent_whatsapp_failure_falls_back_to_sms():
+    whatsapp = FakeTransport(WHATSAPP, {'00002': [SendError("not on WhatsApp", classification=PERMANENT)]})
+    sms = FakeTransport(SMS)
+    send, events = router({WHATSAPP: whatsapp, SMS: sms})
+    delivered, failures = send.run([guest('00001'), guest('00002')])
+    assert failures == []
+    assert sorted((d['guest']['code'], d['channel']) for d in delivered) == [('00001', WHATSAPP), ('00002', SMS)]
+    assert ('fallback', '00002', WHATSAPP) in events
+    assert sms.sent == ['00002']
+
+def test_transient_failures_are_retried_on_the_same_channel():
+    whatsapp = FakeTransport(WHATSAPP, {'00001': [SendError("busy", classification=TRANSIENT)] * 2})
+    sms = FakeTransport(SMS)
+    send, events = router({WHATSAPP: whatsapp, SMS: sms})
+    delivered, failures = send.run([guest('00001')])
+    assert [(d['channel'], d['attempt']) for d in delivered] == [(WHATSAPP, 3)]
+    assert events.count(('retry', '00001', WHATSAPP)) == 2
+    assert sms.sent == []
+
+def test_failure_on_the_fallback_channel_is_reported():
+    permanent = SendError("rejected", classification=PERMANENT)
+    whatsapp = FakeTransport(WHATSAPP, {'00001': [permanent]})
+    sms = FakeTransport(SMS, {'00001': [permanent]})
+    send, _ = router({WHATSAPP: whatsapp, SMS: sms})
+    delivered, failures = send.run([guest('00001')])
+    assert delivered == []
+    assert [(f['code'], f['channel'], f['classification']) for f in failures] == [('00001', SMS, PERMANENT)]
+
+def test_sms_only_router_has_no_fallback():
+    sms = FakeTransport(SMS, {'00001': [SendError("rejected", classification=PERMANENT)]})
+    send, _ = router({SMS: sms}, primary=SMS)
+    assert send.fallback is None
+    _, failures = send.run([guest('00001')])
+    assert [f['channel'] for f in failures] == [SMS]
+
+NUMBERS = ['whatsapp:+14155238886', 'whatsapp:+14155238887', 'whatsapp:+14155238888']
+
+def codes(count=300):
+    return [f'{i:05d}' for i in range(1, count + 1)]
+
+def test_guests_stay_on_their_home_number():
+    pool = SenderPool(','.join(NUMBERS))
+    homes = {code: pool.home_number(code) for code in codes()}
+    # The same guest always gets the same number, also in a new run
+    assert homes == {code: SenderPool(NUMBERS).home_number(code) for code in codes()}
+    assert all(pool.number_for(code) == home for code, home in homes.items())
+    # Every number gets a fair share
+    assert all(60 < list(homes.values()).count(number) < 140 for number in NUMBERS)
+
+def test_adding_a_number_only_moves_guests_onto_it():
+    before = SenderPool(NUMBERS)
+    after = SenderPool(NUMBERS + ['whatsapp:+14155238889'])
+    moved = [code for code in codes() if before.home_number(code) != after.home_number(code)]
+    assert all(after.home_number(code) == 'whatsapp:+14155238889' for code in moved)
+    assert len(moved) < 150
+
+def test_resting_number_hands_its_guests_to_the_next_healthy_one(clock):
+    pool = SenderPool(NUMBERS, failure_threshold=2, cooldown=60, clock=clock)
+    resting = NUMBERS[0]
+    assert not pool.record_failure(resting)
+    assert pool.record_failure(resting)
+    assert pool.stats()[resting] == {'sent': 0, 'failed': 2, 'healthy': False, 'times_rested': 1}
+
+    homed = [code for code in codes() if pool.home_number(code) == resting]
+    assert all(pool.number_for(code) in NUMBERS[1:] for code in homed)
+    # Guests of the healthy numbers are not moved
+    others = [code for code in codes() if pool.home_number(code) != resting]
+    assert all(pool.number_for(code) == pool.home_number(code) for code in others)
+
+    clock.now += 61
+    assert all(pool.number_for(code) == resting for code in homed)
+
+def test_success_resets_the_failure_count(clock):
+    pool = SenderPool(NUMBERS[:1], failure_threshold=2, clock=clock)
+    pool.record_failure(NUMBERS[0])
+    pool.record_success(NUMBERS[0])
+    assert not pool.record_failure(NUMBERS[0])
+    assert pool.stats()[NUMBERS[0]]['healthy']
+
+def test_all_numbers_resting_keeps_the_home_number(clock):
+    pool = SenderPool(NUMBERS[:2], failure_threshold=1, clock=clock)
+    for number in NUMBERS[:2]:
+        pool.record_failure(number)
+    assert all(pool.number_for(code) == pool.home_number(code) for code in codes(20))
+
+def test_sender_pool_needs_a_number():
+    with pytest.raises(ValueError):
+        SenderPool(' , ')
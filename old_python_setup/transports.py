@@ -0,0 +1,533 @@
+#!/usr/bin/env python3
+"""
+Delivery channels for invitation messages
+WhatsApp goes through Twilio, SMS through the sms.co.tz HTTP API. The router
+sends every guest on the primary channel, with each channel running on its own
+worker pool and rate limit, and falls back to SMS when WhatsApp fails for good.
+WhatsApp can send from a pool of numbers, each guest pinned to one of them.
+"""
+import bisect
+import hashlib
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from retry_scheduler import (RetryScheduler, classify_error, congestion_signal, TRANSIENT, PERMANENT,
+                             DEFAULT_MAX_ATTEMPTS)
+from send_single_card_twilio import deliver_card, TWILIO_TEMPLATE_ID
+from sms_client import SmsClient, SmsApiError, RecipientBatcher, format_phone_for_sms, SMS_API_URL, SMS_DEFAULT_SENDER_ID
+from sms_encoding import sms_segments, transliterate
+
+# Try to import Twilio
+try:
+    from twilio.rest import Client
+    TWILIO_AVAILABLE = True
+except ImportError:
+    TWILIO_AVAILABLE = False
+
+WHATSAPP = "whatsapp"
+SMS = "sms"
+
+# Sender number pool: points per number on the hash ring (more spread guests more evenly)
+VIRTUAL_NODES = 100
+
+# Consecutive failures before a number is rested, and for how long
+FAILURE_THRESHOLD = 5
+COOLDOWN = 60.0
+
+# How often the router looks for guests arriving on a feed while it waits
+FEED_POLL_INTERVAL = 0.05
+
+# Adaptive concurrency: ceiling on requests in flight per channel, how far the
+# smoothed round-trip time may rise above the best seen before backing off, and
+# the multiplicative decreases for throttling/timeouts and for rising latency
+DEFAULT_MAX_CONCURRENCY = 32
+LATENCY_TOLERANCE = 2.0
+THROTTLE_DECREASE = 0.5
+LATENCY_DECREASE = 0.9
+
+# Round-trip times kept per channel for the latency percentiles (the most recent ones)
+LATENCY_SAMPLES = 10000
+
+class SendError(Exception):
+    """A delivery failure reported by a provider"""
+
+    def __init__(self, message, code=None, status=None, classification=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.classification = classification
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls evenly at `rate` per second (0 = unlimited)"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the caller may make one request"""
+        if not self.rate:
+            return
+        interval = 1.0 / self.rate
+        with self._lock:
+            now = time.monotonic()
+            # Unused capacity can build up to `burst` requests
+            slot = max(self._next, now - interval * (self.burst - 1))
+            self._next = slot + interval
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+
+class ConcurrencyController:
+    """AIMD window of requests in flight, driven by round-trip time, throttling and timeouts
+
+    Every successful round trip with the window in full use grows it by about one
+    request per window's worth of responses; a 429/503 or timeout halves it, and a
+    smoothed round-trip time well above the best seen shrinks it a little. At most
+    one decrease happens per round trip, so a burst of 429s counts once.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=DEFAULT_MAX_CONCURRENCY,
+                 latency_tolerance=LATENCY_TOLERANCE, clock=time.monotonic):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.window = float(min(self.maximum, max(self.minimum, initial)))
+        self.latency_tolerance = latency_tolerance
+        self.clock = clock
+
+        self.in_flight = 0
+        self.min_rtt = None
+        self.srtt = None
+        self.peak = self.window
+        self.increases = 0
+        self.decreases = 0
+        self._last_decrease = None
+        self._lock = threading.Lock()
+
+    def limit(self):
+        """Requests allowed in flight right now"""
+        return max(self.minimum, int(self.window))
+
+    def started(self):
+        """Count a request going out; returns whether it fills the window"""
+        with self._lock:
+            self.in_flight += 1
+            return self.in_flight >= self.limit()
+
+    def finished(self, rtt, error=None, saturated=True):
+        """Feed back one finished request (rtt in seconds, the exception if it failed)"""
+        with self._lock:
+            self.in_flight -= 1
+            if error is not None:
+                if congestion_signal(error):
+                    self._decrease(THROTTLE_DECREASE)
+                return
+
+            # Let the baseline drift up slowly so a lasting slowdown is not punished forever
+            self.min_rtt = rtt if self.min_rtt is None else min(rtt, self.min_rtt * 1.001)
+            self.srtt = rtt if self.srtt is None else 0.8 * self.srtt + 0.2 * rtt
+
+            if not saturated:
+                # Latency only says something about our load when the window is in full use
+                return
+            if self.srtt > self.min_rtt * self.latency_tolerance:
+                self._decrease(LATENCY_DECREASE)
+            elif self.window < self.maximum:
+                self.window = min(self.maximum, self.window + 1.0 / self.window)
+                self.peak = max(self.peak, self.window)
+                self.increases += 1
+
+    def _decrease(self, factor):
+        now = self.clock()
+        if self._last_decrease is not None and now - self._last_decrease < (self.srtt or 0.0):
+            return
+        self._last_decrease = now
+        self.window = max(float(self.minimum), self.window * factor)
+        self.decreases += 1
+
+    def stats(self):
+        return {
+            'window': self.limit(),
+            'peak': int(self.peak),
+            'increases': self.increases,
+            'decreases': self.decreases,
+            'srtt_ms': round((self.srtt or 0.0) * 1000, 1),
+        }
+
+def parse_numbers(value):
+    """Split a comma separated list of from-numbers (TWILIO_FROM_NUMBER may hold several)"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    numbers = []
+    for number in value:
+        number = number.strip()
+        if number and number not in numbers:
+            numbers.append(number)
+    return numbers
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class SenderHealth:
+    """Delivery counters and circuit state for one number"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.resting_until = 0.0
+        self.times_rested = 0
+
+class SenderPool:
+    """Sticky number assignment with per-number rate limits and health tracking"""
+
+    def __init__(self, numbers, rate=0, burst=1, failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN,
+                 virtual_nodes=VIRTUAL_NODES, clock=time.monotonic):
+        self.numbers = parse_numbers(numbers)
+        if not self.numbers:
+            raise ValueError("Sender pool needs at least one from-number")
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.limiters = {number: RateLimiter(rate, burst) for number in self.numbers}
+        self.health = {number: SenderHealth() for number in self.numbers}
+        self._lock = threading.Lock()
+
+        ring = sorted((_hash(f"{number}#{i}"), number) for number in self.numbers for i in range(virtual_nodes))
+        self._ring_keys = [point for point, _ in ring]
+        self._ring_numbers = [number for _, number in ring]
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def home_number(self, code):
+        """The number a guest is pinned to, ignoring health"""
+        index = bisect.bisect(self._ring_keys, _hash(str(code))) % len(self._ring_keys)
+        return self._ring_numbers[index]
+
+    def number_for(self, code):
+        """The number to use for a guest now: its home number, or the next healthy one on the ring"""
+        index = bisect.bisect(self._ring_keys, _hash(str(code))) % len(self._ring_keys)
+        now = self.clock()
+        seen = set()
+        with self._lock:
+            for offset in range(len(self._ring_numbers)):
+                number = self._ring_numbers[(index + offset) % len(self._ring_numbers)]
+                if number in seen:
+                    continue
+                if self.health[number].resting_until <= now:
+                    return number
+                seen.add(number)
+                if len(seen) == len(self.numbers):
+                    break
+        # Every number is resting: stay with the home number rather than stop
+        return self._ring_numbers[index]
+
+    def acquire(self, number):
+        """Block until this number may send one more message"""
+        self.limiters[number].acquire()
+
+    def record_success(self, number):
+        with self._lock:
+            health = self.health[number]
+            health.sent += 1
+            health.consecutive_failures = 0
+
+    def record_failure(self, number):
+        """Count a failure; returns True if this failure put the number to rest"""
+        with self._lock:
+            health = self.health[number]
+            health.failed += 1
+            health.consecutive_failures += 1
+            if health.consecutive_failures >= self.failure_threshold and health.resting_until <= self.clock():
+                health.resting_until = self.clock() + self.cooldown
+                health.consecutive_failures = 0
+                health.times_rested += 1
+                return True
+            return False
+
+    def stats(self):
+        """Per-number counters: {number: {'sent', 'failed', 'healthy', 'times_rested'}}"""
+        now = self.clock()
+        with self._lock:
+            return {
+                number: {
+                    'sent': health.sent,
+                    'failed': health.failed,
+                    'healthy': health.resting_until <= now,
+                    'times_rested': health.times_rested,
+                }
+                for number, health in self.health.items()
+            }
+
+class Transport:
+    """A delivery channel: send(guest) returns a provider message id or raises
+
+    Details of how the guest was sent (e.g. the WhatsApp sender number) are
+    added to the optional `context` dict, whether the send succeeds or not.
+    """
+
+    channel = None
+
+    def __init__(self, rate=0, concurrency=1, dry_run=False, adaptive=False, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.limiter = RateLimiter(rate, burst=self.concurrency)
+        self.dry_run = dry_run
+        # With adaptive concurrency, `concurrency` is only the starting window
+        self.controller = ConcurrencyController(self.concurrency, maximum=max_concurrency) if adaptive else None
+        # Round-trip times of the latest provider requests, in seconds, and how many were made
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self._requests_lock = threading.Lock()
+
+    @property
+    def max_workers(self):
+        """Threads the channel needs: enough for the largest window"""
+        return self.controller.maximum if self.controller else self.concurrency
+
+    def in_flight_limit(self):
+        return self.controller.limit() if self.controller else self.concurrency
+
+    def send(self, guest, context=None):
+        self.limiter.acquire()
+        if self.dry_run:
+            return None
+        saturated = self.controller.started() if self.controller else False
+        start = time.monotonic()
+        error = None
+        try:
+            return self.deliver(guest)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            rtt = time.monotonic() - start
+            self.latencies.append(rtt)
+            with self._requests_lock:
+                self.requests += 1
+            if self.controller:
+                self.controller.finished(rtt, error, saturated)
+
+    def deliver(self, guest):
+        raise NotImplementedError
+
+class WhatsAppTransport(Transport):
+    """Card template message through the Twilio WhatsApp API, from a pool of sender numbers"""
+
+    channel = WHATSAPP
+
+    def __init__(self, account_sid, auth_token, from_number, api_base_url=None, template_id=TWILIO_TEMPLATE_ID,
+                 rate=0, concurrency=1, **kwargs):
+        # The rate applies to each sender number, so the pool replaces the channel-wide limiter
+        super().__init__(rate=0, concurrency=concurrency, **kwargs)
+        self.pool = SenderPool(from_number, rate=rate, burst=self.concurrency)
+        self.template_id = template_id
+        self.client = None
+        if not self.dry_run:
+            if not TWILIO_AVAILABLE:
+                raise RuntimeError("Twilio library not installed. Install with: pip install twilio")
+            # The Twilio client is thread-safe and reuses its HTTP session
+            self.client = Client(account_sid, auth_token)
+            if api_base_url:
+                # e.g. the local mock_provider_server.py
+                self.client.api.base_url = api_base_url
+
+    def send(self, guest, context=None):
+        number = self.pool.number_for(guest['code'])
+        if context is not None:
+            context['from_number'] = number
+        self.pool.acquire(number)
+        guest_number = dict(guest, from_number=number)
+        try:
+            result = super().send(guest_number)
+        except Exception as e:
+            # Only throttling and provider errors say something about the number, not the guest
+            if classify_error(e)[0] == TRANSIENT:
+                self.pool.record_failure(number)
+            raise
+        self.pool.record_success(number)
+        return result
+
+    def deliver(self, guest):
+        return deliver_card(self.client, guest['from_number'], guest['phone'], guest['code'], self.template_id).sid
+
+class SmsTransport(Transport):
+    """Plain text message through the sms.co.tz API"""
+
+    channel = SMS
+
+    def __init__(self, username, password, messages, sender_id=SMS_DEFAULT_SENDER_ID,
+                 api_url=SMS_API_URL, timeout=10, batch_size=1, transliterate=False, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = messages
+        # Rewrite characters outside GSM-7 so no message falls back to UCS-2 (70 characters per SMS)
+        self.transliterate = transliterate
+        self.client = SmsClient(username, password, sender_id=sender_id, api_url=api_url, timeout=timeout,
+                                max_recipients=batch_size)
+        # Guests with the same text share a request when the account allows several recipients
+        self.batcher = RecipientBatcher(self.client) if batch_size > 1 else None
+        # Set once the balance is known (sms_client.CreditGuard); stops sending before credit runs out
+        self.credit_guard = None
+
+    def message_for(self, guest):
+        """SMS text for a guest (`messages` is a dict by code or a template with {code})"""
+        if isinstance(self.messages, dict):
+            message = self.messages[guest['code']]
+        else:
+            message = self.messages.format(code=guest['code'])
+        return transliterate(message) if self.transliterate else message
+
+    def deliver(self, guest):
+        msisdn = format_phone_for_sms(guest['phone'])
+        message = self.message_for(guest)
+        credits = sms_segments(message)
+        guard = self.credit_guard
+        if guard and not guard.take(credits):
+            raise SmsApiError(f"SMS credit would drop below the reserve of {guard.reserve:g}",
+                              classification=PERMANENT)
+        try:
+            if self.batcher:
+                return self.batcher.send(msisdn, message)
+            return self.client.send(msisdn, message)
+        except Exception:
+            if guard:
+                guard.refund(credits)
+            raise
+
+class ChannelRouter:
+    """Send guests on a primary channel and fall back to another on permanent failure"""
+
+    def __init__(self, transports, primary=WHATSAPP, fallback=SMS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 on_event=None, scheduler=None):
+        self.transports = transports
+        self.primary = primary
+        self.fallback = fallback if fallback in transports and fallback != primary else None
+        # An empty scheduler is falsy (it has a length), so test for None
+        self.scheduler = scheduler if scheduler is not None else RetryScheduler(max_attempts=max_attempts)
+        # on_event(event, guest, channel, attempt, result) is called from the calling thread only;
+        # returning False from a "pending" event drops that send
+        self.on_event = on_event or (lambda *args: None)
+
+    def run(self, guests, delays=None, gate=None, feed=None):
+        """Send to every guest; returns (delivered, failures) lists
+
+        `delays` maps a code to seconds to hold that guest back (campaign pacing).
+        `gate()` returns 0 while sending is allowed, otherwise seconds until it is
+        again; nothing new goes out meanwhile, requests in flight still finish.
+        `feed` is a queue of more guests arriving while sending (e.g. as their
+        cards are published), closed by putting None.
+        """
+        scheduler = self.scheduler
+        delays = delays or {}
+        for guest in guests:
+            scheduler.add((guest['code'], self.primary), (guest, self.primary), delays.get(guest['code'], 0))
+        feeding = feed is not None
+
+        results = queue.Queue()
+        waiting = {channel: deque() for channel in self.transports}
+        in_flight = {channel: 0 for channel in self.transports}
+        executors = {
+            channel: ThreadPoolExecutor(max_workers=transport.max_workers, thread_name_prefix=f"send-{channel}")
+            for channel, transport in self.transports.items()
+        }
+        delivered = []
+        failures = []
+
+        def attempt_send(key, guest, channel, attempt):
+            context = {}
+            try:
+                results.put((key, guest, channel, attempt, self.transports[channel].send(guest, context), None, context))
+            except Exception as e:
+                results.put((key, guest, channel, attempt, None, e, context))
+
+        try:
+            while feeding or scheduler or any(waiting.values()) or any(in_flight.values()):
+                while feeding:
+                    try:
+                        guest = feed.get_nowait()
+                    except queue.Empty:
+                        break
+                    if guest is None:
+                        feeding = False
+                    else:
+                        scheduler.add((guest['code'], self.primary), (guest, self.primary))
+
+                for key, (guest, channel), attempt in scheduler.pop_due():
+                    waiting[channel].append((key, guest, attempt))
+
+                paused = gate() if gate else 0
+                if not paused:
+                    # Keep each channel's pool busy without queueing the whole campaign on it
+                    for channel, jobs in waiting.items():
+                        while jobs and in_flight[channel] < self.transports[channel].in_flight_limit():
+                            key, guest, attempt = jobs.popleft()
+                            # A pending handler can veto the send (e.g. the guest's lease was lost)
+                            if self.on_event("pending", guest, channel, attempt, None) is False:
+                                continue
+                            in_flight[channel] += 1
+                            executors[channel].submit(attempt_send, key, guest, channel, attempt)
+
+                if not any(in_flight.values()):
+                    if paused:
+                        # Re-check the gate at least every minute
+                        time.sleep(min(paused, 60))
+                    elif feeding:
+                        time.sleep(min(scheduler.next_due_in() or FEED_POLL_INTERVAL, FEED_POLL_INTERVAL))
+                    else:
+                        time.sleep(scheduler.next_due_in() or 0)
+                    continue
+
+                timeout = scheduler.next_due_in()
+                if feeding:
+                    timeout = min(timeout if timeout is not None else FEED_POLL_INTERVAL, FEED_POLL_INTERVAL)
+                try:
+                    item = results.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                self._handle_result(item, in_flight, delivered, failures)
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+        return delivered, failures
+
+    def _handle_result(self, item, in_flight, delivered, failures):
+        key, guest, channel, attempt, message_id, error, context = item
+        in_flight[channel] -= 1
+
+        if error is None:
+            delivered.append(dict(context, guest=guest, channel=channel, attempt=attempt, message_id=message_id))
+            self.on_event("sent", guest, channel, attempt, dict(context, message_id=message_id))
+            return
+
+        classification, error_code, reason = classify_error(error)
+        result = dict(
+            context,
+            error=str(error),
+            classification=classification,
+            error_code=error_code,
+            reason=reason,
+        )
+
+        delay = self.scheduler.retry(key, (guest, channel), classification)
+        if delay is not None:
+            result['delay'] = delay
+            self.on_event("retry", guest, channel, attempt, result)
+            return
+
+        if classification == PERMANENT and channel == self.primary and self.fallback:
+            self.on_event("fallback", guest, channel, attempt, dict(result, fallback=self.fallback))
+            self.scheduler.add((guest['code'], self.fallback), (guest, self.fallback))
+            return
+
+        failure = dict(result, name=guest['name'], phone=guest['phone'], code=guest['code'],
+                       channel=channel, attempts=attempt)
+        failures.append(failure)
+        self.on_event("error", guest, channel, attempt, result)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+File watcher for the --watch modes of the card generators
+Polls the modification time and size of a handful of files a few times a
+second (no extra dependency, same behaviour on every platform) and reports a
+change once the files have stopped changing, so a spreadsheet that is still
+being saved is not read half-written.
+"""
+import os
+import time
+
+WATCH_INTERVAL = 0.2  # seconds between checks
+
+def file_state(path):
+    """(mtime, size) of a file, or None when it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def watch_files(paths, on_change, interval=WATCH_INTERVAL):
+    """Call on_change(changed_paths) each time some of `paths` change, until Ctrl+C"""
+    paths = list(dict.fromkeys(paths))
+    states = {path: file_state(path) for path in paths}
+    print(f"\n👀 Watching {', '.join(paths)} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(interval)
+            current = {path: file_state(path) for path in paths}
+            if current == states:
+                continue
+            # Wait until the writes have settled
+            while True:
+                time.sleep(interval)
+                settled = {path: file_state(path) for path in paths}
+                if settled == current:
+                    break
+                current = settled
+            changed = [path for path in paths if current[path] != states[path]]
+            states = current
+            if changed:
+                on_change(changed)
+    except KeyboardInterrupt:
+        print("\nStopped watching")